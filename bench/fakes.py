@@ -0,0 +1,285 @@
+# This file contains the offline stand-ins used by the benchmark: a scripted
+# chat model with configurable latency and output length, a stub Google
+# Calendar API, a Google client manager that serves it, and a fake Telegram
+# Bot API transport. Nothing here talks to the network.
+
+import json
+import time
+import uuid
+import random
+import asyncio
+import datetime
+import itertools
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from telegram.request import BaseRequest, RequestData
+
+# Words that make the scripted model call the calendar tool.
+CALENDAR_WORDS = ("calendar", "schedule", "meeting", "review", "event", "busy", "free")
+
+
+def _estimate_tokens(messages: List[BaseMessage]) -> int:
+    return sum(len(str(m.content)) // 4 + 4 for m in messages)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    A chat model that answers without an API. When the latest human message
+    mentions the calendar it first calls `list_calendar_events`; after a tool
+    result, or for anything else, it answers with `output_tokens` words.
+
+    `first_token_latency` and `token_latency` (seconds) shape both streamed and
+    non-streamed responses like a real model's time to first token and
+    decoding speed.
+    """
+
+    first_token_latency: float = 0.3
+    token_latency: float = 0.01
+    output_tokens: int = 60
+    model: str = "scripted-fake"
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens_total: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _plan(self, messages: List[BaseMessage]) -> Tuple[str, List[dict]]:
+        last = messages[-1] if messages else None
+        if isinstance(last, ToolMessage):
+            return self._answer("Here is what I found on your calendar"), []
+        human = next((m for m in reversed(messages) if isinstance(m, HumanMessage)), None)
+        text = str(human.content).lower() if human else ""
+        if any(word in text for word in CALENDAR_WORDS):
+            tool_call = {"name": "list_calendar_events", "args": {"max_results": 10}, "id": f"call_{uuid.uuid4().hex}"}
+            return "Let me check your calendar.", [tool_call]
+        return self._answer("Sure"), []
+
+    def _answer(self, prefix: str) -> str:
+        return prefix + " " + " ".join(itertools.islice(itertools.cycle(["lorem", "ipsum", "dolor", "sit"]), self.output_tokens))
+
+    def _usage(self, messages: List[BaseMessage], text: str) -> Dict[str, int]:
+        input_tokens, output_tokens = _estimate_tokens(messages), len(text.split())
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.output_tokens_total += output_tokens
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text, tool_calls = self._plan(messages)
+        time.sleep(self.first_token_latency + self.token_latency * len(text.split()))
+        message = AIMessage(content=text, tool_calls=tool_calls, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text, tool_calls = self._plan(messages)
+        await asyncio.sleep(self.first_token_latency + self.token_latency * len(text.split()))
+        message = AIMessage(content=text, tool_calls=tool_calls, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        text, tool_calls = self._plan(messages)
+        await asyncio.sleep(self.first_token_latency)
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            chunk = AIMessageChunk(content=word if i == 0 else " " + word)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+        final = AIMessageChunk(
+            content="",
+            tool_call_chunks=[
+                {"name": tc["name"], "args": json.dumps(tc["args"]), "id": tc["id"], "index": i}
+                for i, tc in enumerate(tool_calls)
+            ],
+            usage_metadata=self._usage(messages, text),
+        )
+        yield ChatGenerationChunk(message=final)
+
+
+# --- Google ---
+
+
+class _Request:
+    def __init__(self, response: Any, latency: float):
+        self._response = response
+        self._latency = latency
+
+    def execute(self, http=None, num_retries=0):
+        time.sleep(self._latency)
+        return self._response
+
+
+class _Batch:
+    def __init__(self, callback, latency: float):
+        self._callback = callback
+        self._latency = latency
+        self._requests: List[Tuple[str, _Request]] = []
+
+    def add(self, request: _Request, request_id: Optional[str] = None, callback=None):
+        self._requests.append((request_id or str(len(self._requests)), request))
+
+    def execute(self, http=None):
+        # One round trip for the whole batch.
+        time.sleep(self._latency)
+        for request_id, request in self._requests:
+            self._callback(request_id, request._response, None)
+
+
+class StubCalendarService:
+    """
+    Mimics the parts of the Calendar v3 client the service uses. It serves
+    `events_per_day` generated events per day on each calendar; incremental
+    (syncToken) syncs report no changes. Every request costs `latency` seconds.
+    """
+
+    def __init__(self, calendars: int = 2, days: int = 60, events_per_day: int = 4, latency: float = 0.05, seed: int = 7):
+        self.latency = latency
+        self.requests = Counter()
+        rng = random.Random(seed)
+        today = datetime.datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+        self._calendar_ids = ["primary"] + [f"calendar{i}@group.calendar.google.com" for i in range(1, calendars)]
+        self._events: Dict[str, List[dict]] = {}
+        for calendar_id in self._calendar_ids:
+            events = []
+            for day in range(-days // 2, days // 2):
+                for n in range(events_per_day):
+                    start = today + datetime.timedelta(days=day, hours=rng.randint(8, 18), minutes=rng.choice([0, 30]))
+                    end = start + datetime.timedelta(minutes=rng.choice([30, 60, 90]))
+                    events.append(
+                        {
+                            "id": f"{calendar_id}-{day}-{n}",
+                            "status": "confirmed",
+                            "summary": f"Event {day}/{n}",
+                            "start": {"dateTime": start.isoformat()},
+                            "end": {"dateTime": end.isoformat()},
+                        }
+                    )
+            self._events[calendar_id] = sorted(events, key=lambda e: e["start"]["dateTime"])
+
+    # Resource accessors, as in googleapiclient.
+
+    def events(self):
+        return self
+
+    def calendarList(self):
+        return _CalendarList(self)
+
+    def new_batch_http_request(self, callback=None):
+        self.requests["batch"] += 1
+        return _Batch(callback, self.latency)
+
+    def list(self, calendarId: str, syncToken: Optional[str] = None, timeMin: Optional[str] = None,
+             timeMax: Optional[str] = None, maxResults: int = 250, **kwargs):
+        self.requests["events.list"] += 1
+        if syncToken:
+            return _Request({"items": [], "nextSyncToken": syncToken}, self.latency)
+        items = self._events.get(calendarId, [])
+        if timeMin:
+            items = [e for e in items if e["end"]["dateTime"] > timeMin]
+        if timeMax:
+            items = [e for e in items if e["start"]["dateTime"] < timeMax]
+        return _Request({"items": items[:maxResults] if timeMin else items, "nextSyncToken": "sync-1"}, self.latency)
+
+
+class _CalendarList:
+    def __init__(self, service: StubCalendarService):
+        self._service = service
+
+    def list(self, **kwargs):
+        self._service.requests["calendarList.list"] += 1
+        items = [
+            {"id": calendar_id, "summary": calendar_id, "primary": calendar_id == "primary"}
+            for calendar_id in self._service._calendar_ids
+        ]
+        return _Request({"items": items}, self._service.latency)
+
+
+class FakeGoogleClients:
+    """Stands in for GoogleClientManager, serving the stub Calendar API (and no Gmail)."""
+
+    def __init__(self, calendar: StubCalendarService):
+        self.calendar = calendar
+
+    def available(self) -> bool:
+        return True
+
+    def credentials(self):
+        return None
+
+    def service(self, name: str, version: str):
+        return self.calendar if name == "calendar" else None
+
+    def execute_blocking(self, request) -> dict:
+        return request.execute()
+
+    async def execute(self, request) -> dict:
+        return await self.run(self.execute_blocking, request)
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def run_refresh_loop(self, interval: int = 60) -> None:
+        while True:
+            await asyncio.sleep(3600)
+
+    def shutdown(self) -> None:
+        pass
+
+
+# --- Telegram ---
+
+
+class FakeBotTransport(BaseRequest):
+    """
+    Answers Bot API calls locally, after `latency` seconds, and counts them.
+    Sent and edited messages are recorded per chat.
+    """
+
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        self.calls = Counter()
+        self.sent: Dict[int, List[str]] = {}
+        self._message_ids = itertools.count(1_000_000)
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None, **kwargs):
+        await asyncio.sleep(self.latency)
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        params = request_data.parameters if request_data else {}
+
+        if api_method == "getMe":
+            result: Any = {"id": 1, "is_bot": True, "first_name": "Astra", "username": "astra_bench_bot"}
+        elif api_method in ("sendMessage", "editMessageText"):
+            chat_id = int(params["chat_id"])
+            if api_method == "sendMessage":
+                self.sent.setdefault(chat_id, []).append(params["text"])
+            result = {
+                "message_id": params.get("message_id") or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params["text"],
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
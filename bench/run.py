@@ -0,0 +1,293 @@
+# This file contains the offline end-to-end benchmark. It starts the real
+# FastAPI app (lifespan included) with the fakes from bench/fakes.py, posts
+# Telegram updates to /telegram, and reports webhook throughput, turn latency
+# percentiles, per-node timings, LLM usage and checkpoint database growth.
+#
+#   python -m bench.run --turns 100 --llm-latency 0.3
+
+import os
+import sys
+import json
+import time
+import asyncio
+import shutil
+import logging
+import sqlite3
+import argparse
+import tempfile
+import statistics
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+GRAPH_NODES = ("history", "router", "agent", "tools")
+PROMPTS = [
+    "what's on today?",
+    "thanks, that helps",
+    "anything tomorrow afternoon?",
+    "who is in the design review meeting?",
+    "can you draft a short note for the team?",
+    "what's my schedule this week?",
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Times graph nodes and LLM calls from LangChain callbacks."""
+
+    run_inline = True
+
+    def __init__(self):
+        self._started: Dict[Any, tuple] = {}
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        name = kwargs.get("name")
+        if name in GRAPH_NODES and (metadata or {}).get("langgraph_node") == name:
+            self._started[run_id] = (name, time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = ("llm", time.perf_counter())
+
+    def _finish(self, run_id):
+        started = self._started.pop(run_id, None)
+        if started:
+            self.durations[started[0]].append(time.perf_counter() - started[1])
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id)
+
+
+def configure_environment(workdir: str, args) -> None:
+    """Points every store at a scratch directory and disables live-only features."""
+    os.environ.update(
+        {
+            "TELEGRAM_BOT_TOKEN": "123456:BENCHMARK",
+            "WEBHOOK_URL": "http://bench.invalid",
+            "GOOGLE_API_KEY": "bench",
+            "YOUR_CHAT_ID": str(args.chat_id),
+            "CHECKPOINT_DB_PATH": os.path.join(workdir, "database.db"),
+            "CALENDAR_DB_PATH": os.path.join(workdir, "calendar.db"),
+            "GMAIL_DB_PATH": os.path.join(workdir, "gmail.db"),
+            "UPDATE_QUEUE_PATH": os.path.join(workdir, "updates.db"),
+            "BRIEFING_DB_PATH": os.path.join(workdir, "briefing.db"),
+            "BRIEFING_TIME": "",
+            "GEMINI_CONTEXT_CACHE": "false",
+            "TELEGRAM_STREAMING": "true" if args.streaming else "false",
+            "RESPONSE_CACHE_ENABLED": "false" if args.no_response_cache else "true",
+            # The summarizer would need the real model.
+            "HISTORY_TOKEN_BUDGET": str(args.history_budget),
+        }
+    )
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+        },
+    }
+
+
+def db_size(path: str) -> Dict[str, int]:
+    """Returns the size of the database file after moving committed WAL pages into it."""
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {"bytes": os.path.getsize(path), "pages": pages, "free_pages": free_pages}
+
+
+async def run(args) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="astra-bench-")
+    configure_environment(workdir, args)
+
+    import httpx
+    from bench.fakes import FakeBotTransport, FakeGoogleClients, ScriptedChatModel, StubCalendarService
+    import src.google_clients
+    import src.telegram as app_module
+    from src.models import FAST, STRONG, ModelTiers
+    from src.tenants import PerTenant
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    calendar = StubCalendarService(latency=args.google_latency)
+    src.google_clients._managers = PerTenant(lambda chat_id: FakeGoogleClients(calendar))
+    # One fake per model tier; the fast one answers sooner if --fast-llm-latency is given.
+    fakes = {
+        name: ScriptedChatModel(
+            model=name,
+            first_token_latency=args.fast_llm_latency if tier == FAST and args.fast_llm_latency is not None else args.llm_latency,
+            token_latency=args.token_latency,
+            output_tokens=args.output_tokens,
+        )
+        for tier, name in app_module.model_tiers.names.items()
+    }
+    app_module.model_tiers = ModelTiers(fakes.__getitem__, app_module.tools, app_module.model_tiers.names)
+    transport = FakeBotTransport(latency=args.telegram_latency)
+    app_module.get_ptb_app().bot._request = (transport, transport)
+
+    timer = NodeTimer()
+    turn_latencies: List[float] = []
+    posted_at: Dict[int, float] = {}
+    turn_done = asyncio.Event()
+    run_turn = app_module.scheduler._run_turn
+
+    async def timed_turn(thread_id, updates):
+        try:
+            await run_turn(thread_id, updates)
+        finally:
+            now = time.perf_counter()
+            for u in updates:
+                if u.message.message_id in posted_at:
+                    turn_latencies.append(now - posted_at.pop(u.message.message_id))
+            turn_done.set()
+
+    app_module.scheduler._run_turn = timed_turn
+    checkpoint_path = os.environ["CHECKPOINT_DB_PATH"]
+    growth = []
+    update_ids = iter(range(1, 10_000_000))
+
+    async with app_module.app.router.lifespan_context(app_module.app):
+        executor = app_module.agent_executor
+        astream = executor.astream
+
+        def timed_astream(input, config=None, **kwargs):
+            config = config or {}
+            return astream(input, config={**config, "callbacks": list(config.get("callbacks") or []) + [timer]}, **kwargs)
+
+        executor.astream = timed_astream
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app_module.app), base_url="http://bench")
+
+        # 1. Webhook throughput: a burst of concurrent posts, acknowledged without waiting for turns.
+        burst = [make_update(next(update_ids), args.chat_id, PROMPTS[i % len(PROMPTS)]) for i in range(args.burst)]
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(client.post("/telegram", json=u) for u in burst))
+        webhook_seconds = time.perf_counter() - started
+        statuses = {int(r.status_code) for r in responses}
+        while True:
+            queue = (await client.get("/healthcheck")).json()["queue"]
+            if not (queue["queued_updates"] or queue["pending_messages"] or queue["in_flight_turns"]):
+                break
+            await asyncio.sleep(0.05)
+        timer.durations.clear()
+        for model in fakes.values():
+            model.calls = model.input_tokens = model.output_tokens_total = 0
+        calendar.requests.clear()
+        transport.calls.clear()
+
+        # 2. Sequential turns: latency percentiles and database growth by conversation length.
+        for turn in range(1, args.turns + 1):
+            update = make_update(next(update_ids), args.chat_id, PROMPTS[turn % len(PROMPTS)])
+            turn_done.clear()
+            posted_at[update["message"]["message_id"]] = time.perf_counter()
+            await client.post("/telegram", json=update)
+            await asyncio.wait_for(turn_done.wait(), timeout=60)
+            if turn in args.checkpoints or turn == args.turns:
+                growth.append({"turns": turn, **db_size(checkpoint_path)})
+
+        health = (await client.get("/healthcheck")).json()
+        await client.aclose()
+
+    if args.keep_workdir:
+        print(f"Databases kept in {workdir}", file=sys.stderr)
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "webhook": {
+            "updates": args.burst,
+            "seconds": round(webhook_seconds, 4),
+            "updates_per_second": round(args.burst / webhook_seconds, 1) if webhook_seconds else None,
+            "statuses": sorted(statuses),
+        },
+        "turns": {
+            "count": len(turn_latencies),
+            "p50_ms": round(percentile(turn_latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(turn_latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(turn_latencies, 99) * 1000, 1),
+        },
+        "nodes": {
+            name: {
+                "calls": len(values),
+                "mean_ms": round(statistics.mean(values) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+            }
+            for name, values in timer.durations.items()
+            if values
+        },
+        "llm": {
+            name: {"calls": model.calls, "input_tokens": model.input_tokens, "output_tokens": model.output_tokens_total}
+            for name, model in fakes.items()
+        },
+        "google_requests": dict(calendar.requests),
+        "telegram_calls": dict(transport.calls),
+        "checkpoint_db": growth,
+        "health": health,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    webhook, turns = report["webhook"], report["turns"]
+    print(f"Webhook: {webhook['updates']} updates in {webhook['seconds']}s "
+          f"({webhook['updates_per_second']}/s, HTTP {webhook['statuses']})")
+    print(f"Turns: {turns['count']}  p50 {turns['p50_ms']} ms  p95 {turns['p95_ms']} ms  p99 {turns['p99_ms']} ms")
+    print("Per node:")
+    for name, stats in report["nodes"].items():
+        print(f"  {name:<8} {stats['calls']:>5} calls  mean {stats['mean_ms']:>9} ms  p95 {stats['p95_ms']:>9} ms")
+    for name, llm in report["llm"].items():
+        print(f"LLM {name}: {llm['calls']} calls, {llm['input_tokens']} input / {llm['output_tokens']} output tokens")
+    print(f"Google requests: {report['google_requests']}")
+    print(f"Telegram calls: {report['telegram_calls']}")
+    print("Checkpoint DB: " + ", ".join(f"{g['turns']} turns {g['bytes'] / 1024:.0f} KiB" for g in report["checkpoint_db"]))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the Telegram agent.")
+    parser.add_argument("--turns", type=int, default=60, help="sequential turns to run")
+    parser.add_argument("--burst", type=int, default=200, help="updates posted concurrently for the webhook test")
+    parser.add_argument("--checkpoints", type=int, nargs="*", default=[10, 30], help="turn counts to sample DB size at")
+    parser.add_argument("--chat-id", type=int, default=4242)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="time to first token (s)")
+    parser.add_argument("--fast-llm-latency", type=float, default=None, help="time to first token of the fast model (s)")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="time per output token (s)")
+    parser.add_argument("--output-tokens", type=int, default=60)
+    parser.add_argument("--google-latency", type=float, default=0.05)
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--history-budget", type=int, default=1_000_000)
+    parser.add_argument("--no-streaming", dest="streaming", action="store_false")
+    parser.add_argument("--no-response-cache", action="store_true")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--keep-workdir", action="store_true", help="keep the scratch databases")
+    parser.add_argument("--verbose", action="store_true", help="show the service's INFO logs")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# This file contains the cold start benchmark. Each run starts a fresh Python
+# process that imports the app and runs its lifespan against the fakes from
+# bench/fakes.py, and reports how long the import and the startup took. With
+# --import-budget it fails (exit status 1) when the median import is slower,
+# so a heavy import creeping back into module scope shows up in CI.
+#
+#   python -m bench.startup --runs 5 --import-budget 2.5
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+
+async def measure_child() -> dict:
+    """Times importing src.telegram and running its lifespan up to the point it serves requests."""
+    from bench.run import configure_environment
+
+    workdir = tempfile.mkdtemp(prefix="astra-startup-")
+    configure_environment(
+        workdir, argparse.Namespace(chat_id=4242, streaming=True, no_response_cache=False, history_budget=1_000_000)
+    )
+
+    started = time.perf_counter()
+    import src.telegram as app_module
+    imported = time.perf_counter()
+
+    from bench.fakes import FakeBotTransport, FakeGoogleClients, ScriptedChatModel, StubCalendarService
+    import src.google_clients
+    from src.models import ModelTiers
+    from src.tenants import PerTenant
+
+    src.google_clients._managers = PerTenant(lambda chat_id: FakeGoogleClients(StubCalendarService(latency=0)))
+    app_module.model_tiers = ModelTiers(lambda name: ScriptedChatModel(model=name), app_module.tools)
+    transport = FakeBotTransport(latency=0)
+    app_module.get_ptb_app().bot._request = (transport, transport)
+
+    lifespan_started = time.perf_counter()
+    async with app_module.app.router.lifespan_context(app_module.app):
+        ready = time.perf_counter()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "import_seconds": imported - started,
+        "lifespan_seconds": ready - lifespan_started,
+        "heavy_modules_loaded": [m for m in ("langchain_google_genai", "googleapiclient.discovery") if m in sys.modules],
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Cold start benchmark of the Telegram agent.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to start")
+    parser.add_argument("--import-budget", type=float, default=None, help="fail if the median import takes longer (s)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        import logging
+
+        logging.disable(logging.WARNING)
+        print(json.dumps(asyncio.run(measure_child())))
+        return
+
+    samples = []
+    for _ in range(args.runs):
+        result = subprocess.run(
+            [sys.executable, "-m", "bench.startup", "--child"],
+            capture_output=True, text=True, check=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        )
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "runs": len(samples),
+        "import_median_s": round(statistics.median(s["import_seconds"] for s in samples), 3),
+        "import_max_s": round(max(s["import_seconds"] for s in samples), 3),
+        "lifespan_median_s": round(statistics.median(s["lifespan_seconds"] for s in samples), 3),
+        "heavy_modules_loaded": samples[-1]["heavy_modules_loaded"],
+    }
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"Import: median {report['import_median_s']}s, max {report['import_max_s']}s over {report['runs']} runs")
+        print(f"Lifespan to ready: median {report['lifespan_median_s']}s")
+        print(f"Heavy modules loaded at startup: {report['heavy_modules_loaded'] or 'none'}")
+
+    if args.import_budget is not None and report["import_median_s"] > args.import_budget:
+        print(f"Import budget exceeded: {report['import_median_s']}s > {args.import_budget}s", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
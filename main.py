@@ -1,19 +1,84 @@
 import os
+import sys
+import time
+import signal
+import multiprocessing
 from dotenv import load_dotenv
 import uvicorn
 
+
+def run_worker(config: uvicorn.Config, sockets: list) -> None:
+    config.configure_logging()
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+def serve_workers(config: uvicorn.Config, count: int) -> None:
+    """Runs `count` worker processes on one listening socket and restarts any that exit.
+
+    Each worker gets its index in WORKER_ID and runs the conversations the
+    hash ring assigns to it (see src/sharding.py).
+    """
+    sockets = [config.bind_socket()]
+    spawn = multiprocessing.get_context("spawn")
+
+    def start(worker_id: int):
+        # Spawned processes inherit the environment as it is when they start.
+        os.environ["WORKER_ID"] = str(worker_id)
+        process = spawn.Process(target=run_worker, args=(config, sockets), name=f"worker-{worker_id}")
+        process.start()
+        return process
+
+    # Stop the workers on `docker stop` as on Ctrl+C.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    workers = [start(i) for i in range(count)]
+    try:
+        while True:
+            time.sleep(1)
+            for i, process in enumerate(workers):
+                if not process.is_alive():
+                    # Its conversations wait in the update queue until it is back.
+                    print(f"Worker {i} exited with code {process.exitcode}, restarting it...")
+                    workers[i] = start(i)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join()
+
+
 def main():
     # Load environment variables from .env.local file for local development
     # In production, this will be handled differently (e.g., by Docker's --env-file flag)
     load_dotenv(dotenv_path=".env.local")
 
-    print("Starting Secretary Agent (Local Development)...")
-
     PORT = int(os.getenv("PORT", "8000"))
     HOST = os.getenv("HOST", "0.0.0.0")
+    # "production" runs without the auto-reloader (no file watcher, no extra process)
+    APP_ENV = os.getenv("APP_ENV", "development")
 
-    uvicorn.run("src.telegram:app", host=HOST, port=PORT, reload=True)
+    if APP_ENV == "production":
+        # Worker processes; conversations are sharded between them by chat
+        WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+        print(f"Starting Secretary Agent (Production, {WEB_CONCURRENCY} worker(s))...")
+        config = uvicorn.Config(
+            "src.telegram:app",
+            host=HOST,
+            port=PORT,
+            proxy_headers=True,
+            access_log=os.getenv("ACCESS_LOG", "false").lower() == "true",
+        )
+        if WEB_CONCURRENCY > 1:
+            serve_workers(config, WEB_CONCURRENCY)
+        else:
+            uvicorn.Server(config).run()
+    else:
+        print("Starting Secretary Agent (Local Development)...")
+        # The reloader runs a single worker, which must own every conversation.
+        os.environ["WEB_CONCURRENCY"] = "1"
+        uvicorn.run("src.telegram:app", host=HOST, port=PORT, reload=True)
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -4,17 +4,27 @@ Google Calendar Authentication Setup Script
 
 This script helps you set up Google Calendar authentication for your secretary agent.
 Run this script to generate the token.json file needed for calendar access.
+
+With several users (ALLOWED_CHAT_IDS), run it once per user with their chat id:
+
+    python setup_google_auth.py <chat_id>
 """
 
 import os
 import sys
+import json
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
+from dotenv import load_dotenv
 
 # If modifying these scopes, delete the file token.json.
-SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
+SCOPES = [
+    "https://www.googleapis.com/auth/calendar.readonly",
+    "https://www.googleapis.com/auth/gmail.readonly",
+]
 CREDENTIALS_FILE = "credentials.json"
+TOKEN_FILE = "token.json"
 
 def setup_google_auth():
     """Set up Google Calendar authentication."""
@@ -25,7 +35,7 @@ def setup_google_auth():
         print("\nTo get credentials.json:")
         print("1. Go to https://console.cloud.google.com/")
         print("2. Create a new project or select existing one")
-        print("3. Enable the Google Calendar API")
+        print("3. Enable the Google Calendar API and the Gmail API")
         print("4. Go to 'Credentials' → 'Create Credentials' → 'OAuth client ID'")
         print("5. Choose 'Desktop application'")
         print("6. Download the JSON file and rename it to 'credentials.json'")
@@ -35,24 +45,28 @@ def setup_google_auth():
     print("✅ Found credentials.json")
     
     # Check if token.json already exists
-    if os.path.exists("token.json"):
-        print("✅ token.json already exists")
+    if os.path.exists(TOKEN_FILE):
+        print(f"✅ {TOKEN_FILE} already exists")
         
         # Try to load and validate existing credentials
         try:
-            creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+            with open(TOKEN_FILE) as token:
+                granted = set(json.load(token).get("scopes") or [])
+            if not set(SCOPES) <= granted:
+                raise ValueError("it was created without the Gmail permission")
+            creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
             if creds and creds.valid:
                 print("✅ Existing credentials are valid!")
                 return True
             elif creds and creds.expired and creds.refresh_token:
                 print("🔄 Refreshing expired credentials...")
                 creds.refresh(Request())
-                with open("token.json", "w") as token:
+                with open(TOKEN_FILE, "w") as token:
                     token.write(creds.to_json())
                 print("✅ Credentials refreshed successfully!")
                 return True
         except Exception as e:
-            print(f"⚠️  Existing token.json is invalid: {e}")
+            print(f"⚠️  Existing {TOKEN_FILE} is invalid: {e}")
             print("🔄 Creating new token...")
     
     # Start OAuth flow
@@ -63,7 +77,7 @@ def setup_google_auth():
         print("📝 Instructions:")
         print("1. A browser window will open automatically")
         print("2. Sign in to your Google account")
-        print("3. Grant permission to access your calendar")
+        print("3. Grant permission to read your calendar and email")
         print("4. The browser will show a success message")
         print("5. Return to this terminal")
         print("="*60)
@@ -74,12 +88,12 @@ def setup_google_auth():
         creds = flow.run_local_server(port=8080, open_browser=True)
         
         # Save the credentials for future use
-        with open("token.json", "w") as token:
+        with open(TOKEN_FILE, "w") as token:
             token.write(creds.to_json())
         
         print("\n" + "="*60)
         print("🎉 SUCCESS! Google Calendar authentication complete!")
-        print("✅ token.json has been created")
+        print(f"✅ {TOKEN_FILE} has been created")
         print("✅ Your secretary agent can now access your calendar")
         print("="*60)
         return True
@@ -96,6 +110,14 @@ def setup_google_auth():
 if __name__ == "__main__":
     print("🤖 Secretary Agent - Google Calendar Setup")
     print("="*50)
+
+    if len(sys.argv) > 1:
+        # Another user's token goes where the agent looks for it (see src/tenants.py).
+        load_dotenv(dotenv_path=".env.local")
+        from src.tenants import tenant_path
+
+        TOKEN_FILE = tenant_path(TOKEN_FILE, sys.argv[1])
+        print(f"Authorizing chat {sys.argv[1]}; the token will be saved to {TOKEN_FILE}")
     
     success = setup_google_auth()
     
@@ -1,2 +1,263 @@
-# This file will contain the code for generating daily briefings,
-# including the briefing node for the LangGraph agent. 
\ No newline at end of file
+# This file contains the daily briefing pipeline. Shortly before the configured
+# briefing time it syncs the calendar and mail mirrors (warming them for the
+# day's first questions), fetches the weather, and stores the finished
+# briefing text, so delivering it at the briefing time is instant.
+
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import datetime
+import threading
+from email.utils import parseaddr
+from typing import Awaitable, Callable, Optional
+
+import requests
+
+from src.calendar import WorkingHours, calendar_tz, compute_availability, get_calendar_store
+from src.gmail import get_gmail_store
+
+logger = logging.getLogger(__name__)
+
+# Local time of the daily briefing, e.g. "07:30". Empty (the default) disables scheduled briefings.
+BRIEFING_TIME = os.getenv("BRIEFING_TIME", "")
+# How long before the briefing time it is prepared (minutes).
+BRIEFING_PRECOMPUTE_MINUTES = int(os.getenv("BRIEFING_PRECOMPUTE_MINUTES", "30"))
+# After a (re)start up to this long past the briefing time, today's briefing is
+# still delivered if it wasn't yet (minutes).
+BRIEFING_LATE_MINUTES = int(os.getenv("BRIEFING_LATE_MINUTES", "180"))
+# A stored briefing older than this is prepared again when requested (seconds).
+BRIEFING_MAX_AGE = int(os.getenv("BRIEFING_MAX_AGE", "3600"))
+BRIEFING_DB_PATH = os.getenv("BRIEFING_DB_PATH", "briefing.db")
+OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
+# City for the weather forecast, e.g. "Berlin,DE".
+BRIEFING_LOCATION = os.getenv("BRIEFING_LOCATION", "")
+OPENWEATHERMAP_URL = "https://api.openweathermap.org/data/2.5/weather"
+
+
+def _today(now: Optional[datetime.datetime] = None) -> datetime.date:
+    return (now or datetime.datetime.now(calendar_tz())).date()
+
+
+class BriefingStore:
+    """Keeps the prepared briefing text of each day."""
+
+    def __init__(self, path: str = BRIEFING_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS briefings (
+                    day TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    delivered REAL
+                )
+                """
+            )
+
+    def get(self, day: datetime.date, max_age: Optional[float] = None) -> Optional[str]:
+        """Returns the day's briefing, unless it is older than `max_age` seconds."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, created FROM briefings WHERE day = ?", (day.isoformat(),)
+            ).fetchone()
+        if row is None or (max_age is not None and time.time() - row[1] > max_age):
+            return None
+        return row[0]
+
+    def put(self, day: datetime.date, text: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO briefings (day, text, created) VALUES (?, ?, ?)",
+                (day.isoformat(), text, time.time()),
+            )
+
+    def mark_delivered(self, day: datetime.date) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE briefings SET delivered = ? WHERE day = ?", (time.time(), day.isoformat()))
+
+    def was_delivered(self, day: datetime.date) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT delivered FROM briefings WHERE day = ?", (day.isoformat(),)).fetchone()
+        return bool(row and row[0])
+
+    def prune(self, keep_days: int = 30) -> None:
+        cutoff = (_today() - datetime.timedelta(days=keep_days)).isoformat()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM briefings WHERE day < ?", (cutoff,))
+
+
+# --- Sections ---
+
+
+def calendar_section(day: datetime.date) -> Optional[str]:
+    """Lists the day's events from the (freshly synced) local calendar store."""
+    tz = calendar_tz()
+    start = datetime.datetime.combine(day, datetime.time(), tz).timestamp()
+    end = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(), tz).timestamp()
+    store = get_calendar_store()
+    if store.last_synced() is None:
+        return None
+    events = store.between(start, end)
+    if not events:
+        return "🗓 Nothing on your calendar today."
+
+    lines = [f"🗓 {len(events)} event{'s' if len(events) != 1 else ''} today:"]
+    for event in events:
+        if event["is_all_day"]:
+            lines.append(f"- All day: {event['summary']}")
+        else:
+            event_start = datetime.datetime.fromisoformat(event["start"].replace("Z", "+00:00")).astimezone(tz)
+            event_end = datetime.datetime.fromisoformat(event["end"].replace("Z", "+00:00")).astimezone(tz)
+            lines.append(f"- {event_start:%H:%M}-{event_end:%H:%M} {event['summary']}")
+
+    # Building the availability also warms the busy-interval index for the day.
+    hours = WorkingHours.from_env()
+    availability = compute_availability(store.busy_index(), start, end, hours)
+    if availability.total_seconds:
+        lines.append(f"Busy for {availability.busy_percent}% of your working hours.")
+        if availability.free:
+            slot_start, slot_end = max(availability.free, key=lambda slot: slot[1] - slot[0])
+            lines.append(
+                f"Longest free slot: {datetime.datetime.fromtimestamp(slot_start, tz):%H:%M}-"
+                f"{datetime.datetime.fromtimestamp(slot_end, tz):%H:%M}."
+            )
+    if availability.conflicts:
+        lines.append(f"⚠️ {len(availability.conflicts)} overlapping event(s).")
+    return "\n".join(lines)
+
+
+def mail_section(max_listed: int = 5) -> Optional[str]:
+    """Summarizes unread mail from the last day, from the local Gmail mirror."""
+    if get_gmail_store().last_synced() is None:
+        return None
+    since = time.time() - 86400
+    count = get_gmail_store().count_unread(since)
+    if not count:
+        return "📧 No new unread email."
+    lines = [f"📧 {count} unread email{'s' if count != 1 else ''} since yesterday:"]
+    for message in get_gmail_store().search("", max_listed, unread_only=True, since=since):
+        name, address = parseaddr(message["from"])
+        lines.append(f"- {name or address}: {message['subject']}")
+    if count > max_listed:
+        lines.append(f"- ... and {count - max_listed} more")
+    return "\n".join(lines)
+
+
+def fetch_weather(location: str = BRIEFING_LOCATION, api_key: Optional[str] = OPENWEATHERMAP_API_KEY) -> Optional[str]:
+    """Returns a one-line weather summary from OpenWeatherMap, or None if not configured."""
+    if not api_key or not location or api_key == "your_openweathermap_api_key":
+        return None
+    response = requests.get(
+        OPENWEATHERMAP_URL, params={"q": location, "appid": api_key, "units": "metric"}, timeout=10
+    )
+    response.raise_for_status()
+    data = response.json()
+    main = data["main"]
+    return (
+        f"🌤 {data['weather'][0]['description'].capitalize()} in {data.get('name', location)}, "
+        f"{main['temp']:.0f}°C (feels like {main['feels_like']:.0f}°C), "
+        f"{main['temp_min']:.0f}-{main['temp_max']:.0f}°C today."
+    )
+
+
+class BriefingService:
+    """
+    Prepares, stores and delivers the daily briefing.
+
+    `sync_calendar` and `sync_gmail` refresh the local mirrors; they run in
+    parallel with the weather request, and a failing source only drops its
+    section from the briefing.
+    """
+
+    def __init__(
+        self,
+        sync_calendar: Callable[[], Awaitable[bool]],
+        sync_gmail: Callable[[], Awaitable[bool]],
+        store: Optional[BriefingStore] = None,
+    ):
+        self._sync_calendar = sync_calendar
+        self._sync_gmail = sync_gmail
+        self.store = store or BriefingStore()
+        self._lock = asyncio.Lock()
+
+    async def prepare(self, day: Optional[datetime.date] = None) -> str:
+        """Fetches everything in parallel, then builds and stores the day's briefing."""
+        day = day or _today()
+        started = time.monotonic()
+        calendar_synced, gmail_synced, weather = await asyncio.gather(
+            self._sync_calendar(), self._sync_gmail(), asyncio.to_thread(fetch_weather), return_exceptions=True
+        )
+
+        sections = [f"☀️ Your briefing for {day:%A, %B %d}"]
+        if isinstance(weather, Exception):
+            logger.warning(f"Weather lookup for the briefing failed: {weather}")
+        elif weather:
+            sections.append(weather)
+        for synced, build, name in (
+            (calendar_synced, lambda: calendar_section(day), "calendar"),
+            (gmail_synced, mail_section, "mail"),
+        ):
+            if isinstance(synced, Exception):
+                logger.warning(f"Briefing {name} sync failed: {synced}")
+            try:
+                section = build()
+                if section:
+                    sections.append(section)
+            except Exception as e:
+                logger.warning(f"Briefing {name} section failed: {e}")
+
+        text = "\n\n".join(sections)
+        self.store.put(day, text)
+        logger.info(f"Prepared the briefing for {day} in {time.monotonic() - started:.2f}s.")
+        return text
+
+    async def get(self, day: Optional[datetime.date] = None, max_age: float = BRIEFING_MAX_AGE) -> str:
+        """Returns the day's stored briefing, preparing it first if there is no recent one."""
+        day = day or _today()
+        async with self._lock:
+            text = self.store.get(day, max_age)
+            if text is None:
+                text = await self.prepare(day)
+        return text
+
+    async def run_daily(
+        self,
+        deliver: Callable[[str], Awaitable[None]],
+        at: str = BRIEFING_TIME,
+        precompute_minutes: int = BRIEFING_PRECOMPUTE_MINUTES,
+        late_minutes: int = BRIEFING_LATE_MINUTES,
+    ) -> None:
+        """Prepares the briefing `precompute_minutes` before `at` and delivers it at `at`, every day.
+
+        Started less than `late_minutes` after `at`, it delivers today's briefing
+        right away if that wasn't done yet (e.g. the process restarted).
+        """
+        briefing_time = datetime.time.fromisoformat(at)
+        while True:
+            tz = calendar_tz()
+            now = datetime.datetime.now(tz)
+            deliver_at = datetime.datetime.combine(now.date(), briefing_time, tz)
+            if self.store.was_delivered(now.date()) or now - deliver_at > datetime.timedelta(minutes=late_minutes):
+                deliver_at = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), briefing_time, tz)
+            elif deliver_at < now:
+                deliver_at = now
+            day = deliver_at.date()
+            try:
+                prepare_at = deliver_at - datetime.timedelta(minutes=precompute_minutes)
+                await asyncio.sleep(max(0.0, prepare_at.timestamp() - time.time()))
+                async with self._lock:
+                    await self.prepare(day)
+                await asyncio.sleep(max(0.0, deliver_at.timestamp() - time.time()))
+                await deliver(await self.get(day))
+                self.store.mark_delivered(day)
+                self.store.prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Daily briefing for {day} failed: {e}", exc_info=True)
+                await asyncio.sleep(60)
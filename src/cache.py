@@ -0,0 +1,117 @@
+# This file contains the response cache. Answers to repeated calendar
+# questions ("what's on today?") are reused while the calendar data they were
+# built from is unchanged, skipping both LLM calls of the turn. Only answers
+# that don't depend on the conversation so far are cached.
+
+import os
+import re
+import time
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional, Tuple
+
+from src.calendar import calendar_tz
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+# Maximum age of a cached response (seconds).
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "900"))
+# Width of the time bucket a response is valid for (minutes). Answers such as
+# "what's next?" change as time passes even when the calendar does not.
+RESPONSE_CACHE_BUCKET_MINUTES = int(os.getenv("RESPONSE_CACHE_BUCKET_MINUTES", "60"))
+
+# Only turns whose tool calls all come from this set are cached.
+CACHEABLE_TOOLS = {"list_calendar_events", "check_availability"}
+
+
+def normalize_query(text: str) -> str:
+    """Lowercases a query and strips punctuation and extra whitespace."""
+    text = text.lower().replace("’", "'")
+    text = re.sub(r"[^\w\s']", " ", text)
+    return " ".join(text.split())
+
+
+def time_bucket(now: Optional[float] = None, minutes: int = RESPONSE_CACHE_BUCKET_MINUTES) -> str:
+    """Returns the date and time bucket, in the user's timezone, a response belongs to."""
+    local = datetime.datetime.fromtimestamp(time.time() if now is None else now).astimezone(calendar_tz())
+    return f"{local:%Y-%m-%d}/{(local.hour * 60 + local.minute) // minutes}"
+
+
+@dataclass
+class _Entry:
+    response: str
+    calendar_revision: int
+    expires_at: float
+
+
+class ResponseCache:
+    """
+    An LRU/TTL cache of final responses, keyed on the normalized query and the
+    time bucket. Each entry records the calendar revision it was built from;
+    `invalidate_calendar` (registered as a calendar store listener) drops all
+    entries as soon as a sync changes the events.
+    """
+
+    def __init__(
+        self,
+        calendar_revision: Callable[[], int],
+        max_entries: int = RESPONSE_CACHE_SIZE,
+        ttl: int = RESPONSE_CACHE_TTL,
+    ):
+        self._calendar_revision = calendar_revision
+        self._max_entries = max_entries
+        self._ttl = ttl
+        # Calendar syncs run on worker threads, so access is locked.
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, query: str) -> Tuple[str, str]:
+        return normalize_query(query), time_bucket()
+
+    def get(self, query: str) -> Optional[str]:
+        key = self._key(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (
+                entry.expires_at < time.time() or entry.calendar_revision != self._calendar_revision()
+            ):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.response
+
+    def put(self, query: str, response: str, tools_used: Iterable[str], self_contained: bool) -> bool:
+        """Caches a response if the turn only depended on cacheable tools.
+
+        The key holds only the query, so a turn whose tool arguments came from
+        the conversation (`self_contained` False, e.g. a follow-up such as
+        "what about Friday?") would be replayed in the wrong context.
+        """
+        tools_used = set(tools_used)
+        if not self_contained or not tools_used or not tools_used <= CACHEABLE_TOOLS or not response.strip():
+            return False
+        key = self._key(query)
+        with self._lock:
+            self._entries[key] = _Entry(response, self._calendar_revision(), time.time() + self._ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def invalidate_calendar(self) -> None:
+        """Drops every calendar-dependent entry (currently all of them)."""
+        with self._lock:
+            if self._entries:
+                logger.info(f"Calendar changed, dropping {len(self._entries)} cached responses.")
+            self._entries.clear()
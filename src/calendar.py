@@ -1,2 +1,636 @@
-# This file will contain the code for Google Calendar integration,
-# including the calendar node for the LangGraph agent. 
\ No newline at end of file
+# This file contains the code for Google Calendar integration: a local event
+# store that is fully synced once and then kept current with incremental
+# syncToken syncs, so the calendar tools can answer from a local index, and an
+# availability engine computing free slots and conflicts over that index.
+
+import os
+import time
+import bisect
+import sqlite3
+import asyncio
+import logging
+import datetime
+import itertools
+import threading
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from googleapiclient.errors import HttpError
+
+from src.tenants import PerTenant, tenant_path
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_DB_PATH = os.getenv("CALENDAR_DB_PATH", "calendar.db")
+# How often the background task pulls incremental changes (seconds).
+CALENDAR_SYNC_INTERVAL = int(os.getenv("CALENDAR_SYNC_INTERVAL", "300"))
+# How old the last sync may be before a tool call syncs on demand (seconds).
+CALENDAR_MAX_STALENESS = int(os.getenv("CALENDAR_MAX_STALENESS", "600"))
+# IANA timezone of the user, e.g. "Europe/Berlin", used to resolve "today",
+# all-day and offset-less dates, working hours and availability answers.
+# Empty means the server's local timezone.
+CALENDAR_TIMEZONE = os.getenv("CALENDAR_TIMEZONE", "")
+WORKING_HOURS = os.getenv("WORKING_HOURS", "09:00-17:00")
+WORKING_DAYS = os.getenv("WORKING_DAYS", "mon,tue,wed,thu,fri")
+
+
+def calendar_tz() -> Optional[datetime.tzinfo]:
+    """The user's timezone (CALENDAR_TIMEZONE), or None for the server's."""
+    return ZoneInfo(CALENDAR_TIMEZONE) if CALENDAR_TIMEZONE else None
+
+
+def calendar_now() -> datetime.datetime:
+    """The current time in the user's timezone, timezone-aware."""
+    return datetime.datetime.now().astimezone(calendar_tz())
+
+
+def _parse(value: str) -> datetime.datetime:
+    # Offset-less values (all-day dates, naive tool arguments) are in the user's timezone.
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        tz = calendar_tz()
+        parsed = parsed.replace(tzinfo=tz) if tz else parsed.astimezone()
+    return parsed
+
+
+def to_timestamp(value: str) -> float:
+    """Converts a Calendar API dateTime or all-day date into a UNIX timestamp.
+
+    All-day dates have no timezone and are interpreted as midnight in the user's timezone.
+    """
+    return _parse(value).timestamp()
+
+
+def _execute(request) -> dict:
+    return request.execute()
+
+
+class CalendarStore:
+    """
+    A local SQLite mirror of the user's calendar events, indexed by start and
+    end time. The first sync of a calendar downloads every event and stores the
+    returned syncToken; later syncs only fetch what changed since then.
+    """
+
+    def __init__(self, path: str = CALENDAR_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # Bumped whenever a sync changes the stored events.
+        self.revision = 0
+        self._listeners: List[Callable[[], None]] = []
+        self._index: Optional[IntervalIndex] = None
+        self._index_revision = -1
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        with self._lock, self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS events (
+                    calendar_id TEXT NOT NULL,
+                    event_id TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    start TEXT NOT NULL,
+                    end TEXT NOT NULL,
+                    start_ts REAL NOT NULL,
+                    end_ts REAL NOT NULL,
+                    is_all_day INTEGER NOT NULL,
+                    busy INTEGER NOT NULL DEFAULT 1,
+                    PRIMARY KEY (calendar_id, event_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_events_start_end ON events (start_ts, end_ts);
+                CREATE INDEX IF NOT EXISTS idx_events_end ON events (end_ts);
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    calendar_id TEXT PRIMARY KEY,
+                    sync_token TEXT,
+                    last_synced REAL NOT NULL
+                );
+                """
+            )
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(events)")}
+            if "busy" not in columns:
+                # Stores created before free/busy tracking: add the column and
+                # drop the sync tokens so the next sync re-reads every event.
+                self._conn.execute("ALTER TABLE events ADD COLUMN busy INTEGER NOT NULL DEFAULT 1")
+                self._conn.execute("DELETE FROM sync_state")
+
+    # --- Syncing ---
+
+    def sync(self, service, calendar_id: str = "primary", execute: Callable = _execute) -> int:
+        """Brings the local copy of a calendar up to date.
+
+        Runs a full sync the first time (or when Google expires the syncToken)
+        and an incremental sync otherwise. `execute` runs each API request and
+        lets callers supply their own connection. Returns the number of changed
+        events.
+        """
+        sync_token = self.get_sync_token(calendar_id)
+        try:
+            return self._sync(service, calendar_id, sync_token, execute)
+        except HttpError as e:
+            # 410 GONE means the sync token is no longer valid: start over.
+            if sync_token and e.resp.status == 410:
+                logger.info(f"Sync token for {calendar_id} expired, running a full sync.")
+                return self._sync(service, calendar_id, None, execute)
+            raise
+
+    def _sync(self, service, calendar_id: str, sync_token: Optional[str], execute: Callable) -> int:
+        changed: List[dict] = []
+        page_token = None
+        while True:
+            params = {"calendarId": calendar_id, "singleEvents": True, "pageToken": page_token}
+            if sync_token:
+                params["syncToken"] = sync_token
+            result = execute(service.events().list(**params))
+            changed.extend(result.get("items", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                next_sync_token = result.get("nextSyncToken")
+                break
+
+        # Apply the whole sync atomically so a failed page never advances the token.
+        with self._lock, self._conn:
+            if not sync_token:
+                self._conn.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+            for event in changed:
+                self._apply(calendar_id, event)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (calendar_id, sync_token, last_synced) VALUES (?, ?, ?)",
+                (calendar_id, next_sync_token, time.time()),
+            )
+
+        logger.info(
+            f"{'Incremental' if sync_token else 'Full'} calendar sync of {calendar_id}: {len(changed)} changed events"
+        )
+        if changed or not sync_token:
+            self._notify_changed()
+        return len(changed)
+
+    def forget_calendars(self, keep: Iterable[str]) -> None:
+        """Drops the events and sync state of calendars not in `keep`."""
+        keep = list(keep)
+        placeholders = ",".join("?" * len(keep))
+        with self._lock, self._conn:
+            removed = self._conn.execute(
+                f"DELETE FROM events WHERE calendar_id NOT IN ({placeholders})", keep
+            ).rowcount
+            self._conn.execute(f"DELETE FROM sync_state WHERE calendar_id NOT IN ({placeholders})", keep)
+        if removed:
+            self._notify_changed()
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """Registers a callback run (possibly from a worker thread) whenever events change."""
+        self._listeners.append(callback)
+
+    def _notify_changed(self) -> None:
+        self.revision += 1
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Calendar change listener failed: {e}", exc_info=True)
+
+    def _apply(self, calendar_id: str, event: dict) -> None:
+        """Upserts a single event, or deletes it if it was cancelled."""
+        if event.get("status") == "cancelled" or "start" not in event:
+            self._conn.execute(
+                "DELETE FROM events WHERE calendar_id = ? AND event_id = ?",
+                (calendar_id, event["id"]),
+            )
+            return
+
+        start_str = event["start"].get("dateTime", event["start"].get("date"))
+        end_str = event["end"].get("dateTime", event["end"].get("date"))
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO events
+                (calendar_id, event_id, summary, start, end, start_ts, end_ts, is_all_day, busy)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                calendar_id,
+                event["id"],
+                event.get("summary", "No Title"),
+                start_str,
+                end_str,
+                to_timestamp(start_str),
+                to_timestamp(end_str),
+                "T" not in start_str,
+                _is_busy(event),
+            ),
+        )
+
+    def get_sync_token(self, calendar_id: str = "primary") -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sync_token FROM sync_state WHERE calendar_id = ?", (calendar_id,)
+            ).fetchone()
+        return row["sync_token"] if row else None
+
+    def last_synced(self) -> Optional[float]:
+        """Returns the time of the oldest calendar sync, or None if never synced."""
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(last_synced) AS ts FROM sync_state").fetchone()
+        return row["ts"]
+
+    def is_stale(self, max_age: float = CALENDAR_MAX_STALENESS) -> bool:
+        last = self.last_synced()
+        return last is None or time.time() - last > max_age
+
+    # --- Queries ---
+
+    @staticmethod
+    def _row_to_event(row: sqlite3.Row) -> Dict:
+        return {
+            "summary": row["summary"],
+            "start": row["start"],
+            "end": row["end"],
+            "is_all_day": bool(row["is_all_day"]),
+        }
+
+    def upcoming(
+        self, max_results: int = 10, now: Optional[float] = None, calendar_id: Optional[str] = None
+    ) -> List[Dict]:
+        """Returns events that have not ended yet, ordered by start time.
+
+        Covers every synced calendar unless `calendar_id` is given.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM events WHERE end_ts > ? AND (? IS NULL OR calendar_id = ?) ORDER BY start_ts LIMIT ?",
+                (now, calendar_id, calendar_id, max_results),
+            ).fetchall()
+        return [self._row_to_event(r) for r in rows]
+
+    def between(self, start: float, end: float, calendar_id: Optional[str] = None) -> List[Dict]:
+        """Returns events overlapping the [start, end) window, ordered by start time."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM events WHERE start_ts < ? AND end_ts > ? AND (? IS NULL OR calendar_id = ?) "
+                "ORDER BY start_ts",
+                (end, start, calendar_id, calendar_id),
+            ).fetchall()
+        return [self._row_to_event(r) for r in rows]
+
+    def busy_index(self) -> "IntervalIndex":
+        """Returns an interval index over the busy events of all calendars.
+
+        The index is rebuilt lazily, on the first query after a sync changed
+        the events.
+        """
+        with self._lock:
+            if self._index is None or self._index_revision != self.revision:
+                revision = self.revision
+                rows = self._conn.execute(
+                    "SELECT calendar_id, summary, start_ts, end_ts FROM events WHERE busy = 1"
+                ).fetchall()
+                self._index = IntervalIndex(
+                    Interval(r["start_ts"], r["end_ts"], r["summary"], r["calendar_id"]) for r in rows
+                )
+                self._index_revision = revision
+            return self._index
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _is_busy(event: dict) -> bool:
+    """Whether an event blocks time: not marked "free" and not declined by the user."""
+    if event.get("transparency") == "transparent":
+        return False
+    for attendee in event.get("attendees", []):
+        if attendee.get("self") and attendee.get("responseStatus") == "declined":
+            return False
+    return True
+
+
+# --- Availability ---
+
+
+@dataclass(frozen=True)
+class Interval:
+    start: float
+    end: float
+    summary: str = ""
+    calendar_id: str = "primary"
+
+
+class IntervalIndex:
+    """
+    Intervals sorted by start time, with a running maximum of their end times.
+    Since the running maximum never decreases, the intervals overlapping a
+    window are found with two binary searches.
+    """
+
+    def __init__(self, intervals: Iterable[Interval]):
+        self._intervals = sorted((i for i in intervals if i.end > i.start), key=lambda i: (i.start, i.end))
+        self._starts = [i.start for i in self._intervals]
+        self._max_ends = list(itertools.accumulate((i.end for i in self._intervals), max))
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def overlapping(self, start: float, end: float) -> List[Interval]:
+        """Returns the intervals overlapping [start, end), ordered by start time."""
+        # Everything before `lo` ends at or before `start`; everything from
+        # `hi` on starts at or after `end`.
+        lo = bisect.bisect_right(self._max_ends, start)
+        hi = bisect.bisect_left(self._starts, end)
+        return [i for i in self._intervals[lo:hi] if i.end > start]
+
+    def conflicts(self, start: float, end: float) -> List[Tuple[Interval, Interval]]:
+        """Returns the pairs of intervals in [start, end) that overlap each other."""
+        pairs, active = [], []
+        for interval in self.overlapping(start, end):
+            active = [a for a in active if a.end > interval.start]
+            pairs.extend((a, interval) for a in active)
+            active.append(interval)
+        return pairs
+
+
+_DAY_NAMES = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+@dataclass(frozen=True)
+class WorkingHours:
+    """Daily working hours on a set of weekdays, in a timezone (None: the server's)."""
+
+    start: datetime.time
+    end: datetime.time
+    days: FrozenSet[int] = frozenset(range(5))
+    tz: Optional[datetime.tzinfo] = None
+
+    @classmethod
+    def from_env(cls) -> "WorkingHours":
+        start, end = (datetime.time.fromisoformat(t.strip()) for t in WORKING_HOURS.split("-"))
+        days = frozenset(_DAY_NAMES.index(d.strip().lower()[:3]) for d in WORKING_DAYS.split(",") if d.strip())
+        return cls(start, end, days, calendar_tz())
+
+    def windows(self, start: float, end: float) -> List[Tuple[float, float]]:
+        """Splits [start, end) into the working-hour windows it contains."""
+        windows = []
+        day = datetime.datetime.fromtimestamp(start, self.tz).date()
+        last = datetime.datetime.fromtimestamp(end, self.tz).date()
+        while day <= last:
+            if day.weekday() in self.days:
+                # Combining per day keeps the hours right across DST changes.
+                lo = max(start, datetime.datetime.combine(day, self.start, self.tz).timestamp())
+                hi = min(end, datetime.datetime.combine(day, self.end, self.tz).timestamp())
+                if lo < hi:
+                    windows.append((lo, hi))
+            day += datetime.timedelta(days=1)
+        return windows
+
+    def describe(self) -> str:
+        days = ",".join(_DAY_NAMES[d].capitalize() for d in sorted(self.days))
+        return f"{self.start:%H:%M}-{self.end:%H:%M} {days}"
+
+
+@dataclass
+class Availability:
+    start: float
+    end: float
+    free: List[Tuple[float, float]] = field(default_factory=list)
+    conflicts: List[Tuple[Interval, Interval]] = field(default_factory=list)
+    busy_seconds: float = 0.0
+    total_seconds: float = 0.0
+
+    @property
+    def busy_percent(self) -> int:
+        return round(100 * self.busy_seconds / self.total_seconds) if self.total_seconds else 0
+
+
+def compute_availability(
+    index: IntervalIndex,
+    start: float,
+    end: float,
+    hours: Optional[WorkingHours] = None,
+    min_free: float = 30 * 60,
+) -> Availability:
+    """Computes free slots of at least `min_free` seconds, the busy share and
+    double bookings in [start, end), within working hours if `hours` is given."""
+    result = Availability(start, end, conflicts=index.conflicts(start, end))
+    for window_start, window_end in hours.windows(start, end) if hours else [(start, end)]:
+        gaps, cursor = [], window_start
+        for interval in index.overlapping(window_start, window_end):
+            if interval.start > cursor:
+                gaps.append((cursor, interval.start))
+            cursor = max(cursor, min(interval.end, window_end))
+        if cursor < window_end:
+            gaps.append((cursor, window_end))
+
+        total = window_end - window_start
+        result.total_seconds += total
+        result.busy_seconds += total - sum(e - s for s, e in gaps)
+        result.free.extend((s, e) for s, e in gaps if e - s >= min_free)
+    return result
+
+
+def _duration(seconds: float) -> str:
+    hours, minutes = divmod(int(seconds // 60), 60)
+    return f"{hours}h{minutes:02d}m" if hours and minutes else f"{hours}h" if hours else f"{minutes}m"
+
+
+def format_availability(
+    result: Availability, hours: Optional[WorkingHours] = None, tz: Optional[datetime.tzinfo] = None, max_slots: int = 20
+) -> str:
+    """Renders an availability result as a few compact lines of text."""
+    tz = hours.tz if hours else tz
+
+    def span(start: float, end: float) -> str:
+        s, e = datetime.datetime.fromtimestamp(start, tz), datetime.datetime.fromtimestamp(end, tz)
+        return f"{s:%a %d %b %H:%M}-{e:%H:%M}" if s.date() == e.date() else f"{s:%a %d %b %H:%M}-{e:%a %d %b %H:%M}"
+
+    tz_name = str(tz) if tz else "local time"
+    lines = [f"Window: {span(result.start, result.end)} ({tz_name})"]
+    if hours:
+        lines[0] += f", working hours {hours.describe()}"
+    lines.append(
+        f"Busy: {result.busy_percent}% ({_duration(result.busy_seconds)} of {_duration(result.total_seconds)})"
+    )
+    lines.append("Free:" if result.free else "Free: none")
+    lines.extend(f"- {span(s, e)} ({_duration(e - s)})" for s, e in result.free[:max_slots])
+    if len(result.free) > max_slots:
+        lines.append(f"- ... {len(result.free) - max_slots} more")
+    if result.conflicts:
+        lines.append("Conflicts:")
+        lines.extend(
+            f"- {span(max(a.start, b.start), min(a.end, b.end))}: {a.summary} / {b.summary}"
+            for a, b in result.conflicts
+        )
+    return "\n".join(lines)
+
+
+# --- Live multi-calendar queries ---
+
+# Partial responses: request only the fields we use.
+EVENT_LIST_FIELDS = "nextPageToken,items(id,status,summary,start,end)"
+CALENDAR_LIST_FIELDS = "nextPageToken,items(id,summary,primary)"
+# Google accepts at most 50 requests per batch.
+BATCH_MAX_REQUESTS = 50
+# How often a calendar whose part of a batch failed (e.g. 429, 5xx) is asked again.
+BATCH_RETRY_ATTEMPTS = int(os.getenv("CALENDAR_BATCH_RETRY_ATTEMPTS", "1"))
+# How long the list of the user's calendars is reused (seconds).
+CALENDAR_LIST_TTL = int(os.getenv("CALENDAR_LIST_TTL", "3600"))
+
+
+def to_rfc3339(value: str) -> str:
+    """Normalizes an ISO 8601 timestamp to RFC 3339, in the user's timezone if no offset is given."""
+    return _parse(value).isoformat()
+
+
+def event_to_dict(event: dict, calendar_name: Optional[str] = None) -> Dict:
+    """Formats an API event like the store's rows, optionally tagged with its calendar."""
+    start_str = event["start"].get("dateTime", event["start"].get("date"))
+    end_str = event["end"].get("dateTime", event["end"].get("date"))
+    formatted = {
+        "summary": event.get("summary", "No Title"),
+        "start": start_str,
+        "end": end_str,
+        "is_all_day": "T" not in start_str,
+    }
+    if calendar_name is not None:
+        formatted["calendar"] = calendar_name
+    return formatted
+
+
+class CalendarFanout:
+    """
+    Queries every calendar in the user's calendarList at once.
+
+    All calendars' events.list requests go out in one BatchHttpRequest, and
+    calendars with more pages are followed up in further batches. `execute`
+    runs a (batch) request, e.g. GoogleClientManager.execute.
+    """
+
+    def __init__(self, execute: Callable[[Any], Awaitable[dict]]):
+        self._execute = execute
+        self._calendars: Dict[str, str] = {}
+        self._calendars_fetched = 0.0
+
+    async def calendars(self, service) -> Dict[str, str]:
+        """Returns {calendar_id: name} for the user's calendars, cached for CALENDAR_LIST_TTL.
+
+        The primary calendar is listed as "primary", like the rest of this module does.
+        """
+        if self._calendars and time.time() - self._calendars_fetched < CALENDAR_LIST_TTL:
+            return self._calendars
+        calendars, page_token = {}, None
+        while True:
+            result = await self._execute(
+                service.calendarList().list(fields=CALENDAR_LIST_FIELDS, pageToken=page_token)
+            )
+            for item in result.get("items", []):
+                if item.get("primary"):
+                    calendars["primary"] = "primary"
+                else:
+                    calendars[item["id"]] = item.get("summary", item["id"])
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                break
+        self._calendars, self._calendars_fetched = calendars, time.time()
+        return calendars
+
+    async def stream_events(
+        self, service, calendar_ids: List[str], time_min: str, time_max: Optional[str], per_calendar_limit: int
+    ) -> AsyncIterator[Tuple[str, Optional[List[dict]]]]:
+        """Yields (calendar_id, events) pages as batches complete.
+
+        Each calendar's events arrive in start-time order, so a calendar is not
+        paged any further once it has produced `per_calendar_limit` events.
+        A calendar that could not be read, even after retrying, is yielded
+        once with None instead of events.
+        """
+        page_tokens: Dict[str, Optional[str]] = {calendar_id: None for calendar_id in calendar_ids}
+        counts: Dict[str, int] = {calendar_id: 0 for calendar_id in calendar_ids}
+        retries: Dict[str, int] = {calendar_id: 0 for calendar_id in calendar_ids}
+        retrying = False
+        while page_tokens:
+            if retrying:
+                await asyncio.sleep(1)
+            retrying = False
+            chunk = list(page_tokens.items())[:BATCH_MAX_REQUESTS]
+            responses: Dict[str, Tuple[Optional[dict], Optional[Exception]]] = {}
+
+            def collect(request_id, response, exception):
+                responses[request_id] = (response, exception)
+
+            batch = service.new_batch_http_request(callback=collect)
+            for i, (calendar_id, page_token) in enumerate(chunk):
+                params = {
+                    "calendarId": calendar_id,
+                    "timeMin": time_min,
+                    "singleEvents": True,
+                    "orderBy": "startTime",
+                    "maxResults": min(per_calendar_limit, 250),
+                    "fields": EVENT_LIST_FIELDS,
+                }
+                if time_max:
+                    params["timeMax"] = time_max
+                if page_token:
+                    params["pageToken"] = page_token
+                batch.add(service.events().list(**params), request_id=str(i))
+            await self._execute(batch)
+
+            for i, (calendar_id, page_token) in enumerate(chunk):
+                response, exception = responses.get(str(i), (None, None))
+                del page_tokens[calendar_id]
+                if exception is not None or response is None:
+                    logger.warning(f"Failed to list events of calendar {calendar_id}: {exception}")
+                    if retries[calendar_id] < BATCH_RETRY_ATTEMPTS:
+                        retries[calendar_id] += 1
+                        page_tokens[calendar_id] = page_token
+                        retrying = True
+                    else:
+                        yield calendar_id, None
+                    continue
+                items = [e for e in response.get("items", []) if e.get("status") != "cancelled" and "start" in e]
+                counts[calendar_id] += len(items)
+                if response.get("nextPageToken") and counts[calendar_id] < per_calendar_limit:
+                    page_tokens[calendar_id] = response["nextPageToken"]
+                yield calendar_id, items
+
+    async def list_events(
+        self, service, time_min: Optional[str] = None, time_max: Optional[str] = None, max_results: int = 50
+    ) -> Tuple[List[Dict], List[str]]:
+        """Returns the first `max_results` events across all calendars, ordered by
+        start time, and the names of the calendars that could not be read."""
+        calendars = await self.calendars(service)
+        time_min = to_rfc3339(time_min) if time_min else datetime.datetime.now(datetime.timezone.utc).isoformat()
+        time_max = to_rfc3339(time_max) if time_max else None
+
+        events, failed = [], []
+        async for calendar_id, items in self.stream_events(
+            service, list(calendars), time_min, time_max, per_calendar_limit=max_results
+        ):
+            if items is None:
+                failed.append(calendars[calendar_id])
+                continue
+            events.extend(event_to_dict(e, calendars[calendar_id]) for e in items)
+        events.sort(key=lambda e: to_timestamp(e["start"]))
+        return events[:max_results], failed
+
+
+_stores: PerTenant[CalendarStore] = PerTenant(lambda chat_id: CalendarStore(tenant_path(CALENDAR_DB_PATH, chat_id)))
+
+
+def get_calendar_store(chat_id: Optional[str] = None) -> CalendarStore:
+    """Returns the calendar store of `chat_id` (by default the current tenant), opening it on first use."""
+    return _stores.get(chat_id)
+
+
+async def run_periodic_sync(
+    sync_fn: Callable[[], Awaitable[bool]], interval: int = CALENDAR_SYNC_INTERVAL, name: str = "calendar"
+) -> None:
+    """Awaits `sync_fn` every `interval` seconds."""
+    while True:
+        try:
+            await sync_fn()
+        except Exception as e:
+            logger.error(f"Periodic {name} sync failed: {e}", exc_info=True)
+        await asyncio.sleep(interval)
@@ -0,0 +1,502 @@
+# This file contains the managed SQLite checkpoint backend for the LangGraph
+# agent: WAL mode with tuned pragmas, separate read and write connections, a
+# retention policy that prunes old checkpoints (and the message deltas only
+# they used) and reclaims the space, and a serializer that stores the message
+# history as append-only deltas.
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, List, NamedTuple, Optional, Tuple
+
+import aiosqlite
+from langgraph.checkpoint.base import get_checkpoint_metadata
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.config import RunnableConfig
+
+from src.metrics import CHECKPOINT_SECONDS, span
+
+try:
+    import zstandard
+except ImportError:  # Compression is optional.
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "database.db")
+# Number of most recent checkpoints kept per thread.
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "20"))
+# How often old checkpoints are pruned and free pages reclaimed (seconds).
+CHECKPOINT_MAINTENANCE_INTERVAL = int(os.getenv("CHECKPOINT_MAINTENANCE_INTERVAL", "3600"))
+# Store the messages channel as deltas shared between checkpoints.
+CHECKPOINT_DELTA_MESSAGES = os.getenv("CHECKPOINT_DELTA_MESSAGES", "true").lower() == "true"
+# Compress checkpoint blobs with zstd when the zstandard package is installed.
+CHECKPOINT_COMPRESSION = os.getenv("CHECKPOINT_COMPRESSION", "zstd" if zstandard else "none")
+# Message deltas written this recently are kept by pruning even if no checkpoint
+# refers to them yet: their checkpoint may still be on its way to the database (seconds).
+CHECKPOINT_DELTA_GRACE = int(os.getenv("CHECKPOINT_DELTA_GRACE", "600"))
+
+PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA busy_timeout=5000;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-16000;
+PRAGMA mmap_size=134217728;
+"""
+
+
+# Blobs smaller than this are not worth compressing.
+_COMPRESS_MIN_BYTES = 256
+_DELTA_PREFIX = "delta+"
+_ZSTD_PREFIX = "zstd+"
+
+
+class _ChainRef(NamedTuple):
+    """A message chain that is not loaded yet (see DeltaMessageSerializer.deferred)."""
+
+    head: bytes
+    length: int
+
+
+class DeltaMessageSerializer(SerializerProtocol):
+    """
+    A checkpoint serializer that stores the `messages` channel as a hash chain
+    of append-only deltas.
+
+    Each message is encoded once into the `message_deltas` table, keyed by the
+    hash of (previous head, message). A checkpoint then only stores the head of
+    its chain, so writing a checkpoint costs the messages added since the last
+    one instead of the whole history. Blobs are optionally zstd-compressed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compression: str = CHECKPOINT_COMPRESSION,
+        base: Optional[SerializerProtocol] = None,
+        memo_size: int = 10000,
+    ):
+        self._base = base or JsonPlusSerializer()
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed; checkpoints will not be compressed.")
+            compression = "none"
+        self._compressor = zstandard.ZstdCompressor(level=3) if compression == "zstd" else None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            PRAGMAS
+            + """
+            CREATE TABLE IF NOT EXISTS message_deltas (
+                head BLOB PRIMARY KEY,
+                parent BLOB,
+                payload BLOB NOT NULL,
+                created REAL NOT NULL DEFAULT 0
+            ) WITHOUT ROWID;
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(message_deltas)")}
+        if "created" not in columns:
+            # Deltas written before pruning existed count as old.
+            self._conn.execute("ALTER TABLE message_deltas ADD COLUMN created REAL NOT NULL DEFAULT 0")
+        # Checkpoints are serialized on worker threads and loaded on the event loop.
+        self._memo_lock = threading.Lock()
+        # id(message) -> (message, position, chain head ending at that message).
+        # Holding the message keeps its id from being reused while memoized.
+        self._memo: "OrderedDict[int, Tuple[Any, int, bytes]]" = OrderedDict()
+        self._memo_size = memo_size
+        # Recently written or read chains, by head.
+        self._chains: "OrderedDict[bytes, List[Any]]" = OrderedDict()
+
+    # --- Compression ---
+
+    def _compress(self, type_: str, data: bytes) -> Tuple[str, bytes]:
+        if self._compressor is None or len(data) < _COMPRESS_MIN_BYTES:
+            return type_, data
+        return _ZSTD_PREFIX + type_, self._compressor.compress(data)
+
+    def _decompress(self, type_: str, data: bytes) -> Tuple[str, bytes]:
+        if type_.startswith(_ZSTD_PREFIX):
+            if self._decompressor is None:
+                raise RuntimeError("zstandard is required to read compressed checkpoints.")
+            return type_[len(_ZSTD_PREFIX):], self._decompressor.decompress(data)
+        return type_, data
+
+    # --- Message chains ---
+
+    def _remember(self, messages: List[Any], heads: List[bytes], start: int) -> None:
+        with self._memo_lock:
+            for i in range(start, len(messages)):
+                self._memo[id(messages[i])] = (messages[i], i, heads[i - start])
+                self._memo.move_to_end(id(messages[i]))
+            while len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+
+    def _cache_chain(self, head: bytes, messages: List[Any]) -> None:
+        with self._memo_lock:
+            self._chains[head] = messages
+            self._chains.move_to_end(head)
+            while len(self._chains) > 32:
+                self._chains.popitem(last=False)
+
+    def _store_chain(self, messages: List[Any]) -> bytes:
+        """Writes any messages not yet stored and returns the chain head."""
+        # Find the longest prefix we have already stored, scanning from the end.
+        start, head = 0, b""
+        with self._memo_lock:
+            for i in range(len(messages) - 1, -1, -1):
+                entry = self._memo.get(id(messages[i]))
+                if entry is not None and entry[0] is messages[i] and entry[1] == i:
+                    start, head = i + 1, entry[2]
+                    break
+
+        rows, heads = [], []
+        for m in messages[start:]:
+            type_, data = self._compress(*self._base.dumps_typed(m))
+            payload = type_.encode() + b"\0" + data
+            parent, head = head, hashlib.blake2b(head + payload, digest_size=16).digest()
+            rows.append((head, parent or None, payload, time.time()))
+            heads.append(head)
+
+        if rows:
+            with self._lock, self._conn:
+                # A delta written again is in use again: restart its grace period.
+                self._conn.executemany(
+                    """
+                    INSERT INTO message_deltas (head, parent, payload, created) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (head) DO UPDATE SET created = excluded.created
+                    """,
+                    rows,
+                )
+            self._remember(messages, heads, start)
+        self._cache_chain(head, list(messages))
+        return head
+
+    def _load_chain(self, head: bytes, length: int) -> List[Any]:
+        if not head:
+            return []
+        with self._memo_lock:
+            cached = self._chains.get(head)
+        if cached is not None:
+            return list(cached)
+
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                WITH RECURSIVE chain(head, parent, payload, depth) AS (
+                    SELECT head, parent, payload, 0 FROM message_deltas WHERE head = ?
+                    UNION ALL
+                    SELECT d.head, d.parent, d.payload, c.depth + 1
+                    FROM message_deltas d JOIN chain c ON d.head = c.parent
+                )
+                SELECT head, payload FROM chain ORDER BY depth DESC
+                """,
+                (head,),
+            ).fetchall()
+        if len(rows) != length:
+            raise ValueError(f"Message chain is incomplete: expected {length} messages, found {len(rows)}.")
+
+        messages = []
+        for _, payload in rows:
+            type_, data = payload.split(b"\0", 1)
+            messages.append(self._base.loads_typed(self._decompress(type_.decode(), data)))
+        self._remember(messages, [h for h, _ in rows], 0)
+        self._cache_chain(head, messages)
+        return list(messages)
+
+    # --- SerializerProtocol ---
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        channel_values = obj.get("channel_values") if isinstance(obj, dict) else None
+        if isinstance(channel_values, dict) and isinstance(channel_values.get("messages"), list):
+            messages = channel_values["messages"]
+            ref = {"head": self._store_chain(messages), "length": len(messages)}
+            obj = {**obj, "channel_values": {**channel_values, "messages": ref}}
+            type_, data = self._base.dumps_typed(obj)
+            return self._compress(_DELTA_PREFIX + type_, data)
+        return self._compress(*self._base.dumps_typed(obj))
+
+    def loads_typed(self, data: Tuple[str, bytes], defer: bool = False) -> Any:
+        """Decodes a checkpoint. With `defer`, a message chain that would have
+        to be read from the database is left as a reference for `aresolve`."""
+        type_, blob = self._decompress(*data)
+        if not type_.startswith(_DELTA_PREFIX):
+            return self._base.loads_typed((type_, blob))
+
+        obj = self._base.loads_typed((type_[len(_DELTA_PREFIX):], blob))
+        ref = obj["channel_values"]["messages"]
+        with self._memo_lock:
+            cached = not ref["head"] or ref["head"] in self._chains
+        if defer and not cached:
+            obj["channel_values"]["messages"] = _ChainRef(ref["head"], ref["length"])
+        else:
+            obj["channel_values"]["messages"] = self._load_chain(ref["head"], ref["length"])
+        return obj
+
+    def deferred(self) -> SerializerProtocol:
+        """This serializer, but leaving uncached message chains to `aresolve`."""
+        return _DeferredChains(self)
+
+    async def aresolve(self, checkpoint: Any) -> None:
+        """Loads a checkpoint's deferred message chain on a worker thread."""
+        values = checkpoint.get("channel_values") if isinstance(checkpoint, dict) else None
+        ref = values.get("messages") if isinstance(values, dict) else None
+        if isinstance(ref, _ChainRef):
+            values["messages"] = await asyncio.to_thread(self._load_chain, ref.head, ref.length)
+
+    # --- Pruning ---
+
+    def _head_of(self, type_: str, blob: bytes) -> Optional[bytes]:
+        """The message chain head a stored checkpoint refers to, if any."""
+        type_, blob = self._decompress(type_, blob)
+        if not type_.startswith(_DELTA_PREFIX):
+            return None
+        obj = self._base.loads_typed((type_[len(_DELTA_PREFIX):], blob))
+        return obj["channel_values"]["messages"]["head"] or None
+
+    def prune(self, grace: int = CHECKPOINT_DELTA_GRACE) -> int:
+        """Deletes the message deltas that no remaining checkpoint reaches.
+
+        Blocking; run it off the event loop. Returns the number of deltas deleted.
+        """
+        with self._lock:
+            checkpoints = self._conn.execute("SELECT type, checkpoint FROM checkpoints").fetchall()
+        heads = {head for type_, blob in checkpoints if (head := self._head_of(type_, blob))}
+
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS live_heads (head BLOB PRIMARY KEY)")
+            self._conn.execute("DELETE FROM live_heads")
+            self._conn.executemany("INSERT OR IGNORE INTO live_heads VALUES (?)", ((h,) for h in heads))
+            # Recent deltas may belong to a checkpoint that is being written.
+            self._conn.execute(
+                "INSERT OR IGNORE INTO live_heads SELECT head FROM message_deltas WHERE created >= ?",
+                (time.time() - grace,),
+            )
+            deleted = self._conn.execute(
+                """
+                WITH RECURSIVE reachable(head) AS (
+                    SELECT head FROM live_heads
+                    UNION
+                    SELECT d.parent FROM message_deltas d JOIN reachable r ON d.head = r.head
+                    WHERE d.parent IS NOT NULL
+                )
+                DELETE FROM message_deltas WHERE head NOT IN (SELECT head FROM reachable)
+                """
+            ).rowcount
+            self._conn.execute("DELETE FROM live_heads")
+            if deleted:
+                # Memoized heads may point at deleted deltas; the next write re-stores them.
+                with self._memo_lock:
+                    self._memo.clear()
+                    self._chains.clear()
+        return deleted
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class _DeferredChains(SerializerProtocol):
+    def __init__(self, serde: DeltaMessageSerializer):
+        self._serde = serde
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        return self._serde.dumps_typed(obj)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        return self._serde.loads_typed(data, defer=True)
+
+
+class ManagedSqliteSaver(AsyncSqliteSaver):
+    """
+    An AsyncSqliteSaver that writes through one connection and reads through
+    another. With WAL, reads never wait on the writer's lock or transactions.
+    Message chains that are not cached are read on a worker thread.
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, read_conn: aiosqlite.Connection, **kwargs):
+        super().__init__(conn, **kwargs)
+        self.read_conn = read_conn
+        deltas = isinstance(self.serde, DeltaMessageSerializer)
+        self._reader = AsyncSqliteSaver(read_conn, serde=self.serde.deferred() if deltas else self.serde)
+
+    async def setup(self) -> None:
+        await super().setup()
+        # The writer created the tables; the reader must not try to.
+        self._reader.is_setup = True
+        self._reader._has_task_path = self._has_task_path
+
+    async def aget_tuple(self, config: RunnableConfig):
+        await self.setup()
+        with span(CHECKPOINT_SECONDS, "checkpoint_read", op="get_tuple"):
+            item = await self._reader.aget_tuple(config)
+            await self._resolve(item)
+            return item
+
+    async def alist(self, config: Optional[RunnableConfig], **kwargs: Any) -> AsyncIterator:
+        await self.setup()
+        async for item in self._reader.alist(config, **kwargs):
+            await self._resolve(item)
+            yield item
+
+    async def _resolve(self, item) -> None:
+        if item is not None and isinstance(self.serde, DeltaMessageSerializer):
+            await self.serde.aresolve(item.checkpoint)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        """As AsyncSqliteSaver.aput, but serializes on a worker thread.
+
+        The delta serializer writes new messages to SQLite, which must not
+        block the event loop (e.g. while waiting out a busy database).
+        """
+        with span(CHECKPOINT_SECONDS, "checkpoint_write", op="put"):
+            await self.setup()
+            thread_id = str(config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"]["checkpoint_ns"]
+            if isinstance(self.serde, DeltaMessageSerializer):
+                type_, serialized_checkpoint = await asyncio.to_thread(self.serde.dumps_typed, checkpoint)
+            else:
+                type_, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
+            serialized_metadata = json.dumps(
+                get_checkpoint_metadata(config, metadata), ensure_ascii=False
+            ).encode("utf-8", "ignore")
+            async with self.lock:
+                await self.conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint["id"],
+                        config["configurable"].get("checkpoint_id"),
+                        type_,
+                        serialized_checkpoint,
+                        serialized_metadata,
+                    ),
+                )
+                await self.conn.commit()
+            return {
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint["id"],
+                }
+            }
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = ""):
+        with span(CHECKPOINT_SECONDS, "checkpoint_write", op="put_writes"):
+            return await super().aput_writes(config, writes, task_id, task_path)
+
+    async def prune(self, keep_last: int = CHECKPOINT_KEEP_LAST) -> int:
+        """Deletes all but the latest `keep_last` checkpoints of every thread,
+        along with their pending writes and the message deltas no longer
+        reachable. Returns the number of checkpoints deleted."""
+        await self.setup()
+        async with self.lock, self.conn.cursor() as cur:
+            await cur.execute(
+                """
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                        ) AS rn
+                        FROM checkpoints
+                    ) WHERE rn > ?
+                )
+                """,
+                (keep_last,),
+            )
+            deleted = cur.rowcount
+            await cur.execute(
+                """
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = writes.thread_id
+                      AND c.checkpoint_ns = writes.checkpoint_ns
+                      AND c.checkpoint_id = writes.checkpoint_id
+                )
+                """
+            )
+            await self.conn.commit()
+        if isinstance(self.serde, DeltaMessageSerializer):
+            deltas = await asyncio.to_thread(self.serde.prune)
+            if deltas:
+                logger.info(f"Pruned {deltas} unreferenced message deltas.")
+        return deleted
+
+    async def incremental_vacuum(self) -> None:
+        """Returns free pages to the filesystem without rebuilding the database."""
+        async with self.lock:
+            await self.conn.execute("PRAGMA incremental_vacuum")
+            await self.conn.commit()
+            # Truncate the WAL so it doesn't keep the freed space.
+            await self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+async def _connect(path: str) -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(path)
+    await conn.executescript(PRAGMAS)
+    return conn
+
+
+async def open_checkpointer(
+    path: str = CHECKPOINT_DB_PATH,
+    delta_messages: bool = CHECKPOINT_DELTA_MESSAGES,
+    maintain: bool = True,
+    **kwargs,
+) -> ManagedSqliteSaver:
+    """Opens the checkpoint database with tuned pragmas and separate read/write connections.
+
+    `maintain` is False in processes that share the database with the one
+    maintaining it; they skip the one-time auto-vacuum migration.
+    """
+    conn = await aiosqlite.connect(path)
+    # busy_timeout first, so a database another process has locked is waited for.
+    await conn.executescript(PRAGMAS)
+    # auto_vacuum must be set before the first table is created; existing
+    # databases need one full VACUUM to switch over.
+    async with conn.execute("PRAGMA auto_vacuum") as cur:
+        (auto_vacuum,) = await cur.fetchone()
+    if auto_vacuum != 2 and maintain:
+        logger.info("Enabling incremental auto-vacuum on the checkpoint database (one-time VACUUM).")
+        await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await conn.execute("VACUUM")
+
+    if delta_messages and "serde" not in kwargs:
+        kwargs["serde"] = DeltaMessageSerializer(path)
+    saver = ManagedSqliteSaver(conn, await _connect(path), **kwargs)
+    await saver.setup()
+    return saver
+
+
+async def close_checkpointer(saver: ManagedSqliteSaver) -> None:
+    await saver.conn.close()
+    await saver.read_conn.close()
+    if isinstance(saver.serde, DeltaMessageSerializer):
+        saver.serde.close()
+
+
+async def run_checkpoint_maintenance(
+    saver: ManagedSqliteSaver,
+    interval: int = CHECKPOINT_MAINTENANCE_INTERVAL,
+    keep_last: int = CHECKPOINT_KEEP_LAST,
+) -> None:
+    """Periodically applies the retention policy and reclaims free space."""
+    while True:
+        try:
+            deleted = await saver.prune(keep_last)
+            await saver.incremental_vacuum()
+            if deleted:
+                logger.info(f"Pruned {deleted} old checkpoints.")
+        except Exception as e:
+            logger.error(f"Checkpoint maintenance failed: {e}", exc_info=True)
+        await asyncio.sleep(interval)
@@ -0,0 +1,125 @@
+# This file contains optional Gemini context caching for the static prompt
+# prefix (persona, instructions and tool declarations). The prefix is uploaded
+# once as cached content and later requests reference it by name instead of
+# resending it. The backend is pluggable (see ContextCacheBackend).
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional, Protocol, Tuple
+
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+logger = logging.getLogger(__name__)
+
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() == "true"
+# Lifetime of a cached prefix on Google's side (seconds).
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+# After a failed cache creation (e.g. the prefix is below the model's minimum
+# cacheable size), requests go uncached for this long before retrying (seconds).
+GEMINI_CONTEXT_CACHE_RETRY = int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY", "900"))
+
+
+class ContextCacheBackend(Protocol):
+    """Creates and deletes provider-side cached content."""
+
+    async def create(self, model: str, system_instruction: str, tools: List, ttl: int) -> str: ...
+
+    async def delete(self, name: str) -> None: ...
+
+
+class GeminiContextCacheBackend:
+    """Caches the prefix with the Gemini API's cachedContents resource."""
+
+    def __init__(self, api_key: Optional[str] = None):
+        from google import genai
+
+        self._client = genai.Client(api_key=api_key or os.getenv("GOOGLE_API_KEY"))
+
+    async def create(self, model: str, system_instruction: str, tools: List, ttl: int) -> str:
+        from google.genai import types
+        from langchain_google_genai._function_utils import convert_to_genai_function_declarations
+
+        cache = await self._client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name="astra-static-prefix",
+                system_instruction=system_instruction,
+                tools=[convert_to_genai_function_declarations(tools)] if tools else None,
+                ttl=f"{ttl}s",
+            ),
+        )
+        return cache.name
+
+    async def delete(self, name: str) -> None:
+        await self._client.aio.caches.delete(name=name)
+
+
+class PromptPrefixCache:
+    """
+    Keeps one cached-content handle per (model, prefix, tools) and renews it
+    shortly before it expires. Returns None whenever caching is unavailable, in
+    which case callers send the prefix inline as usual.
+    """
+
+    def __init__(
+        self,
+        backend: ContextCacheBackend,
+        ttl: int = GEMINI_CONTEXT_CACHE_TTL,
+        retry_after: int = GEMINI_CONTEXT_CACHE_RETRY,
+    ):
+        self._backend = backend
+        self._ttl = ttl
+        self._retry_after = retry_after
+        self._handles = {}  # key -> (name, expires_at)
+        self._disabled_until = {}  # key -> monotonic time
+        self._lock = asyncio.Lock()
+        # Tool declarations by the ids of the tools, converted once instead of on every LLM call.
+        self._tool_specs: Dict[Tuple[int, ...], Tuple[List, str]] = {}
+
+    def _tool_spec(self, tools: List) -> str:
+        ids = tuple(map(id, tools))
+        cached = self._tool_specs.get(ids)
+        if cached is None:
+            # Holding on to the tools keeps their ids from being reused.
+            spec = json.dumps([convert_to_openai_tool(t) for t in tools], sort_keys=True)
+            cached = self._tool_specs[ids] = (list(tools), spec)
+        return cached[1]
+
+    def _key(self, model: str, system_instruction: str, tools: List) -> str:
+        spec = self._tool_spec(tools)
+        return hashlib.sha256(f"{model}\0{system_instruction}\0{spec}".encode()).hexdigest()
+
+    async def handle(self, model: str, system_instruction: str, tools: List) -> Optional[str]:
+        key = self._key(model, system_instruction, tools)
+        now = time.monotonic()
+        # Renew a minute early so a request never references an expired cache.
+        cached = self._handles.get(key)
+        if cached and now < cached[1] - 60:
+            return cached[0]
+        if now < self._disabled_until.get(key, 0):
+            return None
+
+        async with self._lock:
+            cached = self._handles.get(key)
+            if cached and time.monotonic() < cached[1] - 60:
+                return cached[0]
+            try:
+                name = await self._backend.create(model, system_instruction, tools, self._ttl)
+            except Exception as e:
+                logger.warning(f"Context caching unavailable, sending the prompt prefix inline: {e}")
+                self._disabled_until[key] = time.monotonic() + self._retry_after
+                return None
+            self._handles[key] = (name, time.monotonic() + self._ttl)
+            logger.info(f"Created context cache {name} for model {model}.")
+
+        if cached:
+            # The old handle expires on its own; deleting it just frees it sooner.
+            try:
+                await self._backend.delete(cached[0])
+            except Exception as e:
+                logger.debug(f"Failed to delete context cache {cached[0]}: {e}")
+        return name
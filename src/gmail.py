@@ -1,2 +1,424 @@
-# This file will contain the code for Gmail integration, including
-# the email_reader, email_drafter, and email_sender nodes for the LangGraph agent. 
\ No newline at end of file
+# This file contains the code for Gmail integration: a local mirror of recent
+# message metadata and snippets that is filled by one full sync and then kept
+# current with users.history.list, indexed with SQLite FTS5 so the mail tools
+# can search without calling the Gmail API.
+
+import os
+import re
+import time
+import base64
+import sqlite3
+import datetime
+import logging
+import threading
+from email.utils import parseaddr
+from typing import Callable, Dict, Iterable, List, Optional
+
+from googleapiclient.errors import HttpError
+
+from src.calendar import calendar_tz
+from src.tenants import PerTenant, tenant_path
+
+logger = logging.getLogger(__name__)
+
+GMAIL_DB_PATH = os.getenv("GMAIL_DB_PATH", "gmail.db")
+# How far back the mirror reaches (days) and how many messages it holds at most.
+GMAIL_SYNC_DAYS = int(os.getenv("GMAIL_SYNC_DAYS", "30"))
+GMAIL_MAX_MESSAGES = int(os.getenv("GMAIL_MAX_MESSAGES", "2000"))
+# How often the background task pulls incremental changes (seconds).
+GMAIL_SYNC_INTERVAL = int(os.getenv("GMAIL_SYNC_INTERVAL", "300"))
+# How old the last sync may be before a tool call syncs on demand (seconds).
+GMAIL_MAX_STALENESS = int(os.getenv("GMAIL_MAX_STALENESS", "600"))
+# Longest message body returned by read_email (characters).
+GMAIL_BODY_MAX_CHARS = int(os.getenv("GMAIL_BODY_MAX_CHARS", "4000"))
+
+METADATA_HEADERS = ["From", "To", "Subject", "Date"]
+MESSAGE_FIELDS = "id,threadId,historyId,internalDate,labelIds,snippet,payload/headers"
+# Gmail recommends at most 50 requests per batch.
+BATCH_MAX_REQUESTS = 50
+# How often messages whose part of a batch failed (e.g. 429, 5xx) are fetched again.
+BATCH_RETRY_ATTEMPTS = int(os.getenv("GMAIL_BATCH_RETRY_ATTEMPTS", "3"))
+
+
+def _execute(request) -> dict:
+    return request.execute()
+
+
+def _headers(message: dict) -> Dict[str, str]:
+    return {h["name"].lower(): h["value"] for h in message.get("payload", {}).get("headers", [])}
+
+
+def _fts_query(text: str) -> str:
+    """Turns free text into an FTS5 query matching messages containing every word."""
+    words = re.findall(r"[\w@.'+-]+", text)
+    return " ".join('"' + w.replace('"', '""') + '"' for w in words)
+
+
+def extract_body(payload: dict) -> str:
+    """Returns the plain-text body of a full-format message payload."""
+    html = None
+    stack = [payload]
+    while stack:
+        part = stack.pop(0)
+        data = part.get("body", {}).get("data")
+        if data and part.get("mimeType") == "text/plain":
+            return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)).decode("utf-8", "replace")
+        if data and part.get("mimeType") == "text/html" and html is None:
+            html = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)).decode("utf-8", "replace")
+        stack.extend(part.get("parts", []))
+    if html is None:
+        return ""
+    text = re.sub(r"(?is)<(script|style).*?</\1>", "", html)
+    text = re.sub(r"(?s)<[^>]+>", " ", text)
+    return re.sub(r"[ \t\r\f\v]+", " ", text).strip()
+
+
+class GmailStore:
+    """
+    A local SQLite mirror of the user's recent mail (headers, labels and
+    snippets), with an FTS5 index over sender, recipients, subject and snippet.
+    The first sync lists the last GMAIL_SYNC_DAYS days of mail; later syncs
+    replay users.history.list from the stored historyId.
+    """
+
+    def __init__(self, path: str = GMAIL_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        with self._lock, self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS messages (
+                    id TEXT PRIMARY KEY,
+                    thread_id TEXT NOT NULL,
+                    internal_date REAL NOT NULL,
+                    sender TEXT NOT NULL,
+                    recipients TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    snippet TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    body TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_messages_date ON messages (internal_date);
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+                    id UNINDEXED, sender, recipients, subject, snippet, tokenize = 'unicode61 remove_diacritics 2'
+                );
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    history_id TEXT,
+                    last_synced REAL NOT NULL
+                );
+                """
+            )
+
+    # --- Syncing ---
+
+    def sync(self, service, execute: Callable = _execute) -> int:
+        """Brings the mirror up to date.
+
+        Runs a full sync the first time (or when Google no longer has the
+        stored historyId) and an incremental sync otherwise. Returns the
+        number of changed messages.
+        """
+        history_id = self.get_history_id()
+        if history_id:
+            try:
+                return self._sync_incremental(service, history_id, execute)
+            except HttpError as e:
+                # 404 means the history record is too old: start over.
+                if e.resp.status != 404:
+                    raise
+                logger.info("Gmail history expired, running a full sync.")
+        return self._sync_full(service, execute)
+
+    def _sync_full(self, service, execute: Callable) -> int:
+        # Read the current historyId first so changes made during the listing
+        # are replayed by the next incremental sync.
+        history_id = execute(service.users().getProfile(userId="me", fields="historyId"))["historyId"]
+        ids, page_token = [], None
+        while len(ids) < GMAIL_MAX_MESSAGES:
+            result = execute(
+                service.users().messages().list(
+                    userId="me",
+                    q=f"newer_than:{GMAIL_SYNC_DAYS}d",
+                    maxResults=min(500, GMAIL_MAX_MESSAGES - len(ids)),
+                    pageToken=page_token,
+                    fields="nextPageToken,messages(id)",
+                )
+            )
+            ids.extend(m["id"] for m in result.get("messages", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                break
+
+        messages = self._fetch_metadata(service, ids, execute)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages")
+            self._conn.execute("DELETE FROM messages_fts")
+            for message in messages.values():
+                self._upsert(message)
+            self._save_state(history_id)
+        logger.info(f"Full Gmail sync: {len(messages)} messages")
+        return len(messages)
+
+    def _sync_incremental(self, service, history_id: str, execute: Callable) -> int:
+        changed, deleted, page_token = set(), set(), None
+        while True:
+            result = execute(
+                service.users().history().list(
+                    userId="me",
+                    startHistoryId=history_id,
+                    historyTypes=["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"],
+                    pageToken=page_token,
+                )
+            )
+            for record in result.get("history", []):
+                for key in ("messagesAdded", "labelsAdded", "labelsRemoved"):
+                    changed.update(item["message"]["id"] for item in record.get(key, []))
+                for item in record.get("messagesDeleted", []):
+                    deleted.add(item["message"]["id"])
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                new_history_id = result.get("historyId", history_id)
+                break
+
+        changed -= deleted
+        messages = self._fetch_metadata(service, list(changed), execute)
+        # Messages that vanished between the history record and the fetch.
+        deleted |= changed - set(messages)
+        cutoff = time.time() - GMAIL_SYNC_DAYS * 86400
+
+        # Apply the whole sync atomically so a failure never advances the historyId.
+        with self._lock, self._conn:
+            for message in messages.values():
+                self._upsert(message)
+            self._delete(deleted)
+            expired = [r["id"] for r in self._conn.execute("SELECT id FROM messages WHERE internal_date < ?", (cutoff,))]
+            self._delete(expired)
+            self._save_state(new_history_id)
+
+        if changed or deleted:
+            logger.info(f"Incremental Gmail sync: {len(messages)} changed, {len(deleted)} deleted messages")
+        return len(messages) + len(deleted)
+
+    def _fetch_metadata(self, service, ids: List[str], execute: Callable) -> Dict[str, dict]:
+        """Fetches headers, labels and snippets of messages in batches.
+
+        Messages that no longer exist (404) are left out. Other failures are
+        retried and then raised, so a sync never mistakes them for deletions.
+        """
+        messages: Dict[str, dict] = {}
+        for attempt in range(BATCH_RETRY_ATTEMPTS + 1):
+            if attempt:
+                time.sleep(2 ** (attempt - 1))
+            failed = self._fetch_batches(service, ids, execute, messages)
+            if not failed:
+                return messages
+            ids = list(failed)
+            logger.warning(f"Failed to fetch {len(ids)} Gmail messages (attempt {attempt + 1}): {next(iter(failed.values()))}")
+        raise next(iter(failed.values()))
+
+    def _fetch_batches(
+        self, service, ids: List[str], execute: Callable, messages: Dict[str, dict]
+    ) -> Dict[str, Exception]:
+        """Fetches `ids` into `messages` and returns the errors other than 404 by message id."""
+        failed: Dict[str, Exception] = {}
+
+        def collect(request_id, response, exception):
+            if exception is not None:
+                if not (isinstance(exception, HttpError) and exception.resp.status == 404):
+                    failed[request_id] = exception
+            elif response:
+                messages[response["id"]] = response
+
+        for i in range(0, len(ids), BATCH_MAX_REQUESTS):
+            batch = service.new_batch_http_request(callback=collect)
+            for message_id in ids[i:i + BATCH_MAX_REQUESTS]:
+                batch.add(
+                    service.users().messages().get(
+                        userId="me",
+                        id=message_id,
+                        format="metadata",
+                        metadataHeaders=METADATA_HEADERS,
+                        fields=MESSAGE_FIELDS,
+                    ),
+                    request_id=message_id,
+                )
+            execute(batch)
+        return failed
+
+    def _upsert(self, message: dict) -> None:
+        headers = _headers(message)
+        row = (
+            message["id"],
+            message.get("threadId", message["id"]),
+            int(message.get("internalDate", 0)) / 1000,
+            headers.get("from", ""),
+            headers.get("to", ""),
+            headers.get("subject", "(no subject)"),
+            message.get("snippet", ""),
+            ",".join(message.get("labelIds", [])),
+        )
+        self._conn.execute("DELETE FROM messages_fts WHERE id = ?", (message["id"],))
+        # Keep a body that was already downloaded; labels change far more often.
+        self._conn.execute(
+            """
+            INSERT INTO messages (id, thread_id, internal_date, sender, recipients, subject, snippet, labels)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET labels = excluded.labels, snippet = excluded.snippet
+            """,
+            row,
+        )
+        self._conn.execute(
+            "INSERT INTO messages_fts (id, sender, recipients, subject, snippet) VALUES (?, ?, ?, ?, ?)",
+            (row[0], row[3], row[4], row[5], row[6]),
+        )
+
+    def _delete(self, ids: Iterable[str]) -> None:
+        for message_id in ids:
+            self._conn.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+            self._conn.execute("DELETE FROM messages_fts WHERE id = ?", (message_id,))
+
+    def _save_state(self, history_id: str) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sync_state (id, history_id, last_synced) VALUES (1, ?, ?)",
+            (history_id, time.time()),
+        )
+
+    def get_history_id(self) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT history_id FROM sync_state WHERE id = 1").fetchone()
+        return row["history_id"] if row else None
+
+    def last_synced(self) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute("SELECT last_synced FROM sync_state WHERE id = 1").fetchone()
+        return row["last_synced"] if row else None
+
+    def is_stale(self, max_age: float = GMAIL_MAX_STALENESS) -> bool:
+        last = self.last_synced()
+        return last is None or time.time() - last > max_age
+
+    # --- Queries ---
+
+    @staticmethod
+    def _row_to_message(row: sqlite3.Row) -> Dict:
+        labels = row["labels"].split(",") if row["labels"] else []
+        return {
+            "id": row["id"],
+            "date": row["internal_date"],
+            "from": row["sender"],
+            "subject": row["subject"],
+            "snippet": row["snippet"],
+            "unread": "UNREAD" in labels,
+        }
+
+    def search(
+        self, query: str = "", max_results: int = 10, unread_only: bool = False, since: Optional[float] = None
+    ) -> List[Dict]:
+        """Returns matching messages, best matches first (newest first without a query)."""
+        conditions, params = [], []
+        if unread_only:
+            conditions.append("(',' || m.labels || ',') LIKE '%,UNREAD,%'")
+        if since is not None:
+            conditions.append("m.internal_date >= ?")
+            params.append(since)
+        match = _fts_query(query)
+        if match:
+            sql = (
+                "SELECT m.* FROM messages_fts f JOIN messages m ON m.id = f.id WHERE messages_fts MATCH ?"
+                + "".join(f" AND {c}" for c in conditions)
+                + " ORDER BY bm25(messages_fts, 4.0, 1.0, 8.0, 2.0), m.internal_date DESC LIMIT ?"
+            )
+            params = [match] + params
+        else:
+            sql = (
+                "SELECT m.* FROM messages m"
+                + (" WHERE " + " AND ".join(conditions) if conditions else "")
+                + " ORDER BY m.internal_date DESC LIMIT ?"
+            )
+        with self._lock:
+            rows = self._conn.execute(sql, params + [max_results]).fetchall()
+        return [self._row_to_message(r) for r in rows]
+
+    def count_unread(self, since: Optional[float] = None) -> int:
+        """Counts the unread messages, optionally only those received since `since`."""
+        sql = "SELECT COUNT(*) FROM messages WHERE (',' || labels || ',') LIKE '%,UNREAD,%'"
+        params = []
+        if since is not None:
+            sql += " AND internal_date >= ?"
+            params.append(since)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
+
+    def get(self, message_id: str) -> Optional[Dict]:
+        """Returns a mirrored message with its recipients and downloaded body, if any."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM messages WHERE id = ?", (message_id,)).fetchone()
+        if row is None:
+            return None
+        message = self._row_to_message(row)
+        message.update({"to": row["recipients"], "body": row["body"]})
+        return message
+
+    def fetch_body(self, service, message_id: str, execute: Callable = _execute) -> str:
+        """Downloads a message's body once and keeps it in the mirror."""
+        message = execute(
+            service.users().messages().get(userId="me", id=message_id, format="full", fields="payload")
+        )
+        body = extract_body(message.get("payload", {}))
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE messages SET body = ? WHERE id = ?", (body, message_id))
+        return body
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _local_time(timestamp: float) -> datetime.datetime:
+    # In the user's timezone, like the calendar tools' times.
+    return datetime.datetime.fromtimestamp(timestamp, calendar_tz())
+
+
+def format_messages(messages: List[Dict]) -> str:
+    """Encodes messages as a compact table, one message per line."""
+    if not messages:
+        return "No matching emails."
+    lines = []
+    for m in messages:
+        name, address = parseaddr(m["from"])
+        lines.append(
+            f"{m['id']} | {_local_time(m['date']):%a %d %b %H:%M} | {name or address} | "
+            f"{m['subject']} | {'unread | ' if m['unread'] else ''}{m['snippet']}"
+        )
+    return "\n".join(lines)
+
+
+def format_message(message: Dict, max_chars: int = GMAIL_BODY_MAX_CHARS) -> str:
+    """Renders one message with its headers and (truncated) body."""
+    body = (message.get("body") or message["snippet"]).strip()
+    if len(body) > max_chars:
+        body = body[:max_chars] + " [...]"
+    return "\n".join(
+        [
+            f"From: {message['from']}",
+            f"To: {message['to']}",
+            f"Date: {_local_time(message['date']):%a %d %b %Y %H:%M}",
+            f"Subject: {message['subject']}",
+            "",
+            body,
+        ]
+    )
+
+
+_stores: PerTenant[GmailStore] = PerTenant(lambda chat_id: GmailStore(tenant_path(GMAIL_DB_PATH, chat_id)))
+
+
+def get_gmail_store(chat_id: Optional[str] = None) -> GmailStore:
+    """Returns the Gmail mirror of `chat_id` (by default the current tenant), opening it on first use."""
+    return _stores.get(chat_id)
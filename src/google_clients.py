@@ -0,0 +1,254 @@
+# This file contains the Google credential and API client managers, one per
+# tenant. Credentials are loaded once and refreshed in the background, API
+# clients are built once from the bundled discovery documents, and blocking
+# googleapiclient calls run on a bounded thread pool, shared by all tenants,
+# instead of the event loop.
+
+import os
+import asyncio
+import datetime
+import functools
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httplib2
+import google_auth_httplib2
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request
+
+from src.metrics import GOOGLE_API_ERRORS, GOOGLE_API_SECONDS, span
+from src.resilience import GOOGLE_API_TIMEOUT, GOOGLE_BACKEND
+from src.tenants import OWNER_CHAT_ID, PerTenant, tenant_path
+
+logger = logging.getLogger(__name__)
+
+# If modifying these scopes, delete the file token.json.
+SCOPES = [
+    "https://www.googleapis.com/auth/calendar.readonly",
+    "https://www.googleapis.com/auth/gmail.readonly",
+]
+CREDENTIALS_FILE = os.getenv("GOOGLE_CREDENTIALS_PATH", "credentials.json")
+# The owner's token; other users' tokens are kept under TENANT_DATA_DIR (see setup_google_auth.py).
+TOKEN_FILE = "token.json"
+
+# Maximum number of concurrent blocking Google API calls.
+GOOGLE_API_MAX_WORKERS = int(os.getenv("GOOGLE_API_MAX_WORKERS", "8"))
+# Refresh the access token when it is this close to expiring (seconds).
+GOOGLE_TOKEN_REFRESH_MARGIN = int(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300"))
+# How often the background task checks the token expiry (seconds).
+GOOGLE_TOKEN_CHECK_INTERVAL = int(os.getenv("GOOGLE_TOKEN_CHECK_INTERVAL", "60"))
+
+
+def get_credentials(token_file: str = TOKEN_FILE, interactive: bool = True):
+    """Gets the user's credentials from a file.
+    If credentials are not available or are invalid, it will initiate the
+    OAuth 2.0 flow (only if `interactive`).
+    """
+    creds = None
+    # The file token.json stores the user's access and refresh tokens, and is
+    # created automatically when the authorization flow completes for the first
+    # time.
+    if os.path.exists(token_file):
+        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
+    # If there are no (valid) credentials available, let the user log in.
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            try:
+                creds.refresh(Request())
+            except Exception as e:
+                print(f"Failed to refresh credentials: {e}")
+                return None
+        elif not interactive:
+            print(f"No valid credentials in {token_file}; run setup_google_auth.py for this user.")
+            return None
+        else:
+            try:
+                # This will start a web server to handle the OAuth flow.
+                print("=" * 60)
+                print("GOOGLE CALENDAR AUTHENTICATION REQUIRED")
+                print("=" * 60)
+                print("Starting OAuth flow...")
+                print("A browser window should open automatically.")
+                print("If it doesn't, copy and paste the URL that appears below.")
+                print("=" * 60)
+
+                from google_auth_oauthlib.flow import InstalledAppFlow
+
+                flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
+                creds = flow.run_local_server(port=8080, open_browser=True)
+
+                print("Authentication successful!")
+                print("=" * 60)
+            except Exception as e:
+                print(f"OAuth flow failed: {e}")
+                print("Please ensure:")
+                print("1. credentials.json is in the project root")
+                print("2. You have internet access")
+                print("3. Port 8080 is available")
+                return None
+
+        # Save the credentials for the next run
+        try:
+            with open(token_file, "w") as token:
+                token.write(creds.to_json())
+            print(f"Credentials saved to {token_file}")
+        except Exception as e:
+            print(f"Failed to save credentials: {e}")
+            return None
+
+    return creds
+
+
+class GoogleClientManager:
+    """
+    Holds one user's Google credentials and API clients for the lifetime of
+    the process.
+
+    googleapiclient service objects share one httplib2 connection, which is not
+    thread-safe, so every worker thread executes requests over its own
+    authorized connection.
+    """
+
+    def __init__(
+        self,
+        token_file: str = TOKEN_FILE,
+        interactive: bool = True,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
+        self.token_file = token_file
+        # Only the owner may start the OAuth flow from the server; other users authorize with setup_google_auth.py.
+        self._interactive = interactive
+        self._lock = threading.Lock()
+        self._creds: Optional[Credentials] = None
+        self._services: Dict[Tuple[str, str], Any] = {}
+        self._local = threading.local()
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=GOOGLE_API_MAX_WORKERS, thread_name_prefix="google-api"
+        )
+
+    def available(self) -> bool:
+        """Whether Google access is configured (we're not in test mode)."""
+        return (
+            self._creds is not None
+            or os.path.exists(self.token_file)
+            or (self._interactive and os.path.exists(CREDENTIALS_FILE))
+        )
+
+    def credentials(self) -> Optional[Credentials]:
+        """Returns the in-memory credentials, loading them from disk only once."""
+        with self._lock:
+            if self._creds is None and self.available():
+                self._creds = get_credentials(self.token_file, self._interactive)
+            return self._creds
+
+    def service(self, name: str, version: str):
+        """Returns a cached API client, built from the bundled discovery document."""
+        key = (name, version)
+        with self._lock:
+            if key in self._services:
+                return self._services[key]
+        creds = self.credentials()
+        if creds is None:
+            return None
+        # Imported here: the discovery module is slow to import and only needed once per API.
+        from googleapiclient.discovery import build
+
+        client = build(name, version, credentials=creds, static_discovery=True, cache_discovery=False)
+        with self._lock:
+            return self._services.setdefault(key, client)
+
+    def _thread_http(self) -> google_auth_httplib2.AuthorizedHttp:
+        http = getattr(self._local, "http", None)
+        if http is None:
+            # The socket timeout bounds each attempt; GOOGLE_BACKEND retries and applies the turn deadline.
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials(), http=httplib2.Http(timeout=GOOGLE_API_TIMEOUT))
+            self._local.http = http
+        return http
+
+    def _execute_once(self, request) -> dict:
+        method = getattr(request, "methodId", None) or "batch"
+        with span(GOOGLE_API_SECONDS, "google_api", method=method):
+            try:
+                return request.execute(http=self._thread_http())
+            except Exception:
+                GOOGLE_API_ERRORS.inc(method=method)
+                raise
+
+    def execute_blocking(self, request) -> dict:
+        """Executes a googleapiclient request over this thread's connection, retrying transient errors."""
+        return GOOGLE_BACKEND.call_blocking(lambda: self._execute_once(request))
+
+    async def execute(self, request) -> dict:
+        """Executes a googleapiclient request on the bounded thread pool.
+
+        Single requests may be hedged; a batch is never sent twice at once.
+        """
+        hedge = GOOGLE_BACKEND.hedge and getattr(request, "methodId", None) is not None
+        return await GOOGLE_BACKEND.call(lambda: self.run(self._execute_once, request), hedge=hedge)
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Runs a blocking callable on the bounded thread pool."""
+        loop = asyncio.get_running_loop()
+        # Carry the caller's context (e.g. the current trace) into the worker thread.
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, functools.partial(context.run, fn, *args, **kwargs))
+
+    def refresh_if_needed(self, margin: int = GOOGLE_TOKEN_REFRESH_MARGIN) -> bool:
+        """Refreshes the access token ahead of expiry. Returns True if refreshed."""
+        creds = self.credentials()
+        if creds is None or not creds.refresh_token:
+            return False
+        # google-auth stores expiry as a naive UTC datetime.
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        if creds.expiry and creds.expiry - now > datetime.timedelta(seconds=margin):
+            return False
+
+        creds.refresh(Request())
+        try:
+            with open(self.token_file, "w") as token:
+                token.write(creds.to_json())
+        except OSError as e:
+            logger.warning(f"Failed to save refreshed credentials: {e}")
+        logger.info("Refreshed Google credentials ahead of expiry.")
+        return True
+
+    async def run_refresh_loop(self, interval: int = GOOGLE_TOKEN_CHECK_INTERVAL) -> None:
+        """Keeps the access token fresh so no request pays for a refresh."""
+        while True:
+            try:
+                await self.run(self.refresh_if_needed)
+            except Exception as e:
+                logger.error(f"Background credential refresh failed: {e}", exc_info=True)
+            await asyncio.sleep(interval)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _create_manager(chat_id: str) -> GoogleClientManager:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=GOOGLE_API_MAX_WORKERS, thread_name_prefix="google-api")
+    return GoogleClientManager(
+        tenant_path(TOKEN_FILE, chat_id), interactive=chat_id == OWNER_CHAT_ID, executor=_executor
+    )
+
+
+_managers: PerTenant[GoogleClientManager] = PerTenant(_create_manager)
+
+
+def get_google_clients(chat_id: Optional[str] = None) -> GoogleClientManager:
+    """Returns the Google client manager of `chat_id`, by default the current tenant."""
+    return _managers.get(chat_id)
+
+
+def shutdown_google_clients() -> None:
+    """Stops the worker threads shared by all tenants' managers."""
+    for _, manager in _managers.items():
+        manager.shutdown()
@@ -0,0 +1,94 @@
+# This file contains the conversation history management stage of the
+# LangGraph agent. It keeps the prompt within a token budget by folding older
+# turns into a rolling summary stored in the AgentState.
+
+import os
+import logging
+from typing import Any, Callable, List
+
+from langchain_core.messages import HumanMessage
+from langgraph.config import RunnableConfig
+
+from src.state import AgentState
+from src.prompts import SecretaryPrompts
+from src.resilience import LLM_BACKEND
+
+logger = logging.getLogger(__name__)
+
+# Approximate number of tokens the verbatim history may use before older turns
+# are folded into the summary.
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+# Number of most recent turns that are always sent verbatim.
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "6"))
+
+
+def message_type(m: Any) -> str:
+    """Returns the LangChain type ("human", "ai", "tool", ...) of a message or message dict."""
+    if isinstance(m, dict):
+        m_type = m.get("type") or m.get("role", "")
+        return {"user": "human", "assistant": "ai"}.get(m_type, m_type)
+    return getattr(m, "type", "")
+
+
+def message_text(m: Any) -> str:
+    content = m.get("content", "") if isinstance(m, dict) else getattr(m, "content", "")
+    return content if isinstance(content, str) else str(content or "")
+
+
+def estimate_tokens(messages: List[Any]) -> int:
+    """A cheap token estimate (~4 characters per token plus per-message overhead)."""
+    return sum(len(message_text(m)) // 4 + 4 for m in messages)
+
+
+def format_transcript(messages: List[Any]) -> str:
+    """Renders messages as a plain transcript for the summarizer."""
+    names = {"human": "User", "ai": "Astra", "tool": "Tool result"}
+    lines = []
+    for m in messages:
+        text = message_text(m).strip()
+        if text:
+            lines.append(f"{names.get(message_type(m), message_type(m))}: {text}")
+    return "\n".join(lines)
+
+
+def make_compact_history_node(get_llm: Callable[[], Any]):
+    """Builds the graph node that folds old turns into `AgentState.summary`.
+
+    `get_llm` returns the summarizing model; it is only called when a summary
+    is due, so building the graph does not create the model.
+
+    The node only calls the LLM when the unsummarized history exceeds
+    HISTORY_TOKEN_BUDGET. It then folds everything except the last
+    HISTORY_KEEP_TURNS turns, so the summary is extended incrementally once per
+    budget overflow rather than regenerated on every turn.
+    """
+
+    async def compact_history(state: AgentState, config: RunnableConfig):
+        window = state.messages[state.summarized_upto:]
+        if estimate_tokens(window) + len(state.summary) // 4 <= HISTORY_TOKEN_BUDGET:
+            return {}
+
+        # Turns start at human messages, so cutting there never separates a
+        # tool call from its result.
+        turn_starts = [
+            state.summarized_upto + i for i, m in enumerate(window) if message_type(m) == "human"
+        ]
+        if len(turn_starts) <= HISTORY_KEEP_TURNS:
+            return {}
+        cut = turn_starts[-HISTORY_KEEP_TURNS]
+
+        transcript = format_transcript(state.messages[state.summarized_upto:cut])
+        prompt = SecretaryPrompts.summarize_conversation(state.summary, transcript)
+        try:
+            response = await LLM_BACKEND.call(
+                lambda: get_llm().ainvoke([HumanMessage(content=prompt)], config=config)
+            )
+        except Exception as e:
+            # Sending a longer prompt is better than failing the turn.
+            logger.error(f"Failed to update the conversation summary: {e}", exc_info=True)
+            return {}
+
+        logger.info(f"Folded messages {state.summarized_upto}..{cut} into the conversation summary.")
+        return {"summary": str(response.content).strip(), "summarized_upto": cut}
+
+    return compact_history
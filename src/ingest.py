@@ -0,0 +1,276 @@
+# This file contains the webhook ingestion layer. Raw Telegram updates are
+# persisted to a small SQLite queue and acknowledged immediately; a worker
+# drains the queue in order, and anything left unprocessed after a crash or
+# restart is replayed on startup. Messages stay unfinished until their turn
+# has run, so a restart mid-turn replays them. Updates are deduplicated on update_id. With
+# several worker processes each update is tagged with the shard of its chat,
+# and each worker drains only its own shard of the shared queue.
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from src.sharding import WORKER_COUNT, WORKER_ID, shard_for
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; the single consumer check is skipped there.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+UPDATE_QUEUE_PATH = os.getenv("UPDATE_QUEUE_PATH", "updates.db")
+# Processed updates are kept this long (seconds) to dedupe Telegram's retries.
+UPDATE_RETENTION = int(os.getenv("UPDATE_RETENTION", str(24 * 3600)))
+# How often an idle worker checks for updates queued by the other workers (seconds).
+UPDATE_POLL_INTERVAL = float(os.getenv("UPDATE_POLL_INTERVAL", "0.2"))
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+# Update fields that carry a message, whose chat is the conversation.
+_MESSAGE_FIELDS = ("message", "edited_message", "channel_post", "edited_channel_post", "business_message")
+
+
+def update_thread_id(payload: Dict[str, Any]) -> str:
+    """The conversation a raw update belongs to: its chat, or else its sender."""
+    for field in _MESSAGE_FIELDS:
+        chat = (payload.get(field) or {}).get("chat")
+        if chat:
+            return str(chat["id"])
+    for value in payload.values():
+        if isinstance(value, dict):
+            chat = (value.get("message") or {}).get("chat")  # e.g. a callback query
+            if chat:
+                return str(chat["id"])
+            if value.get("from"):
+                return str(value["from"]["id"])
+    return ""
+
+
+class UpdateQueue:
+    """A durable FIFO of raw Telegram updates, keyed by update_id."""
+
+    def __init__(self, path: str = UPDATE_QUEUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA busy_timeout=5000;
+            CREATE TABLE IF NOT EXISTS updates (
+                update_id INTEGER PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                received_at REAL NOT NULL,
+                processed_at REAL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_updates_status ON updates (status, update_id);
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(updates)")}
+        if "shard" not in columns:
+            # Queues created before sharding: their updates belong to the first worker.
+            self._conn.execute("ALTER TABLE updates ADD COLUMN shard INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_updates_shard ON updates (shard, status, update_id)")
+
+    def enqueue(self, payload: Dict[str, Any], shard: int = 0) -> bool:
+        """Stores an update for the worker `shard`. Returns False if this update_id was seen before."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO updates (update_id, payload, status, received_at, shard) VALUES (?, ?, ?, ?, ?)",
+                (payload["update_id"], json.dumps(payload), PENDING, time.time(), shard),
+            )
+        return cursor.rowcount == 1
+
+    def claim(self, limit: int = 32, shard: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        """Marks the oldest pending updates of `shard` as processing and returns them."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT update_id, payload FROM updates WHERE shard = ? AND status = ? ORDER BY update_id LIMIT ?",
+                    (shard, PENDING, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE updates SET status = ? WHERE update_id = ?",
+                    [(PROCESSING, update_id) for update_id, _ in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(update_id, json.loads(payload)) for update_id, payload in rows]
+
+    def finish(self, update_id: int, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE updates SET status = ?, processed_at = ?, error = ? WHERE update_id = ?",
+                (FAILED if error else DONE, time.time(), error, update_id),
+            )
+
+    def requeue_interrupted(self, shard: int = 0) -> int:
+        """Returns updates of `shard` that were being processed when its worker died to the queue.
+
+        Only the shard's own worker may call this: the other workers' updates may be in progress.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE updates SET status = ? WHERE shard = ? AND status = ?", (PENDING, shard, PROCESSING)
+            )
+        return cursor.rowcount
+
+    def prune(self, retention: int = UPDATE_RETENTION) -> int:
+        """Deletes finished updates older than `retention` seconds."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM updates WHERE status IN (?, ?) AND processed_at < ?",
+                (DONE, FAILED, time.time() - retention),
+            )
+        return cursor.rowcount
+
+    def pending(self, shard: int = 0) -> int:
+        """Updates of `shard` waiting to be claimed."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM updates WHERE shard = ? AND status = ?", (shard, PENDING)
+            ).fetchone()[0]
+
+    def depth(self, shard: Optional[int] = None) -> int:
+        """Updates not yet processed, of one shard or of all of them."""
+        with self._lock:
+            if shard is None:
+                return self._conn.execute(
+                    "SELECT COUNT(*) FROM updates WHERE status IN (?, ?)", (PENDING, PROCESSING)
+                ).fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM updates WHERE shard = ? AND status IN (?, ?)", (shard, PENDING, PROCESSING)
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class UpdateIngestor:
+    """Acknowledges updates as soon as they are queued and processes them in the background."""
+
+    def __init__(
+        self,
+        queue: UpdateQueue,
+        process: Callable[[Dict[str, Any]], Awaitable[None]],
+        shard: int = WORKER_ID,
+        shard_count: int = WORKER_COUNT,
+        poll_interval: float = UPDATE_POLL_INTERVAL,
+    ):
+        self.queue = queue
+        self._process = process
+        self.shard = shard
+        # Alone, a worker is woken by its own webhook; with others it also polls for their updates.
+        self._poll_interval = poll_interval if shard_count > 1 else None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._shard_lock = None
+        self._deferred: Set[int] = set()
+        self._last_prune = 0.0
+
+    def submit(self, payload: Dict[str, Any]) -> bool:
+        """Persists an update for the worker of its chat and wakes it. Returns False for duplicates."""
+        shard = shard_for(update_thread_id(payload))
+        accepted = self.queue.enqueue(payload, shard)
+        if not accepted:
+            logger.info(f"Ignoring duplicate update {payload['update_id']}")
+        elif shard == self.shard:
+            self._wakeup.set()
+        return accepted
+
+    def _lock_shard(self) -> None:
+        """Makes sure no other process drains this shard.
+
+        Two consumers of one shard would run turns of the same chat at once and
+        fork its checkpoints, e.g. under `uvicorn --workers` instead of main.py.
+        """
+        if fcntl is None:
+            return
+        self._shard_lock = open(f"{self.queue.path}.shard{self.shard}.lock", "w")
+        try:
+            fcntl.flock(self._shard_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._shard_lock.close()
+            self._shard_lock = None
+            raise RuntimeError(
+                f"Another process already consumes shard {self.shard} of {self.queue.path}. "
+                "Run several workers through main.py with WEB_CONCURRENCY, which gives each its own WORKER_ID."
+            )
+
+    def start(self) -> None:
+        self._lock_shard()
+        replayed = self.queue.requeue_interrupted(self.shard)
+        if replayed:
+            logger.info(f"Replaying {replayed} updates interrupted by the last shutdown.")
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            batch = self.queue.claim(shard=self.shard)
+            if not batch:
+                self._maybe_prune()
+                self._wakeup.clear()
+                # Re-check after clearing so an update queued in between isn't missed.
+                if not self.queue.pending(self.shard):
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self._poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                continue
+
+            for update_id, payload in batch:
+                try:
+                    await self._process(payload)
+                    if update_id in self._deferred:
+                        # Finished by whoever took it over, once its turn has run.
+                        self._deferred.discard(update_id)
+                    else:
+                        self.queue.finish(update_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error processing update {update_id}: {e}", exc_info=True)
+                    self._deferred.discard(update_id)
+                    self.queue.finish(update_id, error=str(e))
+
+    def defer(self, update_id: int) -> None:
+        """Keeps the update being processed in the queue until `finish` is called for it.
+
+        Until then a crash or restart replays it.
+        """
+        self._deferred.add(update_id)
+
+    def finish(self, update_id: int, error: Optional[str] = None) -> None:
+        """Marks a deferred update as done, or as failed with `error`."""
+        self.queue.finish(update_id, error)
+
+    def _maybe_prune(self) -> None:
+        if time.monotonic() - self._last_prune > 3600:
+            self._last_prune = time.monotonic()
+            pruned = self.queue.prune()
+            if pruned:
+                logger.info(f"Pruned {pruned} processed updates.")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._shard_lock is not None:
+            self._shard_lock.close()
+            self._shard_lock = None
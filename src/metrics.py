@@ -0,0 +1,303 @@
+# This file contains the service's instrumentation: Prometheus-style counters,
+# gauges and histograms rendered in the text exposition format for /metrics,
+# a LangChain callback handler timing graph nodes and LLM calls, and optional
+# per-turn trace spans that log where the time of each reply went.
+
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+# Log a per-turn breakdown of spans (nodes, LLM and Google calls, checkpoints).
+METRICS_TRACE = os.getenv("METRICS_TRACE", "false").lower() == "true"
+
+# Seconds; covers SQLite writes (ms) up to slow LLM turns (tens of seconds).
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(values: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in values.items()))
+
+
+def _format_labels(labels: Labels, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in values]
+
+
+class Gauge(_Metric):
+    """A gauge whose value is read from a callback when metrics are rendered."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        super().__init__(name, help)
+        self._read = read
+
+    def _samples(self) -> List[str]:
+        try:
+            return [f"{self.name} {_format_value(self._read())}"]
+        except Exception as e:
+            logger.debug(f"Failed to read gauge {self.name}: {e}")
+            return []
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts, sum, count)
+        self._series: Dict[Labels, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            counts, total, count = self._series.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._series[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = [(k, list(c), s, n) for k, (c, s, n) in self._series.items()]
+        lines = []
+        for labels, counts, total, count in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = [("le", repr(float(bound)))]
+                lines.append(f"{self.name}_bucket{_format_labels(labels, le)} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.register(Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        # Re-registering replaces the callback, e.g. when the app is re-created.
+        self._metrics[name] = Gauge(name, help, read)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        return "\n".join(line for metric in list(self._metrics.values()) for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+WEBHOOK_REQUESTS = REGISTRY.counter("astra_webhook_requests_total", "Telegram webhook requests by HTTP status.")
+WEBHOOK_SECONDS = REGISTRY.histogram("astra_webhook_seconds", "Time to acknowledge a Telegram webhook request.")
+TURN_SECONDS = REGISTRY.histogram(
+    "astra_turn_seconds",
+    "Time from the start of a turn to the complete reply, by outcome.",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60, 120),
+)
+NODE_SECONDS = REGISTRY.histogram("astra_graph_node_seconds", "Time spent in each LangGraph node.")
+LLM_SECONDS = REGISTRY.histogram("astra_llm_seconds", "LLM call latency by model.")
+LLM_TOKENS = REGISTRY.counter("astra_llm_tokens_total", "LLM tokens by model and direction (input/output).")
+LLM_ERRORS = REGISTRY.counter("astra_llm_errors_total", "Failed LLM calls by model.")
+GOOGLE_API_SECONDS = REGISTRY.histogram("astra_google_api_seconds", "Google API request latency by method.")
+GOOGLE_API_ERRORS = REGISTRY.counter("astra_google_api_errors_total", "Failed Google API requests by method.")
+CHECKPOINT_SECONDS = REGISTRY.histogram("astra_checkpoint_seconds", "Checkpointer operation latency by operation.")
+
+
+# --- Trace spans ---
+
+
+@dataclass
+class Trace:
+    name: str
+    started: float = field(default_factory=time.perf_counter)
+    # (span name, start offset, duration) in seconds
+    spans: List[Tuple[str, float, float]] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, name: str, started: float, duration: float) -> None:
+        with self._lock:
+            self.spans.append((name, started - self.started, duration))
+
+    def summary(self) -> str:
+        total = time.perf_counter() - self.started
+        totals: Dict[str, Tuple[float, int]] = {}
+        for name, _, duration in self.spans:
+            spent, calls = totals.get(name, (0.0, 0))
+            totals[name] = (spent + duration, calls + 1)
+        parts = [
+            f"{name} {spent * 1000:.0f}ms" + (f" x{calls}" if calls > 1 else "")
+            for name, (spent, calls) in totals.items()
+        ]
+        return f"Trace {self.name}: total {total * 1000:.0f}ms | " + " | ".join(parts)
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("astra_trace", default=None)
+
+
+@contextmanager
+def trace(name: str, enabled: bool = METRICS_TRACE) -> Iterator[Optional[Trace]]:
+    """Collects the spans recorded in this context (and tasks started from it) and logs them at the end."""
+    if not enabled:
+        yield None
+        return
+    current = Trace(name)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+        logger.info(current.summary())
+
+
+def record_span(name: str, started: float, duration: float) -> None:
+    current = _current_trace.get()
+    if current is not None:
+        current.add(name, started, duration)
+
+
+@contextmanager
+def span(histogram: Histogram, span_name: str, **labels) -> Iterator[None]:
+    """Times a block into `histogram` and, when tracing, into the current trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        histogram.observe(duration, **labels)
+        record_span(span_name, started, duration)
+
+
+# --- LangChain callbacks ---
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Times LangGraph nodes and chat model calls, and counts LLM tokens."""
+
+    # Run in the caller's context so spans reach the current trace.
+    run_inline = True
+
+    def __init__(self):
+        self._runs: Dict[Any, Tuple[str, str, float]] = {}
+        self._lock = threading.Lock()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # Only the node's own run, not the runnables inside it.
+        if node and kwargs.get("name") == node:
+            with self._lock:
+                self._runs[run_id] = ("node", node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish_node(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish_node(run_id)
+
+    def _finish_node(self, run_id) -> None:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run:
+            _, node, started = run
+            duration = time.perf_counter() - started
+            NODE_SECONDS.observe(duration, node=node)
+            record_span(node, started, duration)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, invocation_params=None, **kwargs):
+        params = invocation_params or {}
+        model = (metadata or {}).get("ls_model_name") or params.get("model") or params.get("model_name") or "unknown"
+        with self._lock:
+            self._runs[run_id] = ("llm", str(model), time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if not run:
+            return
+        _, model, started = run
+        duration = time.perf_counter() - started
+        LLM_SECONDS.observe(duration, model=model)
+        record_span("llm", started, duration)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                if usage:
+                    LLM_TOKENS.inc(usage.get("input_tokens", 0), model=model, direction="input")
+                    LLM_TOKENS.inc(usage.get("output_tokens", 0), model=model, direction="output")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run:
+            LLM_ERRORS.inc(model=run[1])
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
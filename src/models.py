@@ -0,0 +1,158 @@
+# This file contains model tiering. Each LLM call goes to the fast (flash) or
+# the strong (pro) Gemini model according to simple, configurable rules: the
+# node making the call, whether it only has to phrase tool results, the
+# length and kind of the request, and escalation to the strong model when the
+# fast one gives an unusable or unsure answer. Every decision is logged and
+# counted so the rules can be tuned.
+
+import os
+import re
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from src.metrics import REGISTRY
+from src.streaming import content_text
+
+logger = logging.getLogger(__name__)
+
+FAST, STRONG = "fast", "strong"
+
+MODEL_TIERING = os.getenv("MODEL_TIERING", "true").lower() == "true"
+FAST_MODEL = os.getenv("FAST_MODEL", "gemini-2.5-flash")
+STRONG_MODEL = os.getenv("STRONG_MODEL", "gemini-2.5-pro-preview-06-05")
+# Requests longer than this (words) go to the strong model.
+TIERING_MAX_FAST_WORDS = int(os.getenv("TIERING_MAX_FAST_WORDS", "30"))
+# Tools whose results the fast model phrases; results of other tools go to the strong model.
+TIERING_FAST_TOOLS = {
+    name.strip()
+    for name in os.getenv(
+        "TIERING_FAST_TOOLS",
+        "list_calendar_events,list_events_all_calendars,check_availability,search_emails,read_email,summarize_inbox",
+    ).split(",")
+    if name.strip()
+}
+
+# Requests that need planning, writing or reasoning rather than a lookup.
+_STRONG_REQUEST = re.compile(
+    os.getenv(
+        "TIERING_STRONG_PATTERN",
+        r"\b(draft|write|compose|rewrite|plan|prioriti[sz]e|compare|analy[sz]e|explain|why|advise|suggest|"
+        r"recommend|decide|reschedule|negotiate|strategy|pros and cons|think)\b",
+    ),
+    re.IGNORECASE,
+)
+# A fast answer that sounds like this is retried with the strong model. Clarifying
+# questions are not listed: the system prompt asks for them on ambiguous requests.
+_UNSURE_ANSWER = re.compile(
+    r"\b(i'?m not sure|i am not sure|i don'?t know|i'?m unable to|i am unable to|i can'?t (help|determine|tell)|"
+    r"i don'?t have enough)\b",
+    re.IGNORECASE,
+)
+
+MODEL_DECISIONS = REGISTRY.counter("astra_model_decisions_total", "Model tier decisions by node, tier and reason.")
+
+
+@dataclass
+class ModelChoice:
+    tier: str
+    model: str
+    reason: str
+
+
+class ModelRouter:
+    """Picks the model tier of each LLM call."""
+
+    def __init__(
+        self,
+        enabled: bool = MODEL_TIERING,
+        models: Optional[Dict[str, str]] = None,
+        max_fast_words: int = TIERING_MAX_FAST_WORDS,
+        fast_tools=frozenset(TIERING_FAST_TOOLS),
+    ):
+        self.enabled = enabled
+        self.models = models or {FAST: FAST_MODEL, STRONG: STRONG_MODEL}
+        self.max_fast_words = max_fast_words
+        self.fast_tools = set(fast_tools)
+
+    def _choose(self, node: str, tier: str, reason: str) -> ModelChoice:
+        if not self.enabled:
+            tier, reason = STRONG, "tiering disabled"
+        choice = ModelChoice(tier, self.models[tier], reason)
+        MODEL_DECISIONS.inc(node=node, tier=choice.tier, reason=choice.reason)
+        logger.info(f"Model for {node}: {choice.model} ({choice.reason})")
+        return choice
+
+    def for_summary(self) -> ModelChoice:
+        """Folding old turns into the summary is condensing text the fast model does well."""
+        return self._choose("history", FAST, "summary")
+
+    def for_agent(self, messages: List[BaseMessage]) -> ModelChoice:
+        """Picks the model for the next agent call from the messages of the current turn."""
+        start = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+        turn = messages[start:]
+        # Coalesced messages of one turn arrive as one human message.
+        request = content_text(turn[0].content) if turn and isinstance(turn[0], HumanMessage) else ""
+
+        if any(isinstance(m, AIMessage) and m.response_metadata.get("model_tier") == STRONG for m in turn):
+            return self._choose("agent", STRONG, "strong model earlier in the turn")
+        if turn and isinstance(turn[-1], ToolMessage):
+            results = {m.name for m in turn if isinstance(m, ToolMessage)}
+            if results <= self.fast_tools:
+                return self._choose("agent", FAST, "phrasing tool results")
+            return self._choose("agent", STRONG, "tool results need reasoning")
+        if _STRONG_REQUEST.search(request):
+            return self._choose("agent", STRONG, "complex request")
+        if request.count("?") > 1:
+            return self._choose("agent", STRONG, "several questions")
+        if len(request.split()) > self.max_fast_words:
+            return self._choose("agent", STRONG, "long request")
+        return self._choose("agent", FAST, "short request")
+
+    def escalation(self, choice: ModelChoice, response: AIMessage) -> Optional[ModelChoice]:
+        """Returns the strong model if the fast model's answer should not be used."""
+        if choice.tier != FAST or not self.enabled:
+            return None
+        text = content_text(response.content).strip()
+        if response.invalid_tool_calls:
+            reason = "escalated: invalid tool call"
+        elif not text and not response.tool_calls:
+            reason = "escalated: empty answer"
+        elif not response.tool_calls and _UNSURE_ANSWER.search(text):
+            reason = "escalated: unsure answer"
+        else:
+            return None
+        return self._choose("agent", STRONG, reason)
+
+
+class ModelTiers:
+    """Creates the model of each tier on first use, with and without the tools bound."""
+
+    def __init__(self, create: Callable[[str], Any], tools: List, models: Optional[Dict[str, str]] = None):
+        self._create = create
+        self._tools = tools
+        self.names = models or {FAST: FAST_MODEL, STRONG: STRONG_MODEL}
+        self._models: Dict[str, Any] = {}
+        self._bound: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def model(self, tier: str):
+        with self._lock:
+            if tier not in self._models:
+                self._models[tier] = self._create(self.names[tier])
+            return self._models[tier]
+
+    def with_tools(self, tier: str):
+        if tier not in self._bound:
+            bound = self.model(tier).bind_tools(self._tools)
+            with self._lock:
+                self._bound.setdefault(tier, bound)
+        return self._bound[tier]
+
+    def warm(self, tiers: List[str]) -> None:
+        """Creates the given tiers' models ahead of the first call (blocking)."""
+        for tier in tiers:
+            self.with_tools(tier)
@@ -0,0 +1,377 @@
+# This file contains the outbound Telegram sender. Every message and edit goes
+# through it: token buckets keep us under Telegram's global and per-chat flood
+# limits, replies to the user get tokens before background notifications and
+# never wait behind progress edits, which have a budget of their own,
+# long texts are split into message-sized chunks at paragraph and code block
+# boundaries, and RetryAfter responses are waited out and the call repeated.
+
+import os
+import re
+import time
+import heapq
+import asyncio
+import datetime
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+from telegram import Bot, Message
+from telegram.error import RetryAfter
+
+from src.metrics import REGISTRY
+from src.sharding import WORKER_COUNT
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows about 30 messages per second overall and about one per
+# second in a chat (short bursts are tolerated). The global budget is for the
+# whole bot and is split between the worker processes; a chat lives on one worker.
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_GLOBAL_BURST = int(os.getenv("TELEGRAM_GLOBAL_BURST", "25"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+# Edits of the bot's own messages (streaming progress) are paced separately.
+TELEGRAM_CHAT_EDIT_RATE = float(os.getenv("TELEGRAM_CHAT_EDIT_RATE", "1"))
+TELEGRAM_CHAT_EDIT_BURST = int(os.getenv("TELEGRAM_CHAT_EDIT_BURST", "3"))
+# How often one call is repeated after RetryAfter before giving up.
+TELEGRAM_RETRY_AFTER_ATTEMPTS = int(os.getenv("TELEGRAM_RETRY_AFTER_ATTEMPTS", "5"))
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+# Lower values get tokens first.
+PRIORITY_REPLY = 0
+PRIORITY_EDIT = 1
+PRIORITY_NOTIFICATION = 2
+
+# Chats whose lanes are kept around after their last message.
+_MAX_IDLE_CHATS = 1000
+
+TELEGRAM_CALLS = REGISTRY.counter("astra_telegram_calls_total", "Outbound Telegram calls by priority.")
+TELEGRAM_RETRY_AFTER = REGISTRY.counter("astra_telegram_retry_after_total", "RetryAfter (429) responses from Telegram.")
+
+T = TypeVar("T")
+
+
+# --- Chunking ---
+
+
+def _utf16_len(text: str) -> int:
+    # Telegram counts message length in UTF-16 code units.
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _prefix_within(text: str, limit: int) -> int:
+    """The number of characters of `text` that fit in `limit` UTF-16 code units."""
+    used = 0
+    for i, char in enumerate(text):
+        used += 2 if ord(char) > 0xFFFF else 1
+        if used > limit:
+            return i
+    return len(text)
+
+
+def _open_fence(text: str) -> Optional[re.Match]:
+    """Returns the opening line of a ``` code block left open at the end of `text`."""
+    fence = None
+    for match in re.finditer(r"^[ \t]*```[^\n]*$", text, re.MULTILINE):
+        fence = None if fence else match
+    return fence
+
+
+def split_message(text: str, limit: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> List[str]:
+    """
+    Splits `text` into chunks of at most `limit` UTF-16 code units.
+
+    Cuts go at the last paragraph break that fits, else a line break, a
+    sentence end or a space. A code block is moved whole to the next chunk
+    if it fits there; one that is too long is closed at the cut and reopened
+    in the next chunk.
+    """
+    chunks = []
+    text = text.strip()
+    while _utf16_len(text) > limit:
+        # Leave room to close a code block.
+        window = text[:_prefix_within(text, limit - 4)]
+        # A chunk that starts with a reopened code block keeps at least its first line.
+        floor = text.find("\n") if text.startswith("```") else 0
+        cut = 0
+        for separator in ("\n\n", "\n", ". ", " "):
+            index = window.rfind(separator)
+            if index > floor:
+                cut = index + (1 if separator == ". " else 0)
+                break
+        cut = cut or len(window)
+
+        fence = _open_fence(text[:cut])
+        if fence is not None and fence.start() > 0:
+            remaining = text[fence.start():]
+            closing = re.search(r"^[ \t]*```[ \t]*$", remaining[fence.end() - fence.start():], re.MULTILINE)
+            block_length = fence.end() - fence.start() + closing.end() if closing else len(remaining)
+            if _utf16_len(remaining[:block_length]) <= limit:
+                # The code block fits in a chunk of its own.
+                cut = fence.start()
+                fence = None
+
+        head, text = text[:cut].rstrip(), text[cut:]
+        # Drop the separator, but not the indentation of the next line.
+        text = text[1:] if text.startswith(" ") else text.lstrip("\n")
+        if fence is not None:
+            head += "\n```"
+            text = fence.group(0).strip() + "\n" + text
+        if head:
+            chunks.append(head)
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+# --- Rate limiting ---
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average and bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def take(self) -> float:
+        """Takes a token and returns 0, or returns the seconds until one is available."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def spend(self) -> None:
+        """Takes a token without waiting, going into debt if there is none."""
+        if self.take() > 0:
+            self._tokens -= 1
+
+    @property
+    def full(self) -> bool:
+        return self._tokens + (time.monotonic() - self._updated) * self.rate >= self.capacity
+
+
+class _Lane:
+    """A lock that goes to waiters in priority order, first come first served within a priority."""
+
+    def __init__(self):
+        self._held = False
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = 0
+
+    def locked(self) -> bool:
+        return self._held or bool(self._waiters)
+
+    async def acquire(self, priority: int) -> None:
+        if not self.locked():
+            self._held = True
+            return
+        granted = asyncio.get_running_loop().create_future()
+        self._sequence += 1
+        heapq.heappush(self._waiters, (priority, self._sequence, granted))
+        try:
+            await granted
+        except asyncio.CancelledError:
+            # Handed the lane just as we were cancelled: pass it on.
+            if granted.done() and not granted.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, granted = heapq.heappop(self._waiters)
+            if not granted.done():
+                granted.set_result(None)  # The lane stays held, by the waiter.
+                return
+        self._held = False
+
+
+class _Chat:
+    def __init__(self, rate: float, capacity: float, edit_rate: float, edit_capacity: float):
+        # Keeps each chat's messages in order, replies ahead of notifications.
+        self.lock = _Lane()
+        self.bucket = TokenBucket(rate, capacity)
+        self.edits = TokenBucket(edit_rate, edit_capacity)
+
+    @property
+    def idle(self) -> bool:
+        return not self.lock.locked() and self.bucket.full and self.edits.full
+
+
+class OutboundSender:
+    """
+    Sends every Telegram message and edit under the global and per-chat rate
+    limits. Sends to one chat run one at a time, replies before waiting
+    notifications; across chats the global tokens go to the waiting call with
+    the lowest priority value.
+
+    The first message of a reply doesn't wait for the chat's bucket, which may
+    go into debt: it answers the user's own message, and the sends after it
+    back off instead. Further chunks wait like any other send. Edits wait on a
+    separate per-chat bucket, except the final edit of a reply (PRIORITY_REPLY).
+    """
+
+    def __init__(
+        self,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        global_burst: int = TELEGRAM_GLOBAL_BURST,
+        chat_rate: float = TELEGRAM_CHAT_RATE,
+        chat_burst: int = TELEGRAM_CHAT_BURST,
+        chat_edit_rate: float = TELEGRAM_CHAT_EDIT_RATE,
+        chat_edit_burst: int = TELEGRAM_CHAT_EDIT_BURST,
+        retry_after_attempts: int = TELEGRAM_RETRY_AFTER_ATTEMPTS,
+    ):
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chat_edit_rate = chat_edit_rate
+        self._chat_edit_burst = chat_edit_burst
+        self._retry_after_attempts = retry_after_attempts
+        self._chats: "OrderedDict[int, _Chat]" = OrderedDict()
+        self._waiting: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._sequence = 0
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def waiting(self) -> int:
+        return self._waiting.qsize()
+
+    async def _global_token(self, priority: int) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        granted = asyncio.get_running_loop().create_future()
+        self._sequence += 1
+        await self._waiting.put((priority, self._sequence, granted))
+        await granted
+
+    async def _dispatch(self) -> None:
+        """Hands out global tokens, highest priority first."""
+        while True:
+            _, _, granted = await self._waiting.get()
+            if granted.done():  # The caller gave up.
+                continue
+            while (delay := self._global.take()) > 0:
+                await asyncio.sleep(delay)
+            if not granted.done():
+                granted.set_result(None)
+
+    def _chat(self, chat_id: int) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(
+                self._chat_rate, self._chat_burst, self._chat_edit_rate, self._chat_edit_burst
+            )
+        self._chats.move_to_end(chat_id)
+        if len(self._chats) > _MAX_IDLE_CHATS:
+            for idle_id, idle in list(self._chats.items())[: len(self._chats) - _MAX_IDLE_CHATS]:
+                if idle.idle:
+                    del self._chats[idle_id]
+        return chat
+
+    @asynccontextmanager
+    async def _lane(self, chat_id: int, priority: int) -> AsyncIterator[TokenBucket]:
+        """Holds the chat's lane and yields its message bucket."""
+        chat = self._chat(chat_id)
+        await chat.lock.acquire(priority)
+        try:
+            yield chat.bucket
+        finally:
+            chat.lock.release()
+
+    async def _send(
+        self, bucket: TokenBucket, call: Callable[[], Awaitable[T]], priority: int, wait: bool = True
+    ) -> T:
+        """Makes one call once the chat's bucket and the global one allow it, repeating it after RetryAfter.
+
+        With `wait` False the first attempt spends the chat's token without waiting for it.
+        """
+        attempt = 0
+        while True:
+            if not wait and attempt == 0:
+                bucket.spend()
+            else:
+                while (delay := bucket.take()) > 0:
+                    await asyncio.sleep(delay)
+            await self._global_token(priority)
+            TELEGRAM_CALLS.inc(priority=priority)
+            try:
+                return await call()
+            except RetryAfter as e:
+                if attempt >= self._retry_after_attempts:
+                    raise
+                attempt += 1
+                TELEGRAM_RETRY_AFTER.inc()
+                wait = e.retry_after.total_seconds() if isinstance(e.retry_after, datetime.timedelta) else float(e.retry_after)
+                logger.warning(f"Telegram flood control, retrying in {wait:.0f}s")
+                # Waited in place (inside the chat's lane for notifications), so later messages keep their order.
+                await asyncio.sleep(wait)
+
+    async def call(self, chat_id: int, call: Callable[[], Awaitable[T]], priority: int = PRIORITY_REPLY) -> T:
+        """Makes one Bot API call for `chat_id` under the rate limits."""
+        async with self._lane(chat_id, priority) as bucket:
+            return await self._send(bucket, call, priority, wait=priority != PRIORITY_REPLY)
+
+    async def reply(
+        self, message: Message, text: str, priority: int = PRIORITY_REPLY, continued: bool = False
+    ) -> List[Message]:
+        """Replies to `message`, in several messages if `text` is too long for one.
+
+        `continued` marks the rest of a reply whose first message was already
+        sent, so no chunk skips the chat's bucket.
+        """
+        first_waits = continued or priority != PRIORITY_REPLY
+        async with self._lane(message.chat_id, priority) as bucket:
+            return [
+                await self._send(
+                    bucket, lambda chunk=chunk: message.reply_text(chunk), priority, wait=first_waits or i > 0
+                )
+                for i, chunk in enumerate(split_message(text))
+            ]
+
+    async def send(
+        self, bot: Bot, chat_id: int, text: str, priority: int = PRIORITY_NOTIFICATION
+    ) -> List[Message]:
+        """Sends `text` to a chat, e.g. a notification, in several messages if needed."""
+        async with self._lane(int(chat_id), priority) as bucket:
+            return [
+                await self._send(bucket, lambda chunk=chunk: bot.send_message(chat_id=chat_id, text=chunk), priority)
+                for chunk in split_message(text)
+            ]
+
+    async def edit(self, message: Message, text: str, priority: int = PRIORITY_EDIT):
+        """Replaces the text of a message the bot sent, paced by the chat's edit bucket."""
+        bucket = self._chat(message.chat_id).edits
+        return await self._send(bucket, lambda: message.edit_text(text), priority, wait=priority != PRIORITY_REPLY)
+
+    async def aclose(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        # Locks and queues belong to the event loop that is closing.
+        self._waiting = asyncio.PriorityQueue()
+        self._chats.clear()
+
+
+_sender: Optional[OutboundSender] = None
+
+
+def get_outbound_sender() -> OutboundSender:
+    """Returns the process-wide outbound sender."""
+    global _sender
+    if _sender is None:
+        _sender = OutboundSender(
+            global_rate=TELEGRAM_GLOBAL_RATE / WORKER_COUNT,
+            global_burst=max(1, TELEGRAM_GLOBAL_BURST // WORKER_COUNT),
+        )
+    return _sender
+
+
+REGISTRY.gauge(
+    "astra_outbound_waiting", "Telegram calls waiting for a global token.",
+    lambda: get_outbound_sender().waiting(),
+)
@@ -0,0 +1,91 @@
+# This file contains speculative calendar prefetching. When an incoming
+# message looks like a schedule question, the calendar refresh starts right
+# away and runs concurrently with the first LLM call; the calendar tool then
+# awaits the in-flight (or finished) prefetch instead of starting its own.
+
+import os
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from src.router import classify
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+# Minimum router confidence for starting a speculative fetch. Lower than the
+# fast-path threshold: a wasted prefetch only costs a background sync.
+PREFETCH_MIN_CONFIDENCE = float(os.getenv("PREFETCH_MIN_CONFIDENCE", "0.5"))
+
+
+@dataclass
+class _Prefetch:
+    task: asyncio.Task
+    used: bool = False
+
+
+class CalendarPrefetcher:
+    """Tracks one speculative calendar fetch per conversation thread."""
+
+    def __init__(self, min_confidence: float = PREFETCH_MIN_CONFIDENCE):
+        self._min_confidence = min_confidence
+        self._inflight: Dict[str, _Prefetch] = {}
+        self.started = 0
+        self.hits = 0
+        self.wasted = 0
+
+    def start(self, thread_id: str, text: str, fetch: Callable[[], Awaitable[Any]]) -> bool:
+        """Starts `fetch` if the message is likely to need the calendar."""
+        intent = classify(text)
+        if intent is None or intent.confidence < self._min_confidence or thread_id in self._inflight:
+            return False
+        self._inflight[thread_id] = _Prefetch(asyncio.create_task(fetch()))
+        self.started += 1
+        return True
+
+    async def claim(self, thread_id: str) -> bool:
+        """Waits for the thread's prefetch. Returns False if none was started."""
+        prefetch = self._inflight.get(thread_id)
+        if prefetch is None or prefetch.task.cancelled():
+            return False
+        prefetch.used = True
+        try:
+            # Shielded so a cancelled tool call doesn't cancel a fetch others may share.
+            await asyncio.shield(prefetch.task)
+        except Exception as e:
+            logger.warning(f"Calendar prefetch failed: {e}")
+            return False
+        return True
+
+    def finish(self, thread_id: str) -> None:
+        """Ends the turn: records a hit or waste and cancels an unused prefetch."""
+        prefetch = self._inflight.pop(thread_id, None)
+        if prefetch is None:
+            return
+        if prefetch.used:
+            self.hits += 1
+        else:
+            self.wasted += 1
+            prefetch.task.cancel()
+        logger.info(f"Calendar prefetch {'hit' if prefetch.used else 'wasted'}; {self.stats()}")
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.hits + self.wasted
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "wasted": self.wasted,
+            "hit_rate": round(self.hits / finished, 3) if finished else None,
+        }
+
+
+_prefetcher: Optional[CalendarPrefetcher] = None
+
+
+def get_prefetcher() -> CalendarPrefetcher:
+    """Returns the process-wide calendar prefetcher."""
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = CalendarPrefetcher()
+    return _prefetcher
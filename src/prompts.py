@@ -1,5 +1,7 @@
 from datetime import datetime
 
+from src.calendar import calendar_now
+
 class SecretaryPrompts:
     """
     A collection of prompts for the personal secretary assistant, Astra.
@@ -15,19 +17,10 @@ class SecretaryPrompts:
     and an expert in clear, concise communication.
     """
 
-    @staticmethod
-    def get_system_prompt() -> str:
-        """
-        Generates the full system prompt by combining the static persona with
-        dynamic information like the current date and time.
-        """
-        current_time = datetime.now()
-        
-        # Dynamic context that changes with each session
-        dynamic_context = f"""
-It is currently {current_time.strftime('%A, %B %d, %Y at %I:%M %p')}.
-Today is {current_time.strftime('%A, %B %d, %Y')}.
-
+    # Standing instructions. Like the persona, they contain nothing volatile
+    # (such as the current time), so the prompt prefix is byte-identical on every
+    # request and provider-side prefix/context caching can hit.
+    KEY_INSTRUCTIONS = """
 Key Instructions:
 - When asked about schedules or events, always provide comprehensive details, 
   including start and end times, location, and a brief summary.
@@ -39,42 +32,112 @@ Key Instructions:
   any pending tasks or important emails related to their day.
 - Maintain a professional yet approachable tone at all times.
 - You have access to a set of tools to get information. When you use a tool, 
-  you will be given information back. Use this information to answer the user's questions."""
-        
-        # Combine the static persona with the dynamic context
-        return f"{SecretaryPrompts.SYSTEM_PERSONA}\\n\\n{dynamic_context}"
+  you will be given information back. Use this information to answer the user's questions.
+- The current date and time are given in a context note at the end of the conversation."""
+
+    # How tool results are encoded in the conversation and how to present
+    # them. Stated once here instead of being repeated in every tool result.
+    TOOL_RESULT_INSTRUCTIONS = """
+Tool results:
+- Each tool result starts with a reference like "#3:". A later result may just
+  say "Same result as #3." or an older one "Superseded by #5."; use the result it refers to.
+- Calendar events come as a table, one event per line:
+  date | time | title | calendar | relative day
+  Times are in the event's own timezone; "all day" marks all-day events, and the
+  relative day ("today", "in 3 days") is relative to the "as of" time in the header.
+- Present events in a friendly, well-formatted way: a markdown bullet per event
+  with its title in bold and its start and end written out for people
+  (e.g. "Monday, June 17th, 2:00 PM - 3:00 PM"); say clearly when an event lasts all day.
+- If a calendar result reports an error or no events, tell the user."""
+
+    # The precompiled static prefix sent at the start of every request.
+    STATIC_PROMPT = f"{SYSTEM_PERSONA.strip()}\n{KEY_INSTRUCTIONS}\n{TOOL_RESULT_INSTRUCTIONS}"
+
+    @staticmethod
+    def get_static_prompt() -> str:
+        """
+        Returns the stable part of the system prompt: the persona and the
+        standing instructions.
+        """
+        return SecretaryPrompts.STATIC_PROMPT
+
+    @staticmethod
+    def get_dynamic_context(now: datetime = None) -> str:
+        """
+        Generates the volatile context (the current date and time, in the
+        user's timezone) that is sent at the end of the request, after the
+        cacheable prefix and history.
+        """
+        current_time = now or calendar_now()
+        return f"""[Context note, not written by the user]
+It is currently {current_time.strftime('%A, %B %d, %Y at %I:%M %p')}.
+Today is {current_time.strftime('%A, %B %d, %Y')}."""
+
+    @staticmethod
+    def get_system_prompt() -> str:
+        """
+        Generates the full system prompt by combining the static persona with
+        dynamic information like the current date and time.
+        """
+        return f"{SecretaryPrompts.get_static_prompt()}\n\n{SecretaryPrompts.get_dynamic_context()}"
 
     @staticmethod
-    def summarize_calendar_events(events: list) -> str:
+    def format_calendar_events(events: list, now: datetime = None) -> str:
         """
-        Creates a prompt to summarize a list of calendar events.
+        Encodes a list of calendar events as a compact table (see
+        TOOL_RESULT_INSTRUCTIONS for how the model reads it). A result with a
+        note (partial or offline results) keeps the note below the table.
         """
-        if not events or "error" in events:
-            return "There was an error accessing the calendar, or there are no upcoming events. Please inform the user."
+        if isinstance(events, dict) and "note" in events:
+            table = SecretaryPrompts.format_calendar_events(events.get("events", []), now)
+            return f"{table}\nNote: {events['note']}"
+        if not isinstance(events, list) or not events:
+            return "Calendar error or no events found."
+
+        now = now or calendar_now()
+        lines = [f"{len(events)} event{'s' if len(events) != 1 else ''} as of {now:%a %d %b %H:%M}"]
+        for event in events:
+            start = datetime.fromisoformat(event["start"].replace("Z", "+00:00"))
+            end = datetime.fromisoformat(event["end"].replace("Z", "+00:00"))
+            if event.get("is_all_day"):
+                # All-day end dates are exclusive.
+                last = end.toordinal() - 1
+                when = f"{start:%a %d %b}" + (f"-{datetime.fromordinal(last):%a %d %b}" if last > start.toordinal() else "")
+                hours = "all day"
+                days = start.toordinal() - now.toordinal()
+            else:
+                # Shown in the user's timezone, whatever the event's own offset.
+                start, end = start.astimezone(now.tzinfo), end.astimezone(now.tzinfo)
+                when = f"{start:%a %d %b}"
+                hours = f"{start:%H:%M}-{end:%H:%M}" + (f" (ends {end:%a %d %b})" if end.date() != start.date() else "")
+                days = start.toordinal() - now.toordinal()
+            relative = {-1: "yesterday", 0: "today", 1: "tomorrow"}.get(days)
+            if relative is None:
+                relative = f"in {days} days" if days > 0 else f"{-days} days ago"
+            lines.append(f"{when} | {hours} | {event['summary']} | {event.get('calendar', '')} | {relative}")
+        return "\n".join(lines)
 
-        # Convert the list of event dictionaries into a readable format for the AI
-        events_str = "\\n".join([f"- {event['summary']} (Starts: {event['start']}, Ends: {event['end']})" for event in events])
+    @staticmethod
+    def summarize_conversation(previous_summary: str, transcript: str) -> str:
+        """
+        Creates a prompt that extends the rolling conversation summary with
+        turns that no longer fit in the verbatim history.
+        """
+        previous = previous_summary.strip() or "(no earlier summary)"
 
         return f"""
-You have retrieved the user's calendar events. Now, present them in a clear, friendly, and well-formatted way.
+You are maintaining a running summary of a conversation between a user and their personal secretary, Astra.
+
+Summary so far:
+{previous}
 
-Here is the raw data for the upcoming events:
-{events_str}
+Newer part of the conversation to fold into the summary:
+{transcript}
 
 Your Task:
-- Summarize these events for the user.
-- Use a friendly tone, addressing the user directly.
-- Format the output nicely using markdown (e.g., bullet points).
-- For each event, clearly state the summary (title), the start time, and the end time.
-- Convert the ISO-formatted dates and times into a more human-readable format (e.g., "Monday, June 17th at 2:00 PM"). You are an expert at this.
-- If an event is an all-day event, state that clearly.
-
-Example of a good response:
-"Of course! Here are your upcoming events:
-
-*   **Team Sync-Up**
-    *   Starts: Monday, June 17th at 2:00 PM
-    *   Ends: Monday, June 17th at 3:00 PM
-*   **Project Deadline**
-    *   This is an all-day event on Tuesday, June 18th."
-""" 
\ No newline at end of file
+- Write an updated summary that covers both the summary so far and the newer conversation.
+- Keep facts Astra may need later: names, dates, times, decisions, commitments, and user preferences.
+- Drop greetings, small talk, and details that were superseded.
+- Be concise: use short bullet points and stay under 250 words.
+- Respond with the summary only.
+"""
@@ -0,0 +1,323 @@
+# This file contains the resilience layer for calls to Gemini and the Google
+# APIs: a per-turn deadline that bounds every call made during the turn,
+# per-call timeouts, jittered retries of transient errors, optional hedged
+# requests, and circuit breakers that fail fast while a backend is down so
+# callers can fall back to their local copies.
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Deque, Iterator, Optional, TypeVar
+
+from src.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Time a whole turn may take, all LLM and Google calls included (seconds).
+TURN_DEADLINE = float(os.getenv("TURN_DEADLINE", "90"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "45"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+# Send a duplicate LLM request when the first is slower than the recent p95.
+# Costs tokens, and only applies when replies are not streamed.
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+GOOGLE_API_TIMEOUT = float(os.getenv("GOOGLE_API_TIMEOUT", "10"))
+GOOGLE_API_RETRIES = int(os.getenv("GOOGLE_API_RETRIES", "2"))
+GOOGLE_API_HEDGE = os.getenv("GOOGLE_API_HEDGE", "false").lower() == "true"
+# Consecutive transient failures that open a circuit, and how long it stays open (seconds).
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "8"))
+
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+# Exception types of the Google client libraries that signal a transient failure.
+TRANSIENT_ERROR_NAMES = {"ServiceUnavailable", "ResourceExhausted", "InternalServerError", "TooManyRequests", "GatewayTimeout"}
+
+RETRIES = REGISTRY.counter("astra_retries_total", "Retried calls by backend.")
+HEDGED_REQUESTS = REGISTRY.counter("astra_hedged_requests_total", "Duplicate requests sent after the p95 delay, by backend.")
+CIRCUIT_REJECTIONS = REGISTRY.counter("astra_circuit_rejections_total", "Calls rejected by an open circuit, by backend.")
+
+T = TypeVar("T")
+
+
+class BackendUnavailable(Exception):
+    """A call was not attempted: the turn's deadline passed or the backend's circuit is open."""
+
+
+class DeadlineExceeded(BackendUnavailable):
+    pass
+
+
+class CircuitOpenError(BackendUnavailable):
+    pass
+
+
+# --- Deadline ---
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("astra_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[float]:
+    """Bounds the calls made in this context, and in tasks and threads started from it, to `seconds` from now."""
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        at = min(at, current)
+    token = _deadline.set(at)
+    try:
+        yield at
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left until the current deadline, or None if there is none."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+# --- Error classification ---
+
+
+def _status(error: BaseException) -> Optional[int]:
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    # googleapiclient's HttpError keeps the response
+    status = getattr(getattr(error, "resp", None), "status", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a retry may succeed: timeouts, connection errors, 408/429/5xx responses, also when wrapped."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, BackendUnavailable):
+            return False
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        if _status(error) in TRANSIENT_STATUS or type(error).__name__ in TRANSIENT_ERROR_NAMES:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+# --- Building blocks ---
+
+
+class LatencyTracker:
+    """Latencies of recent successful calls, for the hedging delay."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._min_samples = min_samples
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        samples = sorted(self._samples)
+        if len(samples) < self._min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures and then
+    rejects calls for `reset_timeout` seconds. After that one trial call is
+    let through: success closes the circuit, failure keeps it open for
+    another `reset_timeout`.
+    """
+
+    def __init__(
+        self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_SECONDS
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError while the circuit is open and no trial call is due."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_timeout:
+                CIRCUIT_REJECTIONS.inc(backend=self.name)
+                raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+            # Half-open: this call is the trial, the others keep failing fast.
+            self._opened_at = now
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"Circuit for {self.name} closed.")
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Circuit for {self.name} opened after {self._failures} failures.")
+                self._opened_at = time.monotonic()
+
+
+class Backend:
+    """
+    The call policy of one backend: a timeout per attempt (cut short by the
+    current deadline), up to `retries` retries of transient errors with full
+    jitter backoff, optional hedging, and a circuit breaker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float,
+        retries: int,
+        hedge: bool = False,
+        breaker: Optional[CircuitBreaker] = None,
+        base_delay: float = RETRY_BASE_DELAY,
+        max_delay: float = RETRY_MAX_DELAY,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker(name)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.latency = LatencyTracker()
+        REGISTRY.gauge(
+            f"astra_{name}_circuit_open", f"1 while the {name} circuit breaker rejects calls.",
+            lambda: float(self.breaker.is_open),
+        )
+
+    def _budget(self) -> float:
+        """The timeout of the next attempt."""
+        left = remaining()
+        if left is None:
+            return self.timeout
+        if left <= 0:
+            raise DeadlineExceeded(f"{self.name}: the turn's deadline has passed")
+        return min(self.timeout, left)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Records the failure and returns how long to wait before retrying, or None to give up."""
+        if not is_transient(error):
+            # The backend answered; the request itself was at fault.
+            self.breaker.record_success()
+            return None
+        left = remaining()
+        if left is not None and left <= 0:
+            # Cut short by the turn's deadline, which says nothing about the backend.
+            return None
+        self.breaker.record_failure()
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if attempt >= self.retries or (left is not None and left <= delay):
+            return None
+        RETRIES.inc(backend=self.name)
+        logger.warning(f"{self.name} call failed ({error!r}), retry {attempt + 1}/{self.retries} in {delay:.2f}s")
+        return delay
+
+    def _deadline_error(self, error: Exception) -> Exception:
+        left = remaining()
+        if left is not None and left <= 0:
+            return DeadlineExceeded(f"{self.name}: the turn's deadline has passed")
+        return error
+
+    async def call(self, fn: Callable[[], Awaitable[T]], hedge: Optional[bool] = None) -> T:
+        """Awaits `fn()` under this backend's policy. `fn` is called again for every attempt."""
+        hedge = self.hedge if hedge is None else hedge
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            timeout = self._budget()
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(self._hedged(fn) if hedge else fn(), timeout)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    error = self._deadline_error(e)
+                    if error is e:
+                        raise
+                    raise error from e
+                await asyncio.sleep(delay)
+                attempt += 1
+            else:
+                self.breaker.record_success()
+                self.latency.observe(time.monotonic() - started)
+                return result
+
+    def call_blocking(self, fn: Callable[[], T]) -> T:
+        """`call` for a blocking callable on a worker thread; the attempt timeout is up to `fn` (e.g. a socket timeout)."""
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            self._budget()
+            started = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    error = self._deadline_error(e)
+                    if error is e:
+                        raise
+                    raise error from e
+                time.sleep(delay)
+                attempt += 1
+            else:
+                self.breaker.record_success()
+                self.latency.observe(time.monotonic() - started)
+                return result
+
+    async def _hedged(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Awaits `fn()`, plus a duplicate if the first is slower than the recent p95. The first success wins."""
+        delay = self.latency.percentile(95)
+        tasks = [asyncio.ensure_future(fn())]
+        try:
+            if delay is None:
+                return await tasks[0]
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                HEDGED_REQUESTS.inc(backend=self.name)
+                tasks.append(asyncio.ensure_future(fn()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            # Every copy failed: report the first one's error.
+            return tasks[0].result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+LLM_BACKEND = Backend("llm", LLM_TIMEOUT, LLM_RETRIES, hedge=LLM_HEDGE)
+GOOGLE_BACKEND = Backend("google_api", GOOGLE_API_TIMEOUT, GOOGLE_API_RETRIES, hedge=GOOGLE_API_HEDGE)
@@ -0,0 +1,164 @@
+# This file contains the intent fast-path router. It runs before the agent and
+# recognizes unambiguous schedule questions with simple rules; for those it
+# calls the calendar tool directly, so the turn needs a single (summarizing)
+# LLM call instead of a tool-selection call followed by a summarizing call.
+
+import os
+import re
+import uuid
+import logging
+import datetime
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.config import RunnableConfig
+
+from src.calendar import calendar_now
+from src.state import AgentState
+
+logger = logging.getLogger(__name__)
+
+# Intents below this confidence go through the full agent loop.
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.8"))
+
+_SCHEDULE_WORDS = re.compile(
+    r"\b(calendar|schedule|agenda|meetings?|events?|appointments?|plans|busy|free|on my plate)\b"
+    r"|\bwhat'?s on\b|\bwhat is on\b|\bwhat do i have\b|\banything on\b"
+)
+# Requests to change something, or about other domains, always go to the agent.
+_NOT_A_LOOKUP = re.compile(
+    r"\b(add|create|book|cancel|delete|remove|move|reschedule|invite|set up|remind|email|mail|send|reply|draft|"
+    r"schedule an?|put)\b"
+)
+# Questions about free time are answered by the availability tool.
+_AVAILABILITY_WORDS = re.compile(
+    r"\b(free|available|availability|busy|double[- ]booked|overlap\w*|conflicts?|clash\w*)\b|\bfind (some )?time\b"
+)
+_DURATION = re.compile(r"\b(\d+|an?|one|half an?)\s*(hours?|hrs?|h|minutes?|mins?)\b")
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+# References to the past that resolve_window doesn't turn into a window ("two days ago", "last week").
+_PAST_WORDS = re.compile(r"\b(ago|past|previous|last|yesterday)\b")
+_PARTS_OF_DAY = {"morning": (6, 12), "afternoon": (12, 17), "evening": (17, 24), "tonight": (17, 24)}
+_MAX_WORDS = 20
+
+
+@dataclass
+class Intent:
+    tool: str
+    args: Dict = field(default_factory=dict)
+    confidence: float = 0.0
+
+
+def _day_start(d: datetime.datetime) -> datetime.datetime:
+    return d.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def resolve_window(text: str, now: datetime.datetime) -> Optional[Tuple[datetime.datetime, datetime.datetime]]:
+    """Turns a relative time expression ("tomorrow afternoon", "this week") into a window."""
+    today = _day_start(now)
+    day = None
+    if "today" in text or "tonight" in text or re.search(r"\bthis (morning|afternoon|evening)\b", text):
+        day = today
+    elif "tomorrow" in text:
+        day = today + datetime.timedelta(days=1)
+    else:
+        for i, name in enumerate(_WEEKDAYS):
+            match = re.search(rf"\b(?:(next|last|previous|this) )?{name}\b", text)
+            if match:
+                ahead = (i - now.weekday()) % 7
+                if match.group(1) in ("last", "previous"):
+                    # The most recent one before today.
+                    ahead = -((now.weekday() - i) % 7 or 7)
+                elif match.group(1) == "next" and ahead == 0:
+                    # "Next Monday" said on a Monday is a week away.
+                    ahead = 7
+                day = today + datetime.timedelta(days=ahead)
+                break
+
+    if day is not None:
+        for part, (start_hour, end_hour) in _PARTS_OF_DAY.items():
+            if re.search(rf"\b{part}\b", text):
+                return day + datetime.timedelta(hours=start_hour), day + datetime.timedelta(hours=end_hour)
+        return day, day + datetime.timedelta(days=1)
+
+    week_start = today - datetime.timedelta(days=now.weekday())
+    if "next week" in text:
+        return week_start + datetime.timedelta(days=7), week_start + datetime.timedelta(days=14)
+    if "weekend" in text:
+        saturday = week_start + datetime.timedelta(days=5)
+        return saturday, saturday + datetime.timedelta(days=2)
+    if "this week" in text or "rest of the week" in text:
+        return today, week_start + datetime.timedelta(days=7)
+    return None
+
+
+def resolve_duration(text: str) -> Optional[int]:
+    """Extracts a meeting length such as "an hour" or "45 minutes", in minutes."""
+    match = _DURATION.search(text)
+    if not match:
+        return None
+    amount, unit = match.groups()
+    value = 0.5 if amount.startswith("half") else 1 if amount in ("a", "an", "one") else int(amount)
+    return int(value * 60) if unit.startswith("h") else int(value)
+
+
+def classify(text: str, now: Optional[datetime.datetime] = None) -> Optional[Intent]:
+    """Recognizes read-only schedule questions. Returns None for anything else."""
+    now = now or calendar_now()
+    text = text.lower().replace("’", "'")
+    if not (_SCHEDULE_WORDS.search(text) or _AVAILABILITY_WORDS.search(text)) or _NOT_A_LOOKUP.search(text):
+        return None
+
+    window = resolve_window(text, now)
+    # A past reference the window doesn't cover would be answered for the wrong days.
+    if window is not None and _PAST_WORDS.search(text) and not re.search(
+        rf"\b(last|previous) ({'|'.join(_WEEKDAYS)})\b", text
+    ):
+        window = None
+    if _AVAILABILITY_WORDS.search(text):
+        args = {}
+        if window is not None:
+            args = {"time_min": window[0].isoformat(), "time_max": window[1].isoformat()}
+        duration = resolve_duration(text)
+        if duration:
+            args["min_duration_minutes"] = duration
+        intent = Intent("check_availability", args, 0.9 if window is not None else 0.7)
+    elif window is None:
+        intent = Intent("list_calendar_events", {"max_results": 10}, 0.7)
+    else:
+        start, end = window
+        intent = Intent(
+            "list_calendar_events",
+            {"max_results": 50, "time_min": start.isoformat(), "time_max": end.isoformat()},
+            0.9,
+        )
+
+    # Long messages usually carry more than a lookup.
+    if len(text.split()) > _MAX_WORDS:
+        intent.confidence -= 0.3
+    return intent
+
+
+def make_router_node(threshold: float = ROUTER_CONFIDENCE_THRESHOLD):
+    """Builds the graph node that answers confident schedule intents with a direct tool call."""
+
+    async def router_node(state: AgentState, config: RunnableConfig):
+        last = state.messages[-1] if state.messages else None
+        if not isinstance(last, HumanMessage) or not isinstance(last.content, str):
+            return {}
+        intent = classify(last.content)
+        if intent is None or intent.confidence < threshold:
+            return {}
+
+        logger.info(f"Fast path: {intent.tool}({intent.args}) at confidence {intent.confidence:.2f}")
+        tool_call = {"name": intent.tool, "args": intent.args, "id": f"fastpath_{uuid.uuid4().hex}"}
+        return {"messages": [AIMessage(content="", tool_calls=[tool_call])]}
+
+    return router_node
+
+
+def route_after_router(state: AgentState) -> str:
+    """Goes straight to the tools when the router issued a tool call."""
+    last = state.messages[-1] if state.messages else None
+    return "tools" if isinstance(last, AIMessage) and last.tool_calls else "agent"
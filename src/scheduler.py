@@ -0,0 +1,120 @@
+# This file contains the turn scheduler. It runs agent turns strictly in order
+# per conversation thread, merges messages that arrive while a turn is waiting
+# into a single turn, and caps the number of turns (and so LLM calls) in flight.
+# Other work on a thread's state (e.g. recording a briefing) is queued through
+# it too, so it never overlaps a turn.
+
+import os
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of turns running at once across all threads.
+MAX_CONCURRENT_TURNS = int(os.getenv("MAX_CONCURRENT_TURNS", "4"))
+# Maximum number of queued messages across all threads before new ones are rejected.
+MAX_PENDING_MESSAGES = int(os.getenv("MAX_PENDING_MESSAGES", "100"))
+
+
+@dataclass
+class _Call:
+    fn: Callable[[], Awaitable[None]]
+
+
+def _split(batch: List[Any]) -> List[Any]:
+    """Groups consecutive messages into turns, keeping calls in between in order."""
+    groups: List[Any] = []
+    for item in batch:
+        if isinstance(item, _Call):
+            groups.append(item)
+        elif groups and isinstance(groups[-1], list):
+            groups[-1].append(item)
+        else:
+            groups.append([item])
+    return groups
+
+
+class TurnScheduler:
+    """
+    A per-thread serialized work queue.
+
+    Each thread has at most one turn running. Items submitted while a thread is
+    busy or waiting for a free slot are collected and handed to `run_turn` as
+    one batch, so a burst of messages costs a single turn.
+    """
+
+    def __init__(
+        self,
+        run_turn: Callable[[str, List[Any]], Awaitable[None]],
+        max_concurrent: int = MAX_CONCURRENT_TURNS,
+        max_pending: int = MAX_PENDING_MESSAGES,
+    ):
+        self._run_turn = run_turn
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._max_pending = max_pending
+        self._pending: Dict[str, List[Any]] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._in_flight = 0
+
+    def submit(self, thread_id: str, item: Any) -> bool:
+        """Queues an item for the thread. Returns False if the queue is full."""
+        if self.pending_count() >= self._max_pending:
+            logger.warning(f"Turn queue full, rejecting message for thread {thread_id}")
+            return False
+        self._enqueue(thread_id, item)
+        return True
+
+    def submit_call(self, thread_id: str, fn: Callable[[], Awaitable[None]]) -> None:
+        """Runs `fn` on the thread between turns, after the items submitted so far."""
+        self._enqueue(thread_id, _Call(fn))
+
+    def _enqueue(self, thread_id: str, item: Any) -> None:
+        self._pending.setdefault(thread_id, []).append(item)
+        if thread_id not in self._workers:
+            self._workers[thread_id] = asyncio.create_task(self._drain(thread_id))
+
+    async def _drain(self, thread_id: str) -> None:
+        try:
+            while self._pending.get(thread_id):
+                async with self._slots:
+                    # Everything that arrived while we waited for a slot becomes one turn.
+                    for group in _split(self._pending.pop(thread_id)):
+                        if isinstance(group, _Call):
+                            try:
+                                await group.fn()
+                            except Exception as e:
+                                logger.error(f"Scheduled call failed for thread {thread_id}: {e}", exc_info=True)
+                            continue
+                        if len(group) > 1:
+                            logger.info(f"Coalesced {len(group)} messages into one turn for thread {thread_id}")
+                        self._in_flight += 1
+                        try:
+                            await self._run_turn(thread_id, group)
+                        except Exception as e:
+                            logger.error(f"Turn failed for thread {thread_id}: {e}", exc_info=True)
+                        finally:
+                            self._in_flight -= 1
+        finally:
+            self._workers.pop(thread_id, None)
+
+    def pending_count(self) -> int:
+        return sum(len(items) for items in self._pending.values())
+
+    def stats(self) -> Dict[str, int]:
+        """Queue depth for monitoring."""
+        return {
+            "pending_messages": self.pending_count(),
+            "waiting_threads": len(self._pending),
+            "active_threads": len(self._workers),
+            "in_flight_turns": self._in_flight,
+        }
+
+    async def aclose(self) -> None:
+        """Cancels all queued and running turns."""
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._pending.clear()
@@ -0,0 +1,60 @@
+# This file contains the sharding of conversations across worker processes.
+# A consistent hash ring maps every thread_id to one worker, so all turns of
+# a conversation run in the same process (in order, with its transcript cache
+# warm) while different conversations spread over the cores. Changing the
+# number of workers only moves about 1/N of the conversations.
+
+import os
+import bisect
+import hashlib
+from typing import Iterable, List, Optional
+
+# Worker processes started by main.py, and this process's index among them.
+WORKER_COUNT = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+WORKER_ID = int(os.getenv("WORKER_ID", "0"))
+# Points per worker on the ring; more points spread the threads more evenly.
+HASH_RING_REPLICAS = int(os.getenv("HASH_RING_REPLICAS", "128"))
+
+if not 0 <= WORKER_ID < WORKER_COUNT:
+    raise ValueError(f"WORKER_ID must be between 0 and WEB_CONCURRENCY - 1, got {WORKER_ID} of {WORKER_COUNT}.")
+
+
+def _hash(key: str) -> int:
+    # Stable across processes and restarts, unlike hash().
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """A consistent hash ring of worker ids."""
+
+    def __init__(self, nodes: Iterable[int], replicas: int = HASH_RING_REPLICAS):
+        points = sorted((_hash(f"worker-{node}#{i}"), node) for node in nodes for i in range(replicas))
+        if not points:
+            raise ValueError("A hash ring needs at least one node.")
+        self._hashes: List[int] = [h for h, _ in points]
+        self._nodes: List[int] = [node for _, node in points]
+
+    def node_for(self, key: str) -> int:
+        """The node owning `key`: the first point clockwise from the key's hash."""
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+_ring: Optional[HashRing] = None
+
+
+def get_hash_ring() -> HashRing:
+    """Returns the ring of this deployment's workers."""
+    global _ring
+    if _ring is None:
+        _ring = HashRing(range(WORKER_COUNT))
+    return _ring
+
+
+def shard_for(thread_id: str) -> int:
+    """The worker that runs the turns of `thread_id`."""
+    return get_hash_ring().node_for(thread_id) if WORKER_COUNT > 1 else 0
+
+
+def owns(thread_id: str) -> bool:
+    return shard_for(thread_id) == WORKER_ID
@@ -1,11 +1,26 @@
 from typing import List, Any, Dict, Union, Annotated
 import operator
-from langchain_core.messages import BaseMessage
-from pydantic import BaseModel, Field, ConfigDict
+from langchain_core.messages import BaseMessage, convert_to_messages
+from pydantic import BaseModel, Field, ConfigDict, field_validator
+
+def normalize_messages(messages: List[Any]) -> List[BaseMessage]:
+    """Converts message dicts (e.g. {"type": "human", ...}) into typed LangChain messages."""
+    if all(isinstance(m, BaseMessage) for m in messages):
+        return messages
+    return convert_to_messages(messages)
 
 class AgentState(BaseModel):
     model_config = ConfigDict(extra="allow")
     messages: Annotated[List[Any], operator.add] = Field(default_factory=list)
+    # Rolling summary of messages[:summarized_upto]; only later messages are sent verbatim.
+    summary: str = ""
+    summarized_upto: int = 0
+
+    @field_validator("messages", mode="before")
+    @classmethod
+    def _normalize_messages(cls, value):
+        # Message dicts (e.g. from older checkpoints) become typed messages here.
+        return normalize_messages(list(value))
 
     # The following fields are removed as per the instructions:
     # events: List[Dict] = Field(default_factory=list)
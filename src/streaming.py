@@ -0,0 +1,174 @@
+# This file contains the streaming reply used to show the agent's answer in
+# Telegram while it is being generated: a placeholder message that is edited
+# with coalesced token chunks at a bounded rate. Messages and edits go through
+# the outbound sender, so they count against Telegram's flood limits.
+
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Optional, Tuple
+
+from telegram import Message
+from telegram.error import BadRequest
+
+from src.outbound import (
+    PRIORITY_EDIT,
+    PRIORITY_REPLY,
+    TELEGRAM_MAX_MESSAGE_LENGTH,
+    OutboundSender,
+    get_outbound_sender,
+    split_message,
+)
+
+logger = logging.getLogger(__name__)
+
+# Minimum number of seconds between two edits of the same message.
+TELEGRAM_EDIT_INTERVAL = float(os.getenv("TELEGRAM_EDIT_INTERVAL", "1.0"))
+
+PLACEHOLDER_TEXT = "…"
+FALLBACK_TEXT = "Sorry, I couldn't generate a response."
+
+# Status lines shown while a tool is running.
+TOOL_STATUS = {
+    "list_calendar_events": "🗓 Checking your calendar…",
+    "list_events_all_calendars": "🗓 Checking your calendars…",
+    "check_availability": "🗓 Checking your availability…",
+    "search_emails": "📧 Searching your email…",
+    "read_email": "📧 Reading the email…",
+    "summarize_inbox": "📧 Going through your inbox…",
+}
+DEFAULT_TOOL_STATUS = "⏳ Working on it…"
+
+
+def content_text(content: Any) -> str:
+    """Extracts the text from message content, which Gemini may return as a list of parts."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for part in content
+            if isinstance(part, (str, dict))
+        )
+    return ""
+
+
+def tool_status(tool_name: Optional[str]) -> str:
+    return TOOL_STATUS.get(tool_name, DEFAULT_TOOL_STATUS)
+
+
+class StreamingReply:
+    """
+    A Telegram reply that grows as the response streams in.
+
+    Chunks arriving faster than `edit_interval` are coalesced into a single
+    `edit_message_text` call, keeping us well under Telegram's edit limits.
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        edit_interval: float = TELEGRAM_EDIT_INTERVAL,
+        sender: Optional[OutboundSender] = None,
+    ):
+        self._source = message
+        self._sender = sender or get_outbound_sender()
+        self._edit_interval = edit_interval
+        self._reply: Optional[Message] = None
+        self._text = ""
+        self._status = ""
+        self._shown = ""
+        self._last_edit = 0.0
+        self._pending: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    async def start(self) -> None:
+        """Sends the placeholder message that will be edited in place."""
+        self._reply = await self._sender.call(
+            self._source.chat_id, lambda: self._source.reply_text(PLACEHOLDER_TEXT), PRIORITY_REPLY
+        )
+        self._shown = PLACEHOLDER_TEXT
+        self._last_edit = time.monotonic()
+
+    async def append(self, text: str) -> None:
+        if not text:
+            return
+        # Text after a tool call starts a new paragraph.
+        if self._status and self._text:
+            self._text += "\n\n"
+        self._text += text
+        self._status = ""
+        self._schedule_flush()
+
+    def mark(self) -> Tuple[str, str]:
+        """Returns a position that `rewind` can go back to."""
+        return self._text, self._status
+
+    def rewind(self, mark: Tuple[str, str]) -> None:
+        """Drops the text appended since `mark`, e.g. the partial output of a failed LLM call that is retried."""
+        self._text, self._status = mark
+        self._schedule_flush()
+
+    async def set_status(self, status: str) -> None:
+        """Shows a status line (e.g. while a tool runs) below the text so far."""
+        self._status = status
+        self._schedule_flush()
+
+    def _render(self) -> str:
+        text = self._text.strip()
+        if self._status:
+            text = f"{text}\n\n{self._status}" if text else self._status
+        text = text or PLACEHOLDER_TEXT
+        # While streaming, show the tail if the reply outgrows a single message.
+        if len(text) > TELEGRAM_MAX_MESSAGE_LENGTH:
+            text = "…" + text[-(TELEGRAM_MAX_MESSAGE_LENGTH - 1):]
+        return text
+
+    def _schedule_flush(self) -> None:
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        delay = self._edit_interval - (time.monotonic() - self._last_edit)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._edit(self._render())
+
+    async def _edit(self, text: str, priority: int = PRIORITY_EDIT) -> None:
+        async with self._lock:
+            if self._reply is None or text == self._shown:
+                return
+            try:
+                await self._sender.edit(self._reply, text, priority)
+                self._shown = text
+            except BadRequest as e:
+                # "Message is not modified" and similar are harmless here.
+                logger.warning(f"Failed to edit streaming reply: {e}")
+            finally:
+                self._last_edit = time.monotonic()
+
+    async def finish(self, note: str = "") -> None:
+        """Writes the complete response, splitting it across messages if needed.
+
+        `note` is added below the text, e.g. when the turn failed part way.
+        """
+        if self._pending is not None and not self._pending.done():
+            self._pending.cancel()
+        self._status = ""
+
+        text = self._text.strip()
+        if note:
+            text = f"{text}\n\n{note}" if text else note
+        text = text or FALLBACK_TEXT
+        first, *rest = split_message(text)
+        if self._reply is None:
+            await self.start()
+        # The final text is the reply itself, not a progress update.
+        await self._edit(first, PRIORITY_REPLY)
+        for chunk in rest:
+            await self._sender.reply(self._source, chunk, continued=True)
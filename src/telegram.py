@@ -4,26 +4,63 @@
 import os
 import asyncio
 import logging
-import json
+import time
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
 from http import HTTPStatus
 from contextlib import asynccontextmanager
-import aiosqlite
 from datetime import datetime
+from typing import Optional, Set, Tuple
 
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.config import RunnableConfig
 from langgraph.prebuilt import ToolNode
 
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 
 from src.state import AgentState
-from src.tools import list_calendar_events
+from src.tools import (
+    check_availability,
+    list_calendar_events,
+    list_events_all_calendars,
+    read_email,
+    refresh_calendar,
+    search_emails,
+    summarize_inbox,
+    sync_calendar,
+    sync_gmail,
+)
+from src.calendar import get_calendar_store, run_periodic_sync
+from src.gmail import GMAIL_SYNC_INTERVAL
+from src.briefing import BRIEFING_DB_PATH, BRIEFING_TIME, BriefingService, BriefingStore
+from src.google_clients import get_google_clients, shutdown_google_clients
 from src.prompts import SecretaryPrompts
+from src.history import make_compact_history_node
+from src.router import make_router_node, route_after_router
+from src.prefetch import PREFETCH_ENABLED, get_prefetcher
+from src.transcript import TranscriptCache
+from src.streaming import StreamingReply, content_text, tool_status
+from src.outbound import PRIORITY_NOTIFICATION, get_outbound_sender
+from src.scheduler import TurnScheduler
+from src.ingest import UpdateIngestor, UpdateQueue
+from src.cache import ResponseCache, RESPONSE_CACHE_ENABLED
+from src.context_cache import GEMINI_CONTEXT_CACHE, GeminiContextCacheBackend, PromptPrefixCache
+from src.models import FAST, STRONG, ModelRouter, ModelTiers
+from src.resilience import LLM_BACKEND, LLM_TIMEOUT, TURN_DEADLINE, BackendUnavailable, deadline
+from src.tenants import ALLOWED_CHAT_IDS, PerTenant, current_tenant, is_allowed, tenant, tenant_path
+from src.sharding import WORKER_COUNT, WORKER_ID, owns
+from src.checkpoint import open_checkpointer, close_checkpointer, run_checkpoint_maintenance
+from src.metrics import (
+    REGISTRY,
+    TURN_SECONDS,
+    WEBHOOK_REQUESTS,
+    WEBHOOK_SECONDS,
+    MetricsCallbackHandler,
+    render_metrics,
+    trace,
+)
 
 # Enable logging
 logging.basicConfig(
@@ -32,8 +69,11 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-YOUR_CHAT_ID = os.getenv("YOUR_CHAT_ID")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Stream replies token by token by editing a placeholder message
+TELEGRAM_STREAMING = os.getenv("TELEGRAM_STREAMING", "true").lower() == "true"
+# Sent when a turn fails, e.g. the LLM is unreachable or the turn ran out of time
+TURN_FAILED_TEXT = "Sorry, I couldn't finish that just now. Please try again in a moment."
 
 # --- Sanity Check for Environment Variables ---
 if not TELEGRAM_BOT_TOKEN:
@@ -45,15 +85,37 @@ logger.info(f"Read WEBHOOK_URL from environment: {WEBHOOK_URL}")
 
 # --- LangGraph Setup ---
 
-# Initialize the LLM
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-pro-preview-06-05", google_api_key=os.getenv("GOOGLE_API_KEY"))
-
 # Define the tools
-tools = [list_calendar_events]
+tools = [
+    list_calendar_events,
+    list_events_all_calendars,
+    check_availability,
+    search_emails,
+    read_email,
+    summarize_inbox,
+]
 tool_node = ToolNode(tools)
 
-# Bind the tools to the LLM
-llm_with_tools = llm.bind_tools(tools)
+def create_llm(model: str):
+    """Creates a Gemini chat model. Timeouts and retries are applied by LLM_BACKEND, within the turn's deadline."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model=model, google_api_key=os.getenv("GOOGLE_API_KEY"), timeout=LLM_TIMEOUT, max_retries=0
+    )
+
+# The models are created on first use, or in the background during startup:
+# importing the Gemini client alone takes about a second.
+model_tiers = ModelTiers(create_llm, tools)
+# Picks the fast or the strong model for each call
+model_router = ModelRouter()
+
+def get_summary_llm():
+    """Returns the model that folds old turns into the summary."""
+    return model_tiers.model(model_router.for_summary().tier)
+
+# Prepared LLM transcripts, extended incrementally per thread
+transcript_cache = TranscriptCache()
 
 def should_continue(state: AgentState):
     """Router logic to decide whether to continue or end the conversation."""
@@ -72,91 +134,73 @@ def should_continue(state: AgentState):
     
     return "end"
 
+# Provider-side caching of the static prompt prefix (optional)
+prefix_cache = PromptPrefixCache(GeminiContextCacheBackend()) if GEMINI_CONTEXT_CACHE else None
+
+async def invoke_agent_llm(prepared: list, config: RunnableConfig, tier: str):
+    """Calls the `tier` model, referencing the cached static prefix when one is available.
+
+    `prepared[0]` must be the static system prompt. Timeouts, retries and the
+    circuit breaker come from LLM_BACKEND.
+    """
+    # Hedged copies would stream into the same reply, so only non-streamed turns hedge.
+    hedge = LLM_BACKEND.hedge and not TELEGRAM_STREAMING
+    if prefix_cache is not None:
+        # Cached content belongs to one model, so each tier has its own.
+        model = model_tiers.model(tier)
+        handle = await prefix_cache.handle(model.model, prepared[0].content, tools)
+        if handle:
+            # The cached content already carries the system prompt and the tools.
+            return await LLM_BACKEND.call(
+                lambda: model.ainvoke(prepared[1:], config=config, cached_content=handle), hedge=hedge
+            )
+    return await LLM_BACKEND.call(lambda: model_tiers.with_tools(tier).ainvoke(prepared, config=config), hedge=hedge)
+
 async def agent_node(state: AgentState, config: RunnableConfig):
     """The main agent node that calls the LLM."""
-    prepared: list = []
-    
-    # Get the dynamic system prompt
-    system_message = SecretaryPrompts.get_system_prompt()
-    
-    prepared.append(HumanMessage(content=system_message))
-    
-    # Logic to find the tool name for any tool messages
-    tool_call_map = {}
-    for m in state.messages:
-        if isinstance(m, AIMessage) and m.tool_calls:
-            for tc in m.tool_calls:
-                tool_call_map[tc['id']] = tc['name']
-
-    for m in state.messages:
-        if isinstance(m, (HumanMessage, AIMessage, ToolMessage)):
-            # If we get a tool message from the calendar, use our custom prompter
-            if isinstance(m, ToolMessage):
-                tool_name = tool_call_map.get(m.tool_call_id)
-                if tool_name == 'list_calendar_events':
-                    try:
-                        events = json.loads(m.content)
-                        summary_prompt = SecretaryPrompts.summarize_calendar_events(events)
-                        # Replace the raw tool output with our detailed prompt
-                        m.content = summary_prompt
-                    except (json.JSONDecodeError, TypeError):
-                        # If content isn't valid JSON, just pass it along
-                        pass
-            
-            # For AIMessage: include if it has content OR tool calls
-            if isinstance(m, AIMessage):
-                if (m.content and m.content.strip()) or (hasattr(m, 'tool_calls') and m.tool_calls):
-                    prepared.append(m)
-            # For other message types: only include if they have content
-            elif hasattr(m, 'content') and m.content and m.content.strip():
-                prepared.append(m)
-        elif isinstance(m, dict):
-            m_type = m.get("type") or m.get("role")
-            content = m.get("content", "")
-            
-            # Skip if content is None, empty, or just whitespace
-            if not content or not str(content).strip():
-                continue
-                
-            content = str(content).strip()
-                
-            if m_type in ("human", "user"):
-                prepared.append(HumanMessage(content=content))
-            elif m_type in ("ai", "assistant"):
-                # Handle tool calls if present
-                tool_calls = m.get("tool_calls", [])
-                if tool_calls:
-                    prepared.append(AIMessage(content=content, tool_calls=tool_calls))
-                else:
-                    prepared.append(AIMessage(content=content))
-            elif m_type == "tool":
-                tool_call_id = m.get("tool_call_id", "")
-                content = m.get("content", "")
-                
-                tool_name = tool_call_map.get(tool_call_id)
-                if tool_name == 'list_calendar_events':
-                    try:
-                        events = json.loads(content)
-                        summary_prompt = SecretaryPrompts.summarize_calendar_events(events)
-                        content = summary_prompt # Replace content
-                    except (json.JSONDecodeError, TypeError):
-                        pass
-
-                if tool_call_id:  # Only add if we have a valid tool_call_id
-                    prepared.append(ToolMessage(content=content, tool_call_id=tool_call_id))
-
-    if len(prepared) <= 1:  # Only system message, add fallback
-        prepared.append(HumanMessage(content="Hello"))
-
-    response = await llm_with_tools.ainvoke(prepared, config=config)
+    # Stable prefix first so provider-side prompt caching can hit: the static
+    # persona and instructions, then the rarely changing summary, then history.
+    prepared: list = [SystemMessage(content=SecretaryPrompts.get_static_prompt())]
+    if state.summary:
+        prepared.append(HumanMessage(content=f"Summary of the earlier conversation:\n{state.summary}"))
+
+    # Older turns are covered by the summary; only the recent window is sent verbatim.
+    thread_id = str(config.get("configurable", {}).get("thread_id", ""))
+    history = transcript_cache.prepare(thread_id, state.messages, start=state.summarized_upto)
+    if not history:  # No conversation yet, add fallback
+        history = [HumanMessage(content="Hello")]
+    prepared.extend(history)
+
+    # Volatile context (the current time) goes last.
+    prepared.append(HumanMessage(content=SecretaryPrompts.get_dynamic_context()))
+
+    choice = model_router.for_agent(state.messages)
+    response = await invoke_agent_llm(prepared, config, choice.tier)
+    escalated = model_router.escalation(choice, response)
+    if escalated:
+        choice = escalated
+        response = await invoke_agent_llm(prepared, config, choice.tier)
+    # Later calls of the turn see which tier answered.
+    response.response_metadata = {**response.response_metadata, "model_tier": choice.tier}
     return {"messages": [response]}
 
 # Define the graph structure, but don't compile it yet.
 workflow = StateGraph(AgentState)
+workflow.add_node("history", make_compact_history_node(get_summary_llm))
 workflow.add_node("agent", agent_node)
 workflow.add_node("tools", tool_node)
 
-workflow.set_entry_point("agent")
+workflow.add_node("router", make_router_node())
+
+workflow.set_entry_point("history")
+workflow.add_edge("history", "router")
+
+# Confident schedule questions skip the tool-selection LLM call
+workflow.add_conditional_edges(
+    "router",
+    route_after_router,
+    {"tools": "tools", "agent": "agent"},
+)
 
 workflow.add_conditional_edges(
     "agent",
@@ -171,84 +215,308 @@ agent_executor = None
 
 # --- Telegram Bot and FastAPI Setup ---
 
-ptb_app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+# Every message to Telegram goes through here, under its flood limits.
+outbound = get_outbound_sender()
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
-    await update.message.reply_text("Hello! I am your secretary agent.")
+    await outbound.reply(update.message, "Hello! I am your secretary agent.")
 
 async def unauthorized_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handles messages from unauthorized users."""
-    await update.message.reply_text("Unauthorized access.")
-
-ptb_app.add_handler(CommandHandler("start", start))
-
-async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Process incoming messages by invoking the LangGraph agent."""
-    if str(update.message.chat_id) != YOUR_CHAT_ID:
-        await unauthorized_user(update, context)
-        return
-
-    config: RunnableConfig = {
-        "configurable": {
-            "thread_id": str(update.message.chat_id),
-        }
-    }
-    
-    initial_state = {"messages": [{"type": "human", "content": update.message.text}]}
-    
-    # Define a background task to stream the response
-    async def stream_and_respond():
-        final_response = ""
+    await outbound.reply(update.message, "Unauthorized access.")
+
+async def stream_reply(message, initial_state: dict, config: RunnableConfig) -> Tuple[str, Set[str], bool]:
+    """Streams the agent's tokens into a placeholder reply that is edited as they arrive.
+
+    Returns the final response, the names of the tools called during the turn
+    and whether the router answered it alone (see `answered_by_router`).
+    """
+    tools_used: Set[str] = set()
+    agent_called_tools = False
+    reply = StreamingReply(message)
+    await reply.start()
+    # The LLM call currently streaming, and where its text starts in the reply
+    call_id, call_step, call_mark = None, None, reply.mark()
+    try:
+        async for mode, chunk in agent_executor.astream(initial_state, config=config, stream_mode=["messages", "updates"]):
+            if mode == "messages":
+                msg, metadata = chunk
+                # Only the agent's answer is shown, not e.g. the history summarizer.
+                if metadata.get("langgraph_node") == "agent" and isinstance(msg, AIMessage):
+                    if msg.id != call_id:
+                        if call_id is not None and metadata.get("langgraph_step") == call_step:
+                            # The same agent step started a new call: the previous one failed and is retried.
+                            reply.rewind(call_mark)
+                        else:
+                            call_mark = reply.mark()
+                        call_id, call_step = msg.id, metadata.get("langgraph_step")
+                    await reply.append(content_text(msg.content))
+            elif "agent" in chunk or "router" in chunk:
+                update = chunk.get("agent") or chunk.get("router")
+                tool_calls = getattr(update["messages"][-1], "tool_calls", None) if update else None
+                if tool_calls:
+                    tools_used.update(tc["name"] for tc in tool_calls)
+                    agent_called_tools = agent_called_tools or "agent" in chunk
+                    await reply.set_status(tool_status(tool_calls[0]["name"]))
+    except Exception:
+        # Don't leave the placeholder hanging.
+        await reply.finish(note=TURN_FAILED_TEXT)
+        raise
+    await reply.finish()
+    return reply.text, tools_used, answered_by_router(tools_used, agent_called_tools)
+
+async def reply_once(message, initial_state: dict, config: RunnableConfig) -> Tuple[str, Set[str], bool]:
+    """Runs the agent to completion and sends its response as a single message."""
+    tools_used: Set[str] = set()
+    agent_called_tools = False
+    final_response = ""
+    try:
         async for chunk in agent_executor.astream(initial_state, config=config):
+            # Tool calls made by the fast-path router
+            if chunk.get("router"):
+                tools_used.update(tc["name"] for tc in chunk["router"]["messages"][-1].tool_calls)
             # The final response is in the 'agent' node's output
             if "agent" in chunk:
                 agent_response = chunk["agent"]["messages"][-1]
-                
+                agent_tool_calls = getattr(agent_response, "tool_calls", None) or []
+                tools_used.update(tc["name"] for tc in agent_tool_calls)
+                agent_called_tools = agent_called_tools or bool(agent_tool_calls)
+
                 # Accumulate content deltas instead of overwriting
-                delta = getattr(agent_response, "content", "") or ""
+                delta = content_text(getattr(agent_response, "content", ""))
                 if delta:
                     final_response += delta
-        
-        if final_response.strip():
-            await update.message.reply_text(final_response)
-        else:
-            # Fallback in case no content is generated
-            await update.message.reply_text("Sorry, I couldn't generate a response.")
+    except Exception:
+        await outbound.reply(message, TURN_FAILED_TEXT)
+        raise
+    
+    if final_response.strip():
+        await outbound.reply(message, final_response)
+    else:
+        # Fallback in case no content is generated
+        await outbound.reply(message, "Sorry, I couldn't generate a response.")
+    return final_response, tools_used, answered_by_router(tools_used, agent_called_tools)
+
+def answered_by_router(tools_used: Set[str], agent_called_tools: bool) -> bool:
+    """Whether the turn's tool calls all came from the fast-path router.
+
+    The router resolves its tool arguments from the message text alone, so such
+    a turn does not depend on earlier messages (unlike "and the day after?").
+    """
+    return bool(tools_used) and not agent_called_tools
+
+# Speculative calendar refreshes, started when a message arrives
+prefetcher = get_prefetcher()
+
+def create_response_cache(chat_id: str) -> ResponseCache:
+    store = get_calendar_store(chat_id)
+    cache = ResponseCache(lambda: store.revision)
+    # Cached responses are dropped as soon as a sync changes the calendar
+    store.add_listener(cache.invalidate_calendar)
+    return cache
+
+# Final responses to repeated calendar questions, valid until the user's calendar changes
+response_caches = PerTenant(create_response_cache)
+
+# Times graph nodes and LLM calls of every turn
+metrics_callbacks = MetricsCallbackHandler()
+
+async def run_turn(thread_id: str, updates: list) -> None:
+    """Runs one agent turn for a batch of messages from the same chat."""
+    config: RunnableConfig = {
+        "configurable": {
+            "thread_id": thread_id,
+        },
+        "callbacks": [metrics_callbacks],
+    }
+    started = time.perf_counter()
+    outcome = "error"
+    # Every LLM and Google call of the turn shares the deadline, and works on the chat's own data.
+    with trace(f"turn {thread_id}"), tenant(thread_id), deadline(TURN_DEADLINE):
+        try:
+            outcome = await answer_turn(thread_id, updates, config)
+        except Exception as e:
+            if isinstance(e, BackendUnavailable):
+                outcome = "unavailable"
+            # Failed for good: the LLM and Google calls were already retried.
+            finish_updates(updates, error=str(e))
+            raise
+        finally:
+            TURN_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+    # A cancelled turn (shutdown) skips this, and its updates are replayed after the restart.
+    finish_updates(updates)
+
+def finish_updates(updates: list, error: Optional[str] = None) -> None:
+    """Marks the queued updates of a turn as done (or failed)."""
+    for update in updates:
+        update_ingestor.finish(update.update_id, error)
+
+async def answer_turn(thread_id: str, updates: list, config: RunnableConfig) -> str:
+    """Answers the merged messages of a turn. Returns "cached" or "ok"."""
+    # Messages that arrived while the previous turn was running are answered together.
+    text = "\n".join(u.message.text for u in updates)
+    message = updates[-1].message
+
+    response_cache = response_caches.get()
+    cached = response_cache.get(text) if RESPONSE_CACHE_ENABLED else None
+    if cached is not None:
+        await outbound.reply(message, cached)
+        # Record the exchange so follow-up questions still have the context.
+        await agent_executor.aupdate_state(
+            config, {"messages": [HumanMessage(content=text), AIMessage(content=cached)]}, as_node="agent"
+        )
+        return "cached"
+
+    # Start refreshing the calendar now if the message looks like it needs it,
+    # concurrently with the first LLM call.
+    if PREFETCH_ENABLED:
+        prefetcher.start(thread_id, text, refresh_calendar)
+
+    initial_state = {"messages": [HumanMessage(content=text)]}
+    respond = stream_reply if TELEGRAM_STREAMING else reply_once
+    try:
+        final_response, tools_used, self_contained = await respond(message, initial_state, config)
+    finally:
+        prefetcher.finish(thread_id)
+    if RESPONSE_CACHE_ENABLED:
+        response_cache.put(text, final_response, tools_used, self_contained)
+    return "ok"
+
+# Runs turns in order per chat and merges bursts of messages into one turn.
+scheduler = TurnScheduler(run_turn)
+
+async def process_raw_update(payload: dict) -> None:
+    """Hands a queued raw update to the Telegram application."""
+    ptb_app = get_ptb_app()
+    await ptb_app.process_update(Update.de_json(payload, ptb_app.bot))
+
+# Persists webhook updates and replays any left unprocessed by a restart.
+update_ingestor = UpdateIngestor(UpdateQueue(), process_raw_update)
+
+briefings = PerTenant(
+    lambda chat_id: BriefingService(sync_calendar, sync_gmail, BriefingStore(tenant_path(BRIEFING_DB_PATH, chat_id)))
+)
 
-    # Run the streaming task in the background
-    asyncio.create_task(stream_and_respond())
+def record_briefing(chat_id: str, text: str) -> None:
+    """Adds a sent briefing to the conversation, so follow-up questions have it as context."""
+    async def record():
+        await agent_executor.aupdate_state(
+            {"configurable": {"thread_id": chat_id}}, {"messages": [AIMessage(content=text)]}, as_node="agent"
+        )
+
+    # Through the scheduler: a write racing a running turn would fork the thread's checkpoints.
+    scheduler.submit_call(chat_id, record)
+
+async def send_briefing(text: str) -> None:
+    """Delivers the current tenant's daily briefing and records it in the conversation."""
+    chat_id = current_tenant()
+    await outbound.send(get_ptb_app().bot, chat_id, text, PRIORITY_NOTIFICATION)
+    record_briefing(chat_id, text)
+
+async def briefing_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send today's briefing when the command /briefing is issued."""
+    chat_id = str(update.message.chat_id)
+    if not is_allowed(chat_id):
+        await unauthorized_user(update, context)
+        return
+    with tenant(chat_id):
+        text = await briefings.get().get()
+    await outbound.reply(update.message, text)
+    record_briefing(chat_id, text)
 
-ptb_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_message))
+async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Process incoming messages by queueing a turn of the LangGraph agent."""
+    if not is_allowed(update.message.chat_id):
+        await unauthorized_user(update, context)
+        return
+
+    if scheduler.submit(str(update.message.chat_id), update):
+        # The update stays in the queue until its turn has run.
+        update_ingestor.defer(update.update_id)
+    else:
+        await outbound.reply(update.message, "I'm handling a lot of messages right now. Please try again in a moment.")
+
+_ptb_app = None
+
+def get_ptb_app() -> Application:
+    """Returns the Telegram application, building it and its handlers on first use."""
+    global _ptb_app
+    if _ptb_app is None:
+        _ptb_app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        _ptb_app.add_handler(CommandHandler("start", start))
+        _ptb_app.add_handler(CommandHandler("briefing", briefing_command))
+        _ptb_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_message))
+    return _ptb_app
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Handles startup and shutdown of the bot and graph."""
     global agent_executor
     
-    # Connect to the SQLite database
-    conn = await aiosqlite.connect("database.db")
-    
-    # Initialize the checkpointer with the connection
-    memory = AsyncSqliteSaver(conn=conn)
+    started = time.perf_counter()
+    ptb_app = get_ptb_app()
+    webhook_endpoint = f"{WEBHOOK_URL}/telegram"
+
+    async def start_bot():
+        await ptb_app.initialize()
+        # With several workers the first one registers the webhook for all of them.
+        if WORKER_ID == 0:
+            await ptb_app.bot.set_webhook(url=webhook_endpoint)
+            logger.info(f"Webhook set to {webhook_endpoint}")
+
+    # Independent startup steps run concurrently: opening the SQLite
+    # checkpointer (WAL, separate read/write connections), creating the models
+    # (mostly importing the Gemini client) and the Bot API calls.
+    memory, _, _ = await asyncio.gather(
+        open_checkpointer(maintain=WORKER_ID == 0),
+        asyncio.to_thread(model_tiers.warm, [FAST, STRONG] if model_router.enabled else [STRONG]),
+        start_bot(),
+    )
+    # The workers share the checkpoint database; one of them maintains it.
+    checkpoint_maintenance_task = (
+        asyncio.create_task(run_checkpoint_maintenance(memory)) if WORKER_ID == 0 else None
+    )
     
     # Compile the graph with the checkpointer
     agent_executor = workflow.compile(checkpointer=memory)
-    
-    # Set up the Telegram webhook
-    webhook_endpoint = f"{WEBHOOK_URL}/telegram"
-    await ptb_app.bot.set_webhook(url=webhook_endpoint)
-    logger.info(f"Webhook set to {webhook_endpoint}")
-    
+
+    # For each user whose conversation runs in this worker, keep their Google
+    # credentials and local calendar and mail mirrors current in the background,
+    # and prepare the daily briefing ahead of time and deliver it at BRIEFING_TIME.
+    background_tasks = []
+    for chat_id in ALLOWED_CHAT_IDS:
+        if not owns(chat_id):
+            continue
+        # Tasks created here run on behalf of the user.
+        with tenant(chat_id):
+            background_tasks += [
+                asyncio.create_task(get_google_clients().run_refresh_loop()),
+                asyncio.create_task(run_periodic_sync(sync_calendar)),
+                asyncio.create_task(run_periodic_sync(sync_gmail, GMAIL_SYNC_INTERVAL, "Gmail")),
+            ]
+            if BRIEFING_TIME:
+                background_tasks.append(asyncio.create_task(briefings.get().run_daily(send_briefing)))
+
     async with ptb_app:
         await ptb_app.start()
-        logger.info("Lifespan start: Bot and graph are set up.")
+        update_ingestor.start()
+        logger.info(f"Lifespan start: Bot and graph are set up in {time.perf_counter() - started:.2f}s.")
         yield
+        await update_ingestor.stop()
+        await scheduler.aclose()
+        await outbound.aclose()
         await ptb_app.stop()
         logger.info("Bot stopped.")
 
-    # Close the database connection on shutdown
-    await conn.close()
+    for task in background_tasks:
+        task.cancel()
+    shutdown_google_clients()
+
+    # Close the database connections on shutdown
+    if checkpoint_maintenance_task:
+        checkpoint_maintenance_task.cancel()
+    await close_checkpointer(memory)
     logger.info("Database connection closed.")
 
 # Initialize FastAPI app
@@ -256,17 +524,50 @@ app = FastAPI(lifespan=lifespan)
 
 @app.post("/telegram")
 async def telegram_webhook(request: Request):
-    """Handle incoming Telegram updates by passing them to the bot."""
+    """Queue incoming Telegram updates durably and acknowledge them right away."""
+    started = time.perf_counter()
+    response = await queue_update(request)
+    WEBHOOK_SECONDS.observe(time.perf_counter() - started)
+    WEBHOOK_REQUESTS.inc(status=response.status_code)
+    return response
+
+async def queue_update(request: Request) -> Response:
     try:
         req = await request.json()
-        update = Update.de_json(req, ptb_app.bot)
-        await ptb_app.process_update(update)
+        if "update_id" not in req:
+            raise ValueError("update has no update_id")
+    except Exception as e:
+        # Telegram would keep retrying a malformed update, so it is acknowledged too.
+        logger.error(f"Ignoring malformed update: {e}")
+        return Response(status_code=HTTPStatus.OK)
+
+    try:
+        update_ingestor.submit(req)
         return Response(status_code=HTTPStatus.OK)
     except Exception as e:
-        logger.error(f"Error processing update: {e}", exc_info=True)
+        # Not persisted: let Telegram deliver it again.
+        logger.error(f"Error queueing update: {e}", exc_info=True)
         return Response(status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
 
 @app.get("/healthcheck")
 async def health_check():
     """Healthcheck endpoint to verify the service is running."""
-    return {"status": "ok"} 
\ No newline at end of file
+    return {
+        "status": "ok",
+        "queue": {**scheduler.stats(), "queued_updates": update_ingestor.queue.depth(update_ingestor.shard)},
+        "worker": {"id": WORKER_ID, "count": WORKER_COUNT},
+        "response_cache": {
+            "hits": sum(cache.hits for _, cache in response_caches.items()),
+            "misses": sum(cache.misses for _, cache in response_caches.items()),
+        },
+        "calendar_prefetch": prefetcher.stats(),
+    }
+
+REGISTRY.gauge("astra_pending_messages", "Messages waiting for a turn.", lambda: scheduler.pending_count())
+REGISTRY.gauge("astra_in_flight_turns", "Turns currently running.", lambda: scheduler.stats()["in_flight_turns"])
+REGISTRY.gauge("astra_queued_updates", "Webhook updates persisted but not yet processed.", lambda: update_ingestor.queue.depth(update_ingestor.shard))
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics in the text exposition format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4") 
\ No newline at end of file
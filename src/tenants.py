@@ -0,0 +1,73 @@
+# This file contains multi-tenancy. Several Telegram users can share one
+# deployment: each allowed chat has its own Google credentials and its own
+# calendar, mail and briefing stores. The tenant of the current turn or
+# background task is kept in a context variable, so tools and Google worker
+# threads pick the right stores without passing the chat id around.
+
+import os
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Generic, Iterator, List, Optional, Tuple, TypeVar
+
+# The original single user. Their files keep their single-user paths (token.json, calendar.db, ...).
+OWNER_CHAT_ID = os.getenv("YOUR_CHAT_ID", "")
+# Comma-separated chat ids allowed to use the bot; defaults to YOUR_CHAT_ID alone.
+ALLOWED_CHAT_IDS: List[str] = [
+    chat_id.strip() for chat_id in (os.getenv("ALLOWED_CHAT_IDS") or OWNER_CHAT_ID).split(",") if chat_id.strip()
+]
+# Where the other users' credentials and stores live, one directory per chat id.
+TENANT_DATA_DIR = os.getenv("TENANT_DATA_DIR", "tenants")
+
+T = TypeVar("T")
+
+_tenant: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("astra_tenant", default=None)
+
+
+def is_allowed(chat_id) -> bool:
+    return str(chat_id) in ALLOWED_CHAT_IDS
+
+
+def current_tenant() -> str:
+    """The chat id whose data the current turn or task works on."""
+    return _tenant.get() or OWNER_CHAT_ID
+
+
+@contextmanager
+def tenant(chat_id) -> Iterator[str]:
+    """Runs this context, and tasks and threads started from it, on behalf of `chat_id`."""
+    token = _tenant.set(str(chat_id))
+    try:
+        yield str(chat_id)
+    finally:
+        _tenant.reset(token)
+
+
+def tenant_path(default: str, chat_id: Optional[str] = None) -> str:
+    """Where a tenant keeps the file that a single-user setup keeps at `default`."""
+    chat_id = str(chat_id or current_tenant())
+    if not chat_id or chat_id == OWNER_CHAT_ID:
+        return default
+    directory = os.path.join(TENANT_DATA_DIR, chat_id)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, os.path.basename(default))
+
+
+class PerTenant(Generic[T]):
+    """One instance of `create(chat_id)` per tenant, created on first use."""
+
+    def __init__(self, create: Callable[[str], T]):
+        self._create = create
+        self._instances: Dict[str, T] = {}
+        self._lock = threading.Lock()
+
+    def get(self, chat_id: Optional[str] = None) -> T:
+        chat_id = str(chat_id or current_tenant())
+        with self._lock:
+            if chat_id not in self._instances:
+                self._instances[chat_id] = self._create(chat_id)
+            return self._instances[chat_id]
+
+    def items(self) -> List[Tuple[str, T]]:
+        with self._lock:
+            return list(self._instances.items())
@@ -1,75 +1,71 @@
 # This file will contain the tool definitions for the agent,
 # such as tools for Google Calendar, Gmail, etc.
 
-import os
-import datetime
 import json
+import time
+import asyncio
+from typing import Optional
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-
-# If modifying these scopes, delete the file token.json.
-SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
-CREDENTIALS_FILE = os.getenv("GOOGLE_CREDENTIALS_PATH", "credentials.json")
-
-def get_credentials():
-    """Gets the user's credentials from a file.
-    If credentials are not available or are invalid, it will initiate the
-    OAuth 2.0 flow.
+
+from src.calendar import (
+    CalendarFanout,
+    WorkingHours,
+    compute_availability,
+    format_availability,
+    get_calendar_store,
+    to_timestamp,
+)
+from src.gmail import format_message, format_messages, get_gmail_store
+from src.google_clients import get_credentials, get_google_clients
+from src.prefetch import get_prefetcher
+from src.resilience import BackendUnavailable
+from src.tenants import PerTenant
+
+async def sync_calendar() -> bool:
+    """Pulls the latest changes of all the user's calendars into the local event store.
+
+    Returns True if the store was synced, False if credentials are unavailable
+    or the Calendar API call failed.
     """
-    creds = None
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-            except Exception as e:
-                print(f"Failed to refresh credentials: {e}")
-                return None
-        else:
-            try:
-                # This will start a web server to handle the OAuth flow.
-                print("=" * 60)
-                print("GOOGLE CALENDAR AUTHENTICATION REQUIRED")
-                print("=" * 60)
-                print("Starting OAuth flow...")
-                print("A browser window should open automatically.")
-                print("If it doesn't, copy and paste the URL that appears below.")
-                print("=" * 60)
-                
-                flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
-                creds = flow.run_local_server(port=8080, open_browser=True)
-                
-                print("Authentication successful!")
-                print("=" * 60)
-            except Exception as e:
-                print(f"OAuth flow failed: {e}")
-                print("Please ensure:")
-                print("1. credentials.json is in the project root")
-                print("2. You have internet access")
-                print("3. Port 8080 is available")
-                return None
-        
-        # Save the credentials for the next run
-        try:
-            with open("token.json", "w") as token:
-                token.write(creds.to_json())
-            print("Credentials saved to token.json")
-        except Exception as e:
-            print(f"Failed to save credentials: {e}")
-            return None
-    
-    return creds
+    clients = get_google_clients()
+    # Check if we're in test mode (no credentials setup)
+    if not clients.available():
+        return False
+
+    try:
+        service = await clients.run(clients.service, "calendar", "v3")
+        if service is None:
+            return False
+        store = get_calendar_store()
+        calendar_ids = list(await get_calendar_fanout().calendars(service))
+        results = await asyncio.gather(
+            *(clients.run(store.sync, service, calendar_id, clients.execute_blocking) for calendar_id in calendar_ids),
+            return_exceptions=True,
+        )
+        failed = [(c, r) for c, r in zip(calendar_ids, results) if isinstance(r, Exception)]
+        for calendar_id, error in failed:
+            print(f"Sync of calendar {calendar_id} failed: {error}")
+        store.forget_calendars(calendar_ids)
+        return not calendar_ids or len(failed) < len(calendar_ids)
+    except BackendUnavailable as e:
+        # Callers keep answering from the local store.
+        print(f"Calendar sync skipped: {e}")
+        return False
+    except Exception as e:
+        print(f"Calendar sync failed: {e}")
+        return False
+
+async def refresh_calendar() -> bool:
+    """Syncs the local event store if its last sync is stale."""
+    if get_calendar_store().is_stale():
+        return await sync_calendar()
+    return True
 
 @tool
-def list_calendar_events(max_results: int = 10) -> str:
+async def list_calendar_events(
+    config: RunnableConfig, max_results: int = 10, time_min: Optional[str] = None, time_max: Optional[str] = None
+) -> str:
     """
     Lists upcoming events from the user's Google Calendar.
     
@@ -77,62 +73,267 @@ def list_calendar_events(max_results: int = 10) -> str:
     - Their calendar, schedule, or appointments
     - What's happening today, tomorrow, this week
     - Upcoming meetings or events
-    - Their availability
+    
+    For free time, availability or double bookings use check_availability.
     
     Args:
         max_results: Maximum number of events to return (default: 10)
+        time_min: Optional ISO 8601 start of the window to list, e.g. "2025-06-17T00:00:00+02:00"
+        time_max: Optional ISO 8601 end of the window to list
     
     Returns:
-        A JSON string containing a list of upcoming calendar events.
+        A JSON string containing a list of calendar events, upcoming ones
+        unless a time window is given.
     """
-    
-    # Check if we're in test mode (no credentials setup)
-    if not os.path.exists("credentials.json"):
+    store = get_calendar_store()
+
+    # Answer from the local index. Reuse the speculative refresh started when
+    # the message arrived; otherwise only go to the API if the sync is stale.
+    thread_id = str(config.get("configurable", {}).get("thread_id", ""))
+    if not await get_prefetcher().claim(thread_id):
+        await refresh_calendar()
+    if store.last_synced() is None:
         return json.dumps([])
+
+    try:
+        if time_min or time_max:
+            start = to_timestamp(time_min) if time_min else time.time()
+            end = to_timestamp(time_max) if time_max else float("inf")
+            return json.dumps(store.between(start, end, calendar_id="primary")[:max_results])
+        print(f"Getting the upcoming {max_results} events")
+        return json.dumps(store.upcoming(max_results, calendar_id="primary"))
+    except Exception as e:
+        return json.dumps({"error": f"An error occurred while accessing your calendar: {str(e)}"})
+
+@tool
+async def check_availability(
+    config: RunnableConfig,
+    time_min: Optional[str] = None,
+    time_max: Optional[str] = None,
+    min_duration_minutes: int = 30,
+    working_hours_only: bool = True,
+) -> str:
+    """
+    Computes the user's free slots, how busy they are and any double bookings
+    in a time window, across all of their calendars.
     
-    creds = get_credentials()
-    if not creds:
-        return json.dumps([])
+    Use this tool when the user asks:
+    - When they are free, or whether they are free at some time
+    - To find time for a meeting of a given length
+    - How busy a day or week is
+    - Whether anything overlaps or is double-booked
+    
+    Args:
+        time_min: ISO 8601 start of the window, e.g. "2025-06-17T00:00:00+02:00" (default: now)
+        time_max: Optional ISO 8601 end of the window (default: 7 days after the start)
+        min_duration_minutes: Shortest free slot worth reporting (default: 30)
+        working_hours_only: Only consider the user's working hours (default: True)
     
+    Returns:
+        A few lines of text: the window, the busy percentage, the free slots
+        and the conflicting events.
+    """
+    store = get_calendar_store()
+
+    thread_id = str(config.get("configurable", {}).get("thread_id", ""))
+    if not await get_prefetcher().claim(thread_id):
+        await refresh_calendar()
+    if store.last_synced() is None:
+        return "Calendar unavailable."
+
     try:
-        service = build("calendar", "v3", credentials=creds)
+        start = to_timestamp(time_min) if time_min else time.time()
+        end = to_timestamp(time_max) if time_max else start + 7 * 24 * 3600
+        hours = WorkingHours.from_env()
+        result = compute_availability(
+            store.busy_index(), start, end, hours if working_hours_only else None, min_duration_minutes * 60
+        )
+        return format_availability(result, hours if working_hours_only else None, hours.tz)
+    except Exception as e:
+        return f"An error occurred while checking your availability: {str(e)}"
 
-        # Call the Calendar API
-        now = datetime.datetime.utcnow().isoformat() + "Z"  # 'Z' indicates UTC time
-        print(f"Getting the upcoming {max_results} events")
-        events_result = (
-            service.events()
-            .list(
-                calendarId="primary",
-                timeMin=now,
-                maxResults=max_results,
-                singleEvents=True,
-                orderBy="startTime",
+_fanouts: PerTenant[CalendarFanout] = PerTenant(lambda chat_id: CalendarFanout(get_google_clients(chat_id).execute))
+
+def get_calendar_fanout() -> CalendarFanout:
+    """Returns the current tenant's multi-calendar query helper."""
+    return _fanouts.get()
+
+@tool
+async def list_events_all_calendars(
+    time_min: Optional[str] = None, time_max: Optional[str] = None, max_results: int = 50
+) -> str:
+    """
+    Lists events across ALL of the user's Google calendars (work, personal,
+    shared and subscribed calendars), live from Google.
+    
+    Use this tool when the user asks about events that may not be on their
+    primary calendar, or about a specific date range across calendars.
+    
+    Args:
+        time_min: ISO 8601 start of the window, e.g. "2025-06-17T00:00:00+02:00" (default: now)
+        time_max: Optional ISO 8601 end of the window
+        max_results: Maximum number of events to return (default: 50)
+    
+    Returns:
+        A JSON string containing a list of events ordered by start time, each
+        tagged with the name of its calendar.
+    """
+    clients = get_google_clients()
+    # Check if we're in test mode (no credentials setup)
+    if not clients.available():
+        return json.dumps([])
+
+    try:
+        service = await clients.run(clients.service, "calendar", "v3")
+        if service is None:
+            return json.dumps([])
+        events, failed = await get_calendar_fanout().list_events(service, time_min, time_max, max_results)
+        if failed:
+            # Partial results must not look complete.
+            return json.dumps(
+                {"note": f"Could not read these calendars: {', '.join(failed)}.", "events": events}
             )
-            .execute()
+        return json.dumps(events)
+    except Exception as e:
+        # Google is slow or down: answer from the local copy of all calendars if there is one.
+        store = get_calendar_store()
+        last_synced = store.last_synced()
+        if last_synced is None:
+            return json.dumps({"error": f"An error occurred while accessing your calendars: {str(e)}"})
+        start = to_timestamp(time_min) if time_min else time.time()
+        end = to_timestamp(time_max) if time_max else float("inf")
+        return json.dumps(
+            {
+                "note": f"Google Calendar is unavailable; these events are from the local copy synced "
+                f"{int((time.time() - last_synced) // 60)} minutes ago.",
+                "events": store.between(start, end)[:max_results],
+            }
         )
-        events = events_result.get("items", [])
 
-        if not events:
-            return json.dumps([])
+async def sync_gmail() -> bool:
+    """Pulls the latest mailbox changes into the local Gmail mirror.
 
-        # Format the events into a list of dictionaries
-        event_list = []
-        for event in events:
-            start_str = event["start"].get("dateTime", event["start"].get("date"))
-            end_str = event["end"].get("dateTime", event["end"].get("date"))
-            is_all_day = "T" not in start_str
-
-            event_list.append({
-                "summary": event.get("summary", "No Title"),
-                "start": start_str,
-                "end": end_str,
-                "is_all_day": is_all_day
-            })
-        
-        return json.dumps(event_list)
+    Returns True if the mirror was synced, False if credentials are unavailable
+    or the Gmail API call failed.
+    """
+    clients = get_google_clients()
+    # Check if we're in test mode (no credentials setup)
+    if not clients.available():
+        return False
 
+    try:
+        service = await clients.run(clients.service, "gmail", "v1")
+        if service is None:
+            return False
+        await clients.run(get_gmail_store().sync, service, clients.execute_blocking)
+        return True
+    except BackendUnavailable as e:
+        print(f"Gmail sync skipped: {e}")
+        return False
     except Exception as e:
-        return json.dumps({"error": f"An error occurred while accessing your calendar: {str(e)}"})
+        print(f"Gmail sync failed: {e}")
+        return False
+
+async def refresh_gmail() -> bool:
+    """Syncs the local Gmail mirror if its last sync is stale."""
+    if get_gmail_store().is_stale():
+        return await sync_gmail()
+    return True
+
+@tool
+async def search_emails(
+    query: str = "", max_results: int = 10, unread_only: bool = False, newer_than_days: Optional[int] = None
+) -> str:
+    """
+    Searches the user's recent email (sender, recipients, subject and preview).
+    
+    Use this tool when the user asks about:
+    - Emails from someone or about something
+    - Their unread or recent mail
+    
+    Args:
+        query: Words that must all appear, e.g. "invoice acme" (default: any email)
+        max_results: Maximum number of emails to return (default: 10)
+        unread_only: Only return unread emails (default: False)
+        newer_than_days: Only return emails from the last N days
+    
+    Returns:
+        One email per line: id | date | sender | subject | [unread |] preview.
+        Pass an id to read_email for the full message.
+    """
+    await refresh_gmail()
+    store = get_gmail_store()
+    if store.last_synced() is None:
+        return "Email unavailable."
+
+    since = time.time() - newer_than_days * 86400 if newer_than_days else None
+    try:
+        return format_messages(store.search(query, max_results, unread_only, since))
+    except Exception as e:
+        return f"An error occurred while searching your email: {str(e)}"
+
+@tool
+async def read_email(message_id: str) -> str:
+    """
+    Reads one email in full: headers and body.
+    
+    Args:
+        message_id: The id of the email, as returned by search_emails or summarize_inbox
+    
+    Returns:
+        The email's sender, recipients, date, subject and body.
+    """
+    store = get_gmail_store()
+    message = store.get(message_id)
+    if message is None:
+        return f"No email with id {message_id}."
+
+    # The body is downloaded on first read and served locally afterwards.
+    if message["body"] is None:
+        clients = get_google_clients()
+        try:
+            service = await clients.run(clients.service, "gmail", "v1")
+            if service is not None:
+                message["body"] = await clients.run(store.fetch_body, service, message_id, clients.execute_blocking)
+        except Exception as e:
+            print(f"Failed to download email {message_id}: {e}")
+    return format_message(message)
+
+@tool
+async def summarize_inbox(days: int = 1, max_results: int = 20) -> str:
+    """
+    Gives an overview of the user's recent email, for requests such as
+    "anything important in my inbox?" or "summarize today's mail".
+    
+    Args:
+        days: How many days back to look (default: 1)
+        max_results: Maximum number of emails to list (default: 20)
+    
+    Returns:
+        The number of emails and unread emails, the most frequent senders and
+        one line per email (id | date | sender | subject | [unread |] preview),
+        unread emails first.
+    """
+    await refresh_gmail()
+    store = get_gmail_store()
+    if store.last_synced() is None:
+        return "Email unavailable."
+
+    try:
+        since = time.time() - days * 86400
+        messages = store.search("", max(max_results, 500), since=since)
+        unread = [m for m in messages if m["unread"]]
+        senders: dict = {}
+        for m in messages:
+            senders[m["from"]] = senders.get(m["from"], 0) + 1
+        top = sorted(senders.items(), key=lambda item: -item[1])[:5]
+        header = [
+            f"{len(messages)} emails in the last {days} day{'s' if days != 1 else ''}, {len(unread)} unread",
+            "Top senders: " + ", ".join(f"{sender} ({count})" for sender, count in top),
+        ]
+        listed = (unread + [m for m in messages if not m["unread"]])[:max_results]
+        return "\n".join(header) + "\n" + format_messages(listed)
+    except Exception as e:
+        return f"An error occurred while summarizing your email: {str(e)}"
 
-# TODO: Implement tool functions for Gmail, etc. 
\ No newline at end of file
+# TODO: Implement tool functions for tasks, etc. 
\ No newline at end of file
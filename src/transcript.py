@@ -0,0 +1,166 @@
+# This file contains the transcript preparation used by the agent node. It
+# turns the checkpointed message history into the LangChain messages sent to
+# the LLM, memoized per thread so each turn only prepares the new messages.
+# Tool results are sent compactly: calendar event lists become a small table,
+# and repeated or superseded results become short back-references.
+
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from src.prompts import SecretaryPrompts
+from src.state import normalize_messages
+
+# Tools whose JSON event lists are rewritten into the compact event table.
+CALENDAR_EVENT_TOOLS = {"list_calendar_events", "list_events_all_calendars"}
+
+# Maximum number of conversation threads whose prepared transcript is kept in memory.
+TRANSCRIPT_CACHE_THREADS = int(os.getenv("TRANSCRIPT_CACHE_THREADS", "256"))
+
+
+def _fingerprint(m: BaseMessage) -> Tuple:
+    """Identifies a message without relying on object identity, which does not
+    survive a round trip through the checkpointer."""
+    text = m.content if isinstance(m.content, str) else str(m.content)
+    return (m.type, m.id, getattr(m, "tool_call_id", None), len(text), text[:32])
+
+
+def _has_text(content: Any) -> bool:
+    return bool(content) and bool(str(content).strip())
+
+
+@dataclass
+class _PreparedThread:
+    # One entry per source message; None for messages that are not sent to the LLM.
+    prepared: List[Optional[BaseMessage]] = field(default_factory=list)
+    # tool_call_id -> (tool name, canonical JSON of the arguments)
+    tool_calls: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+    result_count: int = 0
+    # Digest of a result's content -> (result number, position), for results not superseded.
+    results: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    # (tool name, arguments) -> (position, result number, digest) of the latest full result.
+    latest: Dict[Tuple[str, str], Tuple[int, int, str]] = field(default_factory=dict)
+    # Position of a back-reference -> (position it refers to, the full message).
+    backrefs: Dict[int, Tuple[int, BaseMessage]] = field(default_factory=dict)
+    last_fingerprint: Optional[Tuple] = None
+
+
+class TranscriptCache:
+    """
+    Caches the prepared LLM transcript of each conversation thread.
+
+    Messages are append-only, so when a thread's history still starts with the
+    messages prepared last time, only the new ones are processed. Source
+    messages are never mutated.
+    """
+
+    def __init__(self, max_threads: int = TRANSCRIPT_CACHE_THREADS):
+        self.max_threads = max_threads
+        self._threads: "OrderedDict[str, _PreparedThread]" = OrderedDict()
+
+    def prepare(self, thread_id: str, messages: List[Any], start: int = 0) -> List[BaseMessage]:
+        """Returns the prepared messages for `messages[start:]`."""
+        entry = self._threads.get(thread_id)
+        if entry is None or not self._is_prefix(entry, messages):
+            entry = _PreparedThread()
+        self._threads[thread_id] = entry
+        self._threads.move_to_end(thread_id)
+        while len(self._threads) > self.max_threads:
+            self._threads.popitem(last=False)
+
+        new = normalize_messages(messages[len(entry.prepared):])
+        for m in new:
+            entry.prepared.append(self._prepare_message(m, entry))
+        if new:
+            entry.last_fingerprint = _fingerprint(new[-1])
+
+        prepared = []
+        for position in range(start, len(entry.prepared)):
+            m = entry.prepared[position]
+            backref = entry.backrefs.get(position)
+            if backref is not None and backref[0] < start:
+                # The result it refers to was folded into the summary.
+                m = backref[1]
+            if m is not None:
+                prepared.append(m)
+        return prepared
+
+    @staticmethod
+    def _is_prefix(entry: _PreparedThread, messages: List[Any]) -> bool:
+        count = len(entry.prepared)
+        if count == 0:
+            return True
+        if len(messages) < count:
+            return False
+        last = normalize_messages([messages[count - 1]])[0]
+        return _fingerprint(last) == entry.last_fingerprint
+
+    @staticmethod
+    def _prepare_message(m: BaseMessage, entry: _PreparedThread) -> Optional[BaseMessage]:
+        if isinstance(m, AIMessage):
+            for tc in m.tool_calls:
+                entry.tool_calls[tc["id"]] = (tc["name"], json.dumps(tc.get("args", {}), sort_keys=True))
+            # Include if it has content OR tool calls
+            return m if _has_text(m.content) or m.tool_calls else None
+
+        if isinstance(m, ToolMessage):
+            if not m.tool_call_id:
+                return None
+            return TranscriptCache._prepare_tool_result(m, entry)
+
+        # For other message types: only include if they have content
+        return m if _has_text(m.content) else None
+
+    @staticmethod
+    def _prepare_tool_result(m: ToolMessage, entry: _PreparedThread) -> Optional[BaseMessage]:
+        name, args = entry.tool_calls.get(m.tool_call_id, ("", ""))
+        content = m.content
+        # Calendar event lists are sent as the compact event table.
+        if name in CALENDAR_EVENT_TOOLS:
+            try:
+                content = SecretaryPrompts.format_calendar_events(json.loads(m.content))
+            except (json.JSONDecodeError, TypeError, KeyError, ValueError):
+                # If content isn't a valid event list, just pass it along
+                pass
+        if not _has_text(content):
+            return None
+        content = content if isinstance(content, str) else json.dumps(content)
+
+        # The event table starts with an "as of" time, which is not part of the result.
+        body = content.split("\n", 1)[-1] if name in CALENDAR_EVENT_TOOLS else content
+        digest = hashlib.blake2b(f"{name}\0{body}".encode(), digest_size=16).hexdigest()
+        position = len(entry.prepared)
+        if digest in entry.results:
+            number, target = entry.results[digest]
+            entry.backrefs[position] = (target, m.model_copy(update={"content": content}))
+            return m.model_copy(update={"content": f"Same result as #{number}."})
+
+        entry.result_count += 1
+        number = entry.result_count
+        previous = entry.latest.get((name, args))
+        if previous is not None:
+            # An older result of the same call with other data is out of date.
+            old_position, old_number, old_digest = previous
+            entry.prepared[old_position] = entry.prepared[old_position].model_copy(
+                update={"content": f"#{old_number}: Superseded by #{number}."}
+            )
+            entry.results.pop(old_digest, None)
+            # Back-references to it would now lead to the newer data: spell them out.
+            for backref_position, (target, full) in list(entry.backrefs.items()):
+                if target == old_position:
+                    entry.prepared[backref_position] = full
+                    del entry.backrefs[backref_position]
+        entry.results[digest] = (number, position)
+        entry.latest[(name, args)] = (position, number, digest)
+        return m.model_copy(update={"content": f"#{number}: {content}"})
+
+    def clear(self, thread_id: Optional[str] = None) -> None:
+        if thread_id is None:
+            self._threads.clear()
+        else:
+            self._threads.pop(thread_id, None)